@@ -13,12 +13,20 @@
 # the License.
 
 """napalm-mos package."""
-import pkg_resources
 from napalm_mos.mos import MOSDriver
 
+# importlib.metadata is much faster to import than pkg_resources
 try:
-    __version__ = pkg_resources.get_distribution('napalm-mos').version
-except pkg_resources.DistributionNotFound:
+    from importlib.metadata import version as _version, PackageNotFoundError as _NotFound
+except ImportError:
+    from pkg_resources import get_distribution, DistributionNotFound as _NotFound
+
+    def _version(distribution):
+        return get_distribution(distribution).version
+
+try:
+    __version__ = _version('napalm-mos')
+except _NotFound:
     __version__ = "Not installed"
 
 __all__ = ["MOSDriver"]
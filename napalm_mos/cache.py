@@ -0,0 +1,115 @@
+"""Bounded caches used by the MOS driver."""
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Mapping holding at most maxsize entries, evicting the least recently used one."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def set(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+def memoize(func, maxsize=4096):
+    """
+    Wrap a function of one hashable argument with a thread safe LRUCache of its results.
+
+    The cache is exposed as the ``cache`` attribute of the returned function.
+    """
+    cache = LRUCache(maxsize)
+    lock = threading.Lock()
+    missing = object()
+
+    def memoized(arg):
+        with lock:
+            result = cache.get(arg, missing)
+        if result is missing:
+            result = func(arg)
+            with lock:
+                cache.set(arg, result)
+        return result
+
+    memoized.cache = cache
+    return memoized
+
+
+class ResponseCache(object):
+    """
+    Cache of run_commands output keyed on (command, encoding).
+
+    Every entry expires after a TTL, which defaults to ttl and can be set per command with
+    command_ttl; a TTL of 0 disables caching for that command. At most maxsize entries are
+    kept, least recently used ones are evicted first.
+    """
+
+    def __init__(self, maxsize=256, ttl=5.0, command_ttl=None, clock=time.time):
+        self.ttl = ttl
+        self.command_ttl = command_ttl or {}
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = LRUCache(maxsize)
+
+    def get(self, command, encoding):
+        """Return the cached output of command, or None if missing or expired."""
+        key = (command, encoding)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, output = entry
+            if expires > self._clock():
+                self.hits += 1
+                return output
+            self._entries.pop(key)
+        self.misses += 1
+        return None
+
+    def set(self, command, encoding, output):
+        ttl = self.command_ttl.get(command, self.ttl)
+        if ttl > 0:
+            self._entries.set((command, encoding), (self._clock() + ttl, output))
+
+    def invalidate(self):
+        """Drop every cached response, e.g. after the configuration changed."""
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'evictions': self._entries.evictions,
+        }
@@ -0,0 +1,213 @@
+"""
+Columnar tables of get_interfaces and get_interfaces_counters results.
+
+Every field is a typed array.array column, one row per device and port. Strings (device,
+port, description, ...) are interned in a StringPool and stored as integer codes, counters
+as unsigned 64-bit integers with MISSING_COUNTER for those the device doesn't have.
+
+    from napalm_mos.export import Table, open_column
+
+    table = Table.open('/var/lib/fleet/counters', 'interfaces_counters')
+    for result in collect(inventory, ['interfaces_counters'], ...):
+        table.add(result.hostname, result.results.get('interfaces_counters', {}))
+    table.append_to('/var/lib/fleet/counters')
+
+    rx_octets = open_column('/var/lib/fleet/counters', 'rx_octets')
+
+append_to adds the rows to one file of raw machine values per column, which open_column
+maps in memory, e.g. for numpy.frombuffer.
+"""
+
+from __future__ import unicode_literals
+
+import array
+import io
+import json
+import mmap
+import os
+
+from collections import OrderedDict
+
+
+# Typecode of the codes of interned strings
+STRING = 'I'
+
+# Typecode of the counters, unsigned 64-bit
+try:
+    array.array(str('Q'))
+    COUNTER = 'Q'
+except ValueError:
+    # Python 2 has no 'Q', its 'L' is 64-bit on 64-bit Linux and macOS
+    COUNTER = 'L'
+
+# Stored for counters the device doesn't have, which the getters report as -1
+MISSING_COUNTER = 2 ** 64 - 1
+
+_COUNTER_FIELDS = (
+    'tx_errors', 'rx_errors', 'tx_discards', 'rx_discards', 'tx_octets', 'rx_octets',
+    'tx_unicast_packets', 'rx_unicast_packets', 'tx_multicast_packets',
+    'rx_multicast_packets', 'tx_broadcast_packets', 'rx_broadcast_packets',
+)
+
+# Getter -> (field, kind) for every column, kind being 's' for an interned string or an
+# array typecode. The first two columns hold the device and the port.
+SCHEMAS = {
+    'interfaces': OrderedDict([
+        ('device', 's'),
+        ('interface', 's'),
+        ('is_up', 'b'),
+        ('is_enabled', 'b'),
+        ('description', 's'),
+        ('last_flapped', 'd'),
+        ('speed', 'd'),
+        ('mac_address', 's'),
+    ]),
+    'interfaces_counters': OrderedDict(
+        [('device', 's'), ('interface', 's')] + [(field, COUNTER) for field in _COUNTER_FIELDS]),
+}
+
+_SCHEMA_FILE = 'schema.json'
+_STRINGS_FILE = 'strings.jsonl'
+
+
+def _counter(value):
+    return MISSING_COUNTER if value < 0 else value
+
+
+class StringPool(object):
+    """Interns strings, giving each one a stable integer code."""
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self._codes = {}
+        for string in strings:
+            self.intern(string)
+        # Number of strings already written by append_to
+        self.saved = len(self.strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, string):
+        code = self._codes.get(string)
+        if code is None:
+            code = self._codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+    @classmethod
+    def load(cls, directory):
+        path = os.path.join(directory, _STRINGS_FILE)
+        if not os.path.exists(path):
+            return cls()
+        with io.open(path, encoding='utf-8') as f:
+            return cls(json.loads(line) for line in f)
+
+
+class Table(object):
+    """
+    Columns of the results of one getter.
+
+    :param getter: 'interfaces' or 'interfaces_counters'.
+    :param pool: StringPool to intern strings in, possibly shared with other tables.
+    """
+
+    def __init__(self, getter, pool=None):
+        if getter not in SCHEMAS:
+            raise ValueError("No columnar schema for {}".format(getter))
+        self.getter = getter
+        self.schema = SCHEMAS[getter]
+        self.pool = StringPool() if pool is None else pool
+        self.columns = OrderedDict((field, array.array(str(STRING if kind == 's' else kind)))
+                                   for field, kind in self.schema.items())
+
+    @classmethod
+    def open(cls, directory, getter):
+        """Return an empty table whose strings get the codes used in directory."""
+        return cls(getter, StringPool.load(directory))
+
+    def __len__(self):
+        return len(self.columns['device'])
+
+    def add(self, device, result):
+        """Append the rows of the result of get_<getter> on a device."""
+        intern = self.pool.intern
+        device_code = intern(device)
+        fields = list(self.schema.items())[2:]
+        self.columns['device'].extend([device_code] * len(result))
+        self.columns['interface'].extend(intern(port) for port in result)
+        for field, kind in fields:
+            column = self.columns[field]
+            if kind == 's':
+                column.extend(intern(values.get(field, '')) for values in result.values())
+            elif kind == COUNTER:
+                column.extend(_counter(values.get(field, -1)) for values in result.values())
+            else:
+                column.extend(values.get(field, -1) for values in result.values())
+
+    def strings(self, field):
+        """Return the values of a string column."""
+        strings = self.pool.strings
+        return [strings[code] for code in self.columns[field]]
+
+    def clear(self):
+        for field, column in self.columns.items():
+            del column[:]
+
+    def append_to(self, directory):
+        """
+        Append the rows to the column files in directory, then clear the table.
+
+        The table must have been created with Table.open on that directory, or share its
+        pool with one, so the string codes match the ones already written.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        schema_path = os.path.join(directory, _SCHEMA_FILE)
+        schema = dict((field, self.columns[field].typecode) for field in self.schema)
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                if json.load(f) != schema:
+                    raise ValueError("{} holds columns of another schema".format(directory))
+        else:
+            with open(schema_path, 'w') as f:
+                json.dump(schema, f, sort_keys=True)
+
+        # Strings first, so that no code written to a column is ever unknown
+        with io.open(os.path.join(directory, _STRINGS_FILE), 'a', encoding='utf-8') as f:
+            for string in self.pool.strings[self.pool.saved:]:
+                f.write(json.dumps(string) + '\n')
+        self.pool.saved = len(self.pool)
+
+        for field, column in self.columns.items():
+            with open(os.path.join(directory, field), 'ab') as f:
+                column.tofile(f)
+        self.clear()
+
+
+def open_column(directory, field):
+    """
+    Return a column written by Table.append_to, mapped in memory.
+
+    On Python 3 this is a read-only memoryview of the column's typecode, elsewhere or for
+    an empty column an array.array.
+    """
+    with open(os.path.join(directory, _SCHEMA_FILE)) as f:
+        typecode = str(json.load(f)[field])
+    path = os.path.join(directory, field)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0 or not hasattr(memoryview, 'cast'):
+            column = array.array(typecode)
+            data = f.read()
+            if hasattr(column, 'frombytes'):
+                column.frombytes(data)
+            else:
+                column.fromstring(data)
+            return column
+        # The mapping stays valid once the file is closed
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(typecode)
+
+
+def load_strings(directory):
+    """Return the interned strings of directory, indexed by their code."""
+    return StringPool.load(directory).strings
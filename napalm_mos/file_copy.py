@@ -1,16 +1,122 @@
 import hashlib
+import io
 import os
+import threading
+import time
 
-from netmiko import ConnectHandler
-from scp import SCPClient, SCPException
+from napalm_mos.cache import LRUCache
+from napalm_mos.metrics import timed
+
+# scp (and netmiko in _pooled_connection) pull in paramiko, they are only imported once a
+# FileCopy is created
+SCPClient = SCPException = None
+
+# md5 digests of local files keyed on (path, mtime, size), so that unchanged files are
+# only read once
+_local_digests = LRUCache(256)
+_local_digests_lock = threading.Lock()
+
+# SSH connections opened by FileCopy itself, keyed on (hostname, username), so that
+# transfers not tied to an open driver still share one login per device. Every connection
+# comes with the lock serializing the use of its shell from several threads.
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _pooled_connection(hostname, username, password):
+    """Return (connection, lock) for the device, logging in if needed."""
+    key = (hostname, username)
+    with _connections_lock:
+        ssh, lock = _connections.get(key, (None, None))
+        if ssh is None or not ssh.remote_conn.get_transport().is_active():
+            from netmiko import ConnectHandler
+            ssh = ConnectHandler(device_type='cisco_ios', ip=hostname,
+                                 username=username, password=password)
+            ssh.enable()
+            lock = lock or threading.RLock()
+            _connections[key] = (ssh, lock)
+        return ssh, lock
+
+
+def close_connections():
+    """Disconnect every SSH connection opened by FileCopy."""
+    with _connections_lock:
+        for ssh, lock in _connections.values():
+            with lock:
+                ssh.disconnect()
+        _connections.clear()
+
+
+def _import_scp():
+    global SCPClient, SCPException
+    if SCPClient is None:
+        from scp import SCPClient
+    if SCPException is None:
+        from scp import SCPException
 
 
 class FileTransferError(Exception):
     pass
 
 
+def _md5(fname, offset=0, length=None):
+    m = hashlib.md5()
+    with open(fname, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            buf = f.read(2**20 if remaining is None else min(2**20, remaining))
+            if not buf:
+                break
+            m.update(buf)
+            if remaining is not None:
+                remaining -= len(buf)
+    return m.hexdigest()
+
+
+def _same_md5(local_md5, remote_md5):
+    """Whether both files exist and have the same md5, a missing file's md5 being None."""
+    return local_md5 is not None and local_md5 == remote_md5
+
+
+class _Progress(object):
+    """Turns SCP progress into callback(bytes_done, bytes_total, bytes_per_second, eta)."""
+
+    def __init__(self, total, callback, done=0):
+        self.total = total
+        self.callback = callback
+        self.done = done
+        self._resumed = done
+        self._start = time.time()
+
+    def scp(self, filename, size, sent):
+        self.update(self.done + sent)
+        if sent == size:
+            self.done += size
+
+    def update(self, done):
+        if self.callback is None:
+            return
+        elapsed = time.time() - self._start
+        rate = (done - self._resumed) / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else None
+        self.callback(done, self.total, rate, eta)
+
+
 class FileCopy(object):
-    def __init__(self, driver, source_file, dest_file=None, direction='put', file_system=None):
+    """
+    Copy a file to or from a MOS device over SCP, verified with md5.
+
+    With delta=True, a put over an existing remote file only sends the blocks of
+    block_size bytes whose md5 differs, and patches them into the remote file in place.
+
+    put_file_chunked and get_file_chunked move large files as numbered chunks which are
+    kept until the whole file is reassembled, so an interrupted transfer resumes with the
+    first chunk whose md5 doesn't match.
+    """
+
+    def __init__(self, driver, source_file, dest_file=None, direction='put', file_system=None,
+                 delta=False, block_size=2**20):
         if direction not in ["put", "get"]:
             raise ValueError("Invalid direction {}".format(direction))
 
@@ -19,16 +125,33 @@ class FileCopy(object):
         self.dest_file = dest_file or os.path.basename(source_file)
         self.direction = direction
         self.file_system = file_system
-        self._ssh = ConnectHandler(device_type='cisco_ios', ip=driver.hostname,
-                                   username=driver.username, password=driver.password)
-        self._ssh.enable()
+        self.delta = delta
+        self.block_size = block_size
+        self._metrics = getattr(driver, 'metrics', None)
+        _import_scp()
+        if hasattr(driver, '_get_ssh'):
+            # Borrow the driver's session and the lock its own commands take, SCP runs on
+            # a new channel of its transport
+            self._ssh = driver._get_ssh()
+            self._ssh_lock = driver._ssh_lock
+        else:
+            self._ssh, self._ssh_lock = _pooled_connection(driver.hostname, driver.username,
+                                                           driver.password)
 
     def __enter__(self):
         self._connect()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._disconnect()
+        # The connection belongs to the driver or the pool, leave it open for reuse
+        pass
+
+    def _send_command(self, command):
+        with timed(self._metrics, 'ssh', command) as timer:
+            with self._ssh_lock:
+                output = self._ssh.send_command(command)
+            timer.bytes = len(output)
+        return output
 
     def get_file(self):
         self._transfer_wrapper("get")
@@ -36,75 +159,296 @@ class FileCopy(object):
     def put_file(self):
         self._transfer_wrapper("put")
 
+    def put_data(self, data):
+        """
+        Put bytes held in memory to dest_file in a single SCP transfer, checked with md5.
+
+        There is no space check before it, a full filesystem fails the transfer or leaves a
+        truncated file the md5 check catches.
+        """
+        if self.direction != "put":
+            raise FileTransferError("Direction/method mismatch")
+        try:
+            with timed(self._metrics, 'scp', 'put', len(data)), \
+                    SCPClient(self._ssh.remote_conn.get_transport()) as s:
+                s.putfo(io.BytesIO(data), self.dest_file)
+        except SCPException as e:
+            raise FileTransferError("Error transferring file: {}".format(e))
+        if not _same_md5(hashlib.md5(data).hexdigest(), self._remote_file_md5()):
+            raise FileTransferError("File transferred, but md5 does not match")
+
+    def put_file_chunked(self, chunk_size=8 * 2**20, progress=None):
+        """
+        Put the file in chunks of chunk_size bytes, resuming an interrupted transfer.
+
+        :param progress: callable receiving (bytes_done, bytes_total, bytes_per_second, eta),
+                         eta being None until a rate is known.
+        """
+        if self.direction != "put":
+            raise FileTransferError("Direction/method mismatch")
+        self._check_source()
+        remote_md5, remote_space = self._remote_status()
+        local_md5 = self._local_file_md5()
+        if _same_md5(local_md5, remote_md5):
+            return
+
+        size = self._local_file_size()
+        chunks = self._chunks(size, chunk_size)
+        remote_chunks = self._remote_chunk_md5s()
+        # Parts past the last chunk, left by a transfer of another size or chunk size,
+        # would end up in the file
+        stale = sorted(set(remote_chunks) -
+                       set(self._chunk_name(self.dest_file, i) for i, _, _, _ in chunks))
+        if stale:
+            self._send_command("bash rm -f {}".format(" ".join(stale)))
+        missing = [(i, offset, length) for i, offset, length, md5 in chunks
+                   if remote_chunks.get(self._chunk_name(self.dest_file, i)) != md5]
+        missing_size = sum(length for _, _, length in missing)
+        # The parts are only removed once they're joined, into a file of the same size
+        if missing_size + size >= remote_space:
+            raise FileTransferError("Insufficient space available on device")
+
+        tracker = _Progress(size, progress, size - missing_size)
+        tracker.update(tracker.done)
+        try:
+            with timed(self._metrics, 'scp', 'put', missing_size), \
+                    SCPClient(self._ssh.remote_conn.get_transport(), progress=tracker.scp) as s:
+                with open(self.source_file, 'rb') as f:
+                    for i, offset, length in missing:
+                        f.seek(offset)
+                        s.putfo(io.BytesIO(f.read(length)), self._chunk_name(self.dest_file, i))
+        except SCPException as e:
+            raise FileTransferError("Error transferring file: {}".format(e))
+
+        remote_chunks = self._remote_chunk_md5s()
+        bad = [i for i, _, _, md5 in chunks
+               if remote_chunks.get(self._chunk_name(self.dest_file, i)) != md5]
+        if bad:
+            raise FileTransferError("Chunks {} transferred, but md5 does not match".format(bad))
+        self._send_command("bash cat {0}.part* > {0} && rm -f {0}.part*".format(
+            self.dest_file))
+        if not _same_md5(local_md5, self._remote_file_md5()):
+            raise FileTransferError("File transferred, but md5 does not match")
+
+    def get_file_chunked(self, chunk_size=8 * 2**20, progress=None):
+        """
+        Get the file in chunks of chunk_size bytes, resuming an interrupted transfer.
+
+        Every chunk is cut out of the remote file into /tmp before being copied over.
+
+        :param progress: callable receiving (bytes_done, bytes_total, bytes_per_second, eta),
+                         eta being None until a rate is known.
+        """
+        if self.direction != "get":
+            raise FileTransferError("Direction/method mismatch")
+        remote_md5, size = self._remote_status()
+        if _same_md5(self._local_file_md5(), remote_md5):
+            return
+
+        remote_chunks = self._remote_block_md5s(self.source_file, chunk_size)
+        parts = [self._chunk_name(self.dest_file, i) for i in range(len(remote_chunks))]
+        missing = [i for i, md5 in enumerate(remote_chunks)
+                   if not os.path.isfile(parts[i]) or _md5(parts[i]) != md5]
+
+        tmp = '/tmp/{}.part'.format(os.path.basename(self.source_file))
+        missing_size = sum(min(chunk_size, size - i * chunk_size) for i in missing)
+        # The parts are only removed once they're joined, into a file of the same size
+        if missing_size + size >= self._local_space_available():
+            raise FileTransferError("Insufficient space available locally")
+        tracker = _Progress(size, progress, size - missing_size)
+        tracker.update(tracker.done)
+        try:
+            with timed(self._metrics, 'scp', 'get', missing_size), \
+                    SCPClient(self._ssh.remote_conn.get_transport(), progress=tracker.scp) as s:
+                for i in missing:
+                    self._send_command(
+                        "bash dd if={} of={} bs={} skip={} count=1 2>/dev/null".format(
+                            self.source_file, tmp, chunk_size, i))
+                    s.get(tmp, parts[i])
+                    if _md5(parts[i]) != remote_chunks[i]:
+                        raise FileTransferError(
+                            "Chunk {} transferred, but md5 does not match".format(i))
+        except SCPException as e:
+            raise FileTransferError("Error transferring file: {}".format(e))
+        finally:
+            self._send_command("bash rm -f {}".format(tmp))
+
+        with open(self.dest_file, 'wb') as dest:
+            for part in parts:
+                with open(part, 'rb') as f:
+                    dest.write(f.read())
+        for part in parts:
+            os.remove(part)
+        if not _same_md5(self._local_file_md5(), remote_md5):
+            raise FileTransferError("File transferred, but md5 does not match")
+
+    @staticmethod
+    def _chunk_name(fname, index):
+        return '{}.part{:05d}'.format(fname, index)
+
+    def _chunks(self, size, chunk_size):
+        """Return (index, offset, length, md5) for every chunk of the local source file."""
+        return [(i, offset, min(chunk_size, size - offset),
+                 _md5(self.source_file, offset, chunk_size))
+                for i, offset in enumerate(range(0, size, chunk_size))]
+
+    def _remote_chunk_md5s(self):
+        output = self._send_command(
+            "bash /usr/bin/md5sum {}.part* 2>/dev/null".format(self.dest_file))
+        return {fields[1]: fields[0] for fields in
+                (line.split() for line in output.splitlines()) if len(fields) == 2}
+
     def _transfer_wrapper(self, direction):
         if self.direction != direction:
             raise FileTransferError("Direction/method mismatch")
-        if not self._compare_md5():
-            self._verify_space_and_transfer()
+        self._check_source()
+        # One remote call gives the remote md5 and what's needed for the space check
+        remote_md5, remote_size = self._remote_status()
+        if _same_md5(self._local_file_md5(), remote_md5):
+            return
 
-        if not self._compare_md5():
+        if self.direction == "put" and self.delta and remote_md5:
+            self._delta_transfer(remote_size)
+        else:
+            self._verify_space_and_transfer(remote_size)
+
+        if self.direction == "get":
+            # The remote file didn't change, no need to ask for its md5 again
+            matches = _same_md5(self._local_file_md5(), remote_md5)
+        else:
+            matches = _same_md5(self._local_file_md5(), self._remote_file_md5())
+        if not matches:
             raise FileTransferError("File transferred, but md5 does not match")
 
-    def _verify_space_and_transfer(self):
-        if not self._verify_space_available():
+    def _check_source(self):
+        """Raise FileTransferError if the local file to put is missing."""
+        if self.direction == "put" and not os.path.isfile(self.source_file):
+            raise FileTransferError("Local file {} not found".format(self.source_file))
+
+    def _remote_status(self):
+        """
+        Return the md5 of the remote file (None if missing) along with either the space
+        available next to it (put) or its size (get). A missing file to get raises
+        FileTransferError.
+        """
+        if self.direction == "put":
+            fname = self.dest_file
+            path = os.path.dirname(self.dest_file) or '.'
+            size_command = "df -B1 {} | tail -n 1".format(path)
+        else:
+            fname = self.source_file
+            size_command = "wc -c < {}".format(fname)
+        output = self._send_command(
+            "bash /usr/bin/md5sum {} 2>/dev/null; echo napalm_size; {}".format(
+                fname, size_command))
+        md5_output, _, size_output = output.partition('napalm_size')
+        md5 = md5_output.split()[0] if md5_output.strip() else None
+        if self.direction == "get" and md5 is None:
+            raise FileTransferError("Remote file {} not found".format(fname))
+        try:
+            if self.direction == "put":
+                # Filesystem 1B-blocks Used Available Use% Mounted on
+                size = int(size_output.split()[-3])
+            else:
+                size = int(size_output.split()[0])
+        except (IndexError, ValueError):
+            raise FileTransferError("Unexpected output from {}: {}".format(
+                size_command, size_output.strip()))
+        return md5, size
+
+    def _verify_space_and_transfer(self, remote_size):
+        if self.direction == "put":
+            size = self._local_file_size()
+            enough_space = size < remote_size
+        else:
+            size = remote_size
+            enough_space = remote_size < self._local_space_available()
+        if not enough_space:
             raise FileTransferError("Insufficient space available on device")
         try:
-            with SCPClient(self._ssh.remote_conn.get_transport()) as s:
+            with timed(self._metrics, 'scp', self.direction, size), \
+                    SCPClient(self._ssh.remote_conn.get_transport()) as s:
                 getattr(s, self.direction)(self.source_file, self.dest_file)
         except SCPException as e:
             raise FileTransferError("Error transferring file: {}".format(e))
 
-    def _connect(self):
-        if not self._ssh.remote_conn.get_transport().is_active():
-            self._ssh.establish_connection()
-            self._ssh.enable()
+    def _remote_block_md5s(self, fname, block_size):
+        """Return the md5 of every block_size bytes block of a remote file."""
+        output = self._send_command(
+            "bash f={f}; n=$(( ($(stat -c %s $f) + {b} - 1) / {b} )); i=0; "
+            "while [ $i -lt $n ]; do "
+            "dd if=$f bs={b} skip=$i count=1 2>/dev/null | md5sum; i=$((i + 1)); "
+            "done".format(f=fname, b=block_size))
+        return [line.split()[0] for line in output.splitlines() if line.strip()]
+
+    def _delta_transfer(self, remote_space):
+        size = self._local_file_size()
+        blocks = (size + self.block_size - 1) // self.block_size
+        remote = self._remote_block_md5s(self.dest_file, self.block_size)
+        changed = [i for i in range(blocks)
+                   if i >= len(remote) or
+                   remote[i] != _md5(self.source_file, i * self.block_size, self.block_size)]
+
+        patch = io.BytesIO()
+        with open(self.source_file, 'rb') as f:
+            for i in changed:
+                f.seek(i * self.block_size)
+                patch.write(f.read(self.block_size))
+        if patch.tell() >= remote_space:
+            raise FileTransferError("Insufficient space available on device")
+        patch.seek(0)
+
+        patch_file = '{}.napalm_delta'.format(self.dest_file)
+        try:
+            with timed(self._metrics, 'scp', 'put', len(patch.getvalue())), \
+                    SCPClient(self._ssh.remote_conn.get_transport()) as s:
+                s.putfo(patch, patch_file)
+        except SCPException as e:
+            raise FileTransferError("Error transferring file: {}".format(e))
 
-    def _disconnect(self):
-        if self._ssh.remote_conn.get_transport().is_active():
-            self._ssh.disconnect()
+        # Write the n-th block of the patch over block changed[n], then cut the file
+        # to its new size
+        self._send_command(
+            "bash j=0; for i in {blocks}; do "
+            "dd if={patch} of={f} bs={b} skip=$j seek=$i count=1 conv=notrunc 2>/dev/null; "
+            "j=$((j + 1)); done; "
+            "dd if=/dev/null of={f} bs=1 seek={size} count=0 2>/dev/null; "
+            "rm -f {patch}".format(blocks=" ".join(str(i) for i in changed), patch=patch_file,
+                                   f=self.dest_file, b=self.block_size, size=size))
+
+    def _connect(self):
+        with self._ssh_lock:
+            if not self._ssh.remote_conn.get_transport().is_active():
+                self._ssh.establish_connection()
+                self._ssh.enable()
 
     def _local_file_size(self):
         return os.stat(self.source_file).st_size
 
-    def _remote_file_size(self):
-        return int(self._ssh.send_command("bash wc -c < {}".format(self.source_file)))
-
     def _local_file_md5(self):
         if self.direction == "put":
             fname = self.source_file
         else:
             fname = self.dest_file
         if os.path.isfile(fname):
-            m = hashlib.md5()
-            with open(fname, "rb") as f:
-                buf = f.read(2**20)
-                while buf:
-                    m.update(buf)
-                    buf = f.read(2**20)
-            return m.hexdigest()
+            st = os.stat(fname)
+            key = (os.path.abspath(fname), st.st_mtime, st.st_size)
+            with _local_digests_lock:
+                digest = _local_digests.get(key)
+            if digest is None:
+                digest = _md5(fname)
+                with _local_digests_lock:
+                    _local_digests.set(key, digest)
+            return digest
 
     def _remote_file_md5(self):
         if self.direction == "put":
             fname = self.dest_file
         else:
             fname = self.source_file
-        return self._ssh.send_command("bash /usr/bin/md5sum {}".format(fname)).split()[0]
-
-    def _compare_md5(self):
-        return self._local_file_md5() == self._remote_file_md5()
+        output = self._send_command("bash /usr/bin/md5sum {}".format(fname)).split()
+        return output[0] if output else None
 
     def _local_space_available(self):
-        ret = os.statvfs(os.path.dirname(self.dest_file))
+        ret = os.statvfs(os.path.dirname(os.path.abspath(self.dest_file)))
         return ret.f_bsize * ret.f_bavail
-
-    def _remote_space_available(self):
-        path = os.path.dirname(self.dest_file)
-        if path == '':
-            path = '.'
-        return int(self._ssh.send_command("bash df -B1 {}".format(path)).splitlines()[1].split()[3])
-
-    def _verify_space_available(self):
-        if self.direction == "put":
-            return self._local_file_size() < self._remote_space_available()
-        else:
-            return self._remote_file_size() < self._local_space_available()
@@ -0,0 +1,226 @@
+"""
+Run MOSDriver getters against many devices at once.
+
+    from napalm_mos.fleet import collect
+
+    for result in collect(['mm1', 'mm2'], ['facts', 'interfaces'],
+                          username='admin', password='secret'):
+        print(result.hostname, result.elapsed, result.errors or result.results)
+
+With optional_args={'metrics': True}, every result carries the driver's get_metrics()
+which napalm_mos.metrics.openmetrics renders for a scraper:
+
+    openmetrics({result.hostname: result.metrics for result in results})
+"""
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from collections import namedtuple
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from napalm_mos.mos import MOSDriver
+
+
+DeviceResult = namedtuple('DeviceResult', [
+    'hostname',  # as given in the inventory
+    'results',   # getter name -> getter result
+    'errors',    # stage ('open', a getter name, 'close' or 'deadline') -> error message
+    'timings',   # stage ('open', a getter name or 'get_many', 'close') -> seconds
+    'elapsed',   # seconds spent on the device in total
+    'metrics',   # driver.get_metrics() if the driver was created with metrics on, else {}
+])
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def run_bounded(func, items, max_workers=16, deadline=None, on_abandon=None):
+    """
+    Call func on every item with at most max_workers threads.
+
+    Yields (item, result, error, elapsed) tuples in the order the calls finish. error is the
+    exception func raised, or DeadlineExceeded if the call did not return within deadline
+    seconds. Such a call is abandoned: its thread is replaced, so the pool does not shrink,
+    and exits without taking more work once the call returns. on_abandon, if given, is
+    called with the item of every abandoned call.
+    """
+    items = list(items)
+    tasks = queue.Queue()
+    done = queue.Queue()
+    for index, item in enumerate(items):
+        tasks.put(index)
+    started = {}
+    abandoned = set()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                index = tasks.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                started[index] = time.time()
+            try:
+                done.put((index, func(items[index]), None))
+            except Exception as e:
+                done.put((index, None, e))
+            with lock:
+                if index in abandoned:
+                    return
+
+    def spawn():
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    for _ in range(min(max_workers, len(items))):
+        spawn()
+
+    pending = set(range(len(items)))
+    while pending:
+        try:
+            index, result, error = done.get(timeout=1 if deadline else None)
+        except queue.Empty:
+            index = None
+
+        if index in pending:
+            pending.discard(index)
+            with lock:
+                elapsed = time.time() - started[index]
+            yield items[index], result, error, elapsed
+
+        if deadline:
+            now = time.time()
+            with lock:
+                expired = [i for i in pending if i in started and now - started[i] > deadline]
+                abandoned.update(expired)
+            for index in expired:
+                pending.discard(index)
+                spawn()
+                if on_abandon is not None:
+                    on_abandon(items[index])
+                error = DeadlineExceeded('No result after {}s'.format(deadline))
+                yield items[index], None, error, now - started[index]
+
+
+def inventory_devices(inventory, **defaults):
+    """
+    Return the inventory as a list of device dicts, with the defaults filled in.
+
+    :param inventory: hostnames, or dicts with a 'hostname' key and other keys overriding
+                      the defaults.
+    """
+    devices = []
+    for device in inventory:
+        if not isinstance(device, dict):
+            device = {'hostname': device}
+        device = dict(device)
+        for key, value in defaults.items():
+            device.setdefault(key, value)
+        devices.append(device)
+    return devices
+
+
+def _close_abandoned(driver):
+    """Close the driver of an abandoned call in the background, closing may hang as well."""
+    def close():
+        try:
+            driver.close()
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=close)
+    thread.daemon = True
+    thread.start()
+
+
+def _collect_device(device, getters, driver_class, deadline, drivers):
+    start = time.time()
+    results, errors, timings = {}, {}, {}
+
+    optional_args = dict(device.get('optional_args') or {})
+    # Getters only need eAPI, don't pay for an SSH login
+    optional_args.setdefault('lazy_ssh', True)
+    timeout = device.get('timeout', 60)
+    if deadline:
+        timeout = min(timeout, deadline)
+    driver = driver_class(device['hostname'], device.get('username'), device.get('password'),
+                          timeout=timeout, optional_args=optional_args)
+    # Known to collect until the call returns, to be closed if it's abandoned
+    drivers[id(device)] = driver
+
+    def timed(stage, func, *args):
+        stage_start = time.time()
+        try:
+            return func(*args)
+        except Exception as e:
+            errors[stage] = '{}: {}'.format(type(e).__name__, e)
+        finally:
+            timings[stage] = time.time() - stage_start
+
+    timed('open', driver.open)
+    if 'open' not in errors:
+        batched = [g for g in getters if g in driver_class._GETTER_COMMANDS]
+        if batched:
+            results.update(timed('get_many', driver.get_many, batched) or {})
+            if 'get_many' in errors:
+                errors.update((getter, errors['get_many']) for getter in batched)
+        for getter in getters:
+            if getter in batched:
+                continue
+            if deadline and time.time() - start > deadline:
+                errors[getter] = 'Skipped, deadline exceeded'
+                continue
+            result = timed(getter, getattr(driver, 'get_{}'.format(getter)))
+            if getter not in errors:
+                results[getter] = result
+        timed('close', driver.close)
+
+    drivers.pop(id(device), None)
+    metrics = driver.get_metrics() if getattr(driver, 'metrics', None) is not None else {}
+    return DeviceResult(device['hostname'], results, errors, timings, time.time() - start,
+                        metrics)
+
+
+def collect(inventory, getters, username=None, password=None, optional_args=None,
+            max_workers=16, deadline=120, driver_class=MOSDriver):
+    """
+    Run getters against every device of the inventory, yielding results as they finish.
+
+    :param inventory: hostnames, or dicts with a 'hostname' key and optionally 'username',
+                      'password', 'timeout' and 'optional_args' overriding the defaults.
+    :param getters: getter names without the ``get_`` prefix. The ones get_many supports
+                    share a single batch of eAPI calls per device.
+    :param max_workers: number of devices polled at the same time.
+    :param deadline: seconds after which a device is reported as failed, None to wait forever.
+    :return: generator of DeviceResult, one per device.
+    """
+    devices = inventory_devices(inventory, username=username, password=password,
+                                optional_args=optional_args)
+
+    drivers = {}
+
+    def poll(device):
+        return _collect_device(device, getters, driver_class, deadline, drivers)
+
+    def abandon(device):
+        driver = drivers.pop(id(device), None)
+        if driver is not None:
+            _close_abandoned(driver)
+
+    for device, result, error, elapsed in run_bounded(poll, devices, max_workers, deadline,
+                                                      abandon):
+        if error is None:
+            yield result
+        else:
+            stage = 'deadline' if isinstance(error, DeadlineExceeded) else 'collect'
+            yield DeviceResult(device['hostname'], {}, {stage: str(error)}, {}, elapsed, {})
@@ -0,0 +1,235 @@
+"""
+Latency, volume and error counts of what the MOS driver sends to a device.
+
+Observations are grouped by kind ('eapi' round trips, 'ssh' commands, 'scp' transfers and
+'getter' calls), by name (the command, the transfer direction or the getter) and by the
+getter which was running at the time, so time spent on the device can be attributed.
+"""
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import json
+import re
+import threading
+import time
+
+from decorator import decorator
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label holding the name of an observation, per kind
+_NAME_LABELS = {
+    'eapi': 'command',
+    'ssh': 'command',
+    'scp': 'direction',
+    'getter': 'method',
+}
+
+# Commands whose text changes from one config session to the next, and the names they are
+# recorded under, so the number of series stays bounded
+_COMMAND_NAMES = (
+    (re.compile(r'^bash step\(\) .*', re.S), 'bash <commit pipeline>'),
+    (re.compile(r'^bash j=0; for i in .*', re.S), 'bash <delta patch>'),
+    (re.compile(r'^bash f=\S+; n=.*md5sum.*', re.S), 'bash <block md5s>'),
+    (re.compile(r'^bash dd if=\S+ of=\S+ bs=[0-9]+ skip=[0-9]+ count=1 2>/dev/null$'),
+     'bash <chunk read>'),
+    (re.compile(r'^\x00$'), '<keepalive>'),
+    (re.compile(r'napalm_[0-9]+'), 'napalm_<session>'),
+)
+
+
+class Metrics(object):
+    """Thread safe store of observations."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (kind, name, getter) -> [count, errors, seconds, bytes, bucket counts]
+        self._series = {}
+
+    def current_getter(self):
+        stack = getattr(self._local, 'getters', None)
+        return stack[-1] if stack else ''
+
+    def observe(self, kind, name, seconds, nbytes=0, error=False):
+        key = (kind, name, self.current_getter())
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0, 0, 0.0, 0, [0] * len(self.buckets)]
+            series[0] += 1
+            series[1] += error
+            series[2] += seconds
+            series[3] += nbytes
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[4][i] += 1
+                    break
+
+    def getter(self, name):
+        """Time a getter and attribute the observations made meanwhile to it."""
+        return _GetterTimer(self, name)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """
+        Return {kind: [series]}, every series being a dict with 'name', 'getter', 'count',
+        'errors', 'seconds', 'bytes' and 'buckets', the cumulative count of observations
+        per bucket upper bound.
+        """
+        with self._lock:
+            series = sorted((key, list(value)) for key, value in self._series.items())
+        result = {}
+        for (kind, name, getter), (count, errors, seconds, nbytes, buckets) in series:
+            cumulative, total = [], 0
+            for bound, n in zip(self.buckets, buckets):
+                total += n
+                cumulative.append((bound, total))
+            result.setdefault(kind, []).append({
+                'name': name,
+                'getter': getter,
+                'count': count,
+                'errors': errors,
+                'seconds': seconds,
+                'bytes': nbytes,
+                'buckets': cumulative,
+            })
+        return result
+
+
+class _Timer(object):
+
+    def __init__(self, metrics, kind, name, nbytes=0):
+        self.metrics = metrics
+        self.kind = kind
+        self.name = name
+        self.bytes = nbytes
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.metrics is not None:
+            self.metrics.observe(self.kind, self.name, time.time() - self.start, self.bytes,
+                                 error=exc_type is not None)
+
+
+class _GetterTimer(_Timer):
+
+    def __init__(self, metrics, name):
+        super(_GetterTimer, self).__init__(metrics, 'getter', name)
+
+    def __enter__(self):
+        local = self.metrics._local
+        if not hasattr(local, 'getters'):
+            local.getters = []
+        super(_GetterTimer, self).__enter__()
+        local.getters.append(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics._local.getters.pop()
+        super(_GetterTimer, self).__exit__(exc_type, exc_value, traceback)
+
+
+def command_name(command):
+    """Return the name a command is recorded under."""
+    for pattern, name in _COMMAND_NAMES:
+        command = pattern.sub(name, command)
+    return command
+
+
+def timed(metrics, kind, name, nbytes=0):
+    """
+    Context manager observing the time spent in its block, if metrics isn't None.
+
+    The bytes attribute of the object it returns can be set within the block. The names
+    of 'eapi' and 'ssh' observations go through command_name.
+    """
+    if metrics is not None and kind in ('eapi', 'ssh'):
+        name = command_name(name)
+    return _Timer(metrics, kind, name, nbytes)
+
+
+@decorator
+def instrumented(getter, self, *args, **kwargs):
+    """
+    Decorate a driver method so its calls are timed as a getter when metrics are on.
+
+    The decorated method keeps the signature of the original, NetworkDriver checks it.
+    """
+    if self.metrics is None:
+        return getter(self, *args, **kwargs)
+    with self.metrics.getter(getter.__name__):
+        return getter(self, *args, **kwargs)
+
+
+def response_size(output):
+    """Approximate size in bytes of a run_commands result."""
+    size = 0
+    for result in output:
+        if isinstance(result, dict) and list(result) == ['output']:
+            size += len(result['output'])
+        else:
+            size += len(json.dumps(result))
+    return size
+
+
+def _label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(key, _label_value(value))
+                          for key, value in sorted(labels.items())) + '}'
+
+
+def openmetrics(snapshots, prefix='napalm_mos'):
+    """
+    Render snapshots in the OpenMetrics text format.
+
+    :param snapshots: dict of device name -> Metrics.snapshot(), the device name being set
+                      as the 'device' label.
+    """
+    families = {}
+    for device, snapshot in sorted(snapshots.items()):
+        for kind, series_list in snapshot.items():
+            families.setdefault(kind, []).extend((device, s) for s in series_list)
+
+    lines = []
+    for kind, series_list in sorted(families.items()):
+        name_label = _NAME_LABELS.get(kind, 'name')
+        family = '{}_{}'.format(prefix, kind)
+
+        lines.append('# TYPE {}_seconds histogram'.format(family))
+        lines.append('# UNIT {}_seconds seconds'.format(family))
+        for device, s in series_list:
+            labels = {'device': device, name_label: s['name'], 'getter': s['getter']}
+            for bound, count in s['buckets']:
+                lines.append('{}_seconds_bucket{} {}'.format(
+                    family, _labels(le=repr(float(bound)), **labels), count))
+            lines.append('{}_seconds_bucket{} {}'.format(
+                family, _labels(le='+Inf', **labels), s['count']))
+            lines.append('{}_seconds_count{} {}'.format(family, _labels(**labels), s['count']))
+            lines.append('{}_seconds_sum{} {!r}'.format(family, _labels(**labels),
+                                                        s['seconds']))
+
+        for metric, field in (('errors', 'errors'), ('bytes', 'bytes')):
+            if metric == 'bytes' and kind == 'getter':
+                continue
+            lines.append('# TYPE {}_{} counter'.format(family, metric))
+            for device, s in series_list:
+                labels = {'device': device, name_label: s['name'], 'getter': s['getter']}
+                lines.append('{}_{}_total{} {}'.format(family, metric, _labels(**labels),
+                                                       s[field]))
+
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
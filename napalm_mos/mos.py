@@ -26,21 +26,21 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 # std libs
+import os
 import re
-import ast
+import time
+import socket
+import difflib
+import threading
 import pyeapi
 
+from collections import OrderedDict
 from datetime import timedelta, datetime
-from distutils.version import LooseVersion
-from tempfile import NamedTemporaryFile
-
-from netmiko import ConnectHandler
 
 from pyeapi.client import Node as EapiNode
 from pyeapi.eapilib import HttpsEapiConnection, HttpEapiConnection
 from pyeapi.eapilib import ConnectionError
 
-import napalm.base.helpers
 from napalm.base import NetworkDriver
 from napalm.base.utils import string_parsers, py23_compat
 from napalm.base.exceptions import (
@@ -49,12 +49,63 @@ from napalm.base.exceptions import (
     SessionLockedException
 )
 
+from napalm_mos.cache import ResponseCache, memoize
 from napalm_mos.file_copy import FileCopy
+from napalm_mos.metrics import Metrics, instrumented, openmetrics, response_size, timed
+from napalm_mos.sampling import CounterSampler, OpticsSampler
+from napalm_mos.transport import TRANSPORTS as KEEPALIVE_TRANSPORTS
 
 TRANSPORTS = {
     'https': HttpsEapiConnection,
     'http':  HttpEapiConnection,
 }
+# Persistent connections with gzip compression, see napalm_mos.transport
+TRANSPORTS.update(KEEPALIVE_TRANSPORTS)
+
+# Reads CPU and memory for get_environment, in the text batch as eAPI has no JSON output
+# for bash
+_PROC_COMMAND = 'bash timeout 5 cat /proc/stat /proc/meminfo'
+
+
+# netmiko, scp, distutils, tempfile and napalm.base.helpers are imported where they are
+# used, so that processes only running eAPI getters don't pay for importing them
+
+
+def _helper(name):
+    """Return a napalm.base.helpers function, importing the module on first call."""
+    def call(value):
+        from napalm.base import helpers
+        return getattr(helpers, name)(value)
+    return call
+
+
+# The same addresses show up in every ARP poll, normalizing them with netaddr is costly
+_normalize_mac = memoize(_helper('mac'))
+_normalize_ip = memoize(_helper('ip'))
+
+
+def _check_software_version(sw_version):
+    from distutils.version import LooseVersion
+    if LooseVersion(sw_version) < LooseVersion("0.14.1"):
+        raise NotImplementedError("MOS Software Version 0.14.1 or better required")
+
+
+def _iter_lines(text):
+    """Yield the lines of text without building a list of them."""
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
+def _parse_counter(value):
+    """Turn a counter like '68,966,711' into an int, -1 if it's missing."""
+    if value is None:
+        return -1
+    return int(value.replace(',', ''))
 
 
 class MOSDriver(NetworkDriver):
@@ -70,10 +121,76 @@ class MOSDriver(NetworkDriver):
                              \s+\S+\s+
                              (?P<interface>\S+)$""", re.VERBOSE | re.IGNORECASE)
     _RE_NTP_SERVERS = re.compile(r'^ntp server (?P<server>\S+)', re.MULTILINE)
+    # Created atomically by mkdir to hold the config session lock with fast_load
+    _LOCK_DIR = '/mnt/flash/napalm_lock'
+    # Takes _LOCK_DIR, or takes it over if its owner file, "<session> <owner> <time>", is
+    # older than the timeout. Moving the stale lock away first lets only one driver take
+    # it over. Prints napalm_locked and the owner file if the lock is held.
+    _LOCK_COMMAND = (
+        "bash d={lock}; f=$(dirname $d); now=$(date +%s); got=0; "
+        "if mkdir $d 2>/dev/null; then got=1; "
+        "else t=$(cut -d' ' -f3 $d/owner 2>/dev/null || stat -c %Y $d 2>/dev/null); "
+        "if [ $((now - ${{t:-$now}})) -gt {timeout} ] && mv $d $d.$$ 2>/dev/null && "
+        "mkdir $d 2>/dev/null; then got=1; "
+        "rm -f $f/$(cut -d' ' -f1 $d.$$/owner 2>/dev/null); rm -rf $d.$$; fi; fi; "
+        "if [ $got = 0 ]; then echo napalm_locked; cat $d/owner 2>/dev/null; "
+        "elif ls $f/napalm_[0-9]* >/dev/null 2>&1; then rmdir $d; echo napalm_locked; "
+        "else echo \"{session} {owner} $now\" > $d/owner; fi")
+
+    # Prints the md5sum of 'show <which>-config' as generated on the device, leaving out
+    # the comment header which holds the current time
+    _CONFIG_DIGEST_COMMAND = "bash /usr/bin/cli <(echo show {}-config) | grep -v '^!' | md5sum"
+
     _RE_SNMP_COMM = re.compile(r'''\s*Community\sname:\s+(?P<community>\S+)\n
                                       Community\saccess:\s+(?P<mode>\S+)
                                    (\nCommunity\ssource:\s+(?P<v4_acl>\S+))?''', re.VERBOSE)
 
+    _RE_LLDP_INTERFACE = re.compile(r'^\*\s(\S+)$')
+    _RE_LLDP_CAPABILITY = re.compile(r"'(\w+)': '([^']*)'")
+    _RE_LLDP_SUBTYPE = re.compile(r'\s*\([^)]*\)\s*')
+
+    # get_interfaces_counters fields and the 'show interfaces counters' keys holding them
+    _COUNTER_KEYS = (
+        ('tx_octets', 'txoctets'),
+        ('rx_octets', 'rxoctets'),
+        ('tx_unicast_packets', 'txucastpkts'),
+        ('rx_unicast_packets', 'rxucastpkts'),
+        ('tx_multicast_packets', 'txmcastpkts'),
+        ('rx_multicast_packets', 'rxmcastpkts'),
+        ('tx_broadcast_packets', 'txbcastpkts'),
+        ('rx_broadcast_packets', 'rxbcastpkts'),
+    )
+
+    # get_interfaces fields whose changes watch_interfaces reports
+    _WATCHED_FIELDS = ('is_up', 'is_enabled', 'speed', 'description')
+
+    # Commands needed by the getters which take no arguments, as (command, encoding)
+    # pairs in the order the matching _parse_* method expects their output.
+    # get_many uses this to share eAPI calls between getters.
+    _GETTER_COMMANDS = {
+        'facts': (('show version', 'json'),
+                  ('show interfaces status', 'json'),
+                  ('show hostname', 'text')),
+        'interfaces': (('show interfaces status', 'json'),
+                       ('show interfaces description', 'json')),
+        'lldp_neighbors': (('show lldp neighbor', 'json'),),
+        'interfaces_counters': (('show interfaces counters', 'json'),
+                                ('show interfaces counters errors', 'json')),
+        'environment': (('show environment all', 'json'),
+                        (_PROC_COMMAND, 'text')),
+        'lldp_neighbors_detail': (('show lldp neighbor  verbose', 'text'),),
+        'arp_table': (('show arp', 'text'),),
+        'ntp_servers': (('show running-config', 'text'),),
+        'ntp_stats': (('show ntp associations', 'text'),),
+        'snmp_information': (('show snmp chassis-id', 'text'),
+                             ('show snmp location', 'text'),
+                             ('show snmp contact', 'text'),
+                             ('show snmp community', 'text')),
+        'optics': (('show interfaces transceiver', 'json'),),
+        'config': (('show startup-config', 'text'),
+                   ('show running-config', 'text')),
+    }
+
     def __init__(self, hostname, username, password, timeout=60, optional_args=None):
         """Constructor."""
         self.device = None
@@ -84,20 +201,61 @@ class MOSDriver(NetworkDriver):
         self.config_session = None
         self._current_config = None
         self._replace_config = False
+        self._last_diff = None
+        self._candidate_config = None
+        # 'running'/'startup' -> (device side digest, config text)
+        self._config_snapshots = {}
         self._ssh = None
+        # Serializes the use of the SSH shell, shared with the FileCopy borrowing it
+        self._ssh_lock = threading.RLock()
+        # Seconds spent on each step of the last commit_config
+        self.commit_timings = OrderedDict()
+        # Device round trips of the last candidate load with fast_load
+        self.load_round_trips = 0
+        self._fast_lock = False
 
         if optional_args is None:
             optional_args = {}
 
         self.transport = optional_args.get('transport', 'https')
 
-        if self.transport == 'https':
+        if self.transport.startswith('https'):
             self.port = optional_args.get('port', 443)
         else:
             self.port = optional_args.get('port', 80)
 
         self.path = optional_args.get('path', '/command-api')
         self.enablepwd = optional_args.get('enable_password', '')
+        # Only connect over SSH once a config operation needs it
+        self.lazy_ssh = optional_args.get('lazy_ssh', False)
+        # Run commit_config as a single device-side script
+        self.commit_pipeline = optional_args.get('commit_pipeline', False)
+        # Compute compare_config locally instead of on the device
+        self.local_diff = optional_args.get('local_diff', False)
+        # Lock with one atomic command and stream the candidate from memory, see _load_fast
+        self.fast_load = optional_args.get('fast_load', False)
+        # Seconds after which a fast_load lock left by another driver is taken over
+        self.lock_timeout = optional_args.get('lock_timeout', 3600)
+        self._counter_sampler = CounterSampler(history=optional_args.get('counter_history', 10))
+        self._optics_sampler = OpticsSampler(
+            window=optional_args.get('optics_window', 10),
+            thresholds=optional_args.get('optics_drift_thresholds'))
+        # Output of the last show interfaces transceiver sampled, see _parse_optics
+        self._sampled_optics = None
+        # Set once the device refused a bash command, getters then leave theirs out
+        self._bash_refused = False
+        # CPU index -> (total jiffies, idle jiffies, %usage) of the previous get_environment
+        self._cpu_times = {}
+        # Latency and volume of eAPI, SSH and SCP operations, see get_metrics
+        self.metrics = Metrics() if optional_args.get('metrics', False) else None
+
+        self.response_cache = None
+        if optional_args.get('response_cache', False):
+            self.response_cache = ResponseCache(
+                maxsize=optional_args.get('response_cache_size', 256),
+                ttl=optional_args.get('response_cache_ttl', 5.0),
+                command_ttl=optional_args.get('response_cache_command_ttl'),
+            )
 
     def open(self):
         """Implementation of NAPALM method open."""
@@ -116,15 +274,11 @@ class MOSDriver(NetworkDriver):
             if self.device is None:
                 self.device = EapiNode(connection, enablepwd=self.enablepwd)
 
-            sw_version = self.device.run_commands(
+            sw_version = self._device_run_commands(
                     ['show version'])[0].get('softwareImageVersion', "0.0.0")
-            if LooseVersion(sw_version) < LooseVersion("0.14.1"):
-                raise NotImplementedError("MOS Software Version 0.14.1 or better required")
-            # This is to get around user mismatch in API/FileCopy
-            if self._ssh is None:
-                self._ssh = ConnectHandler(device_type='cisco_ios', ip=self.hostname,
-                                           username=self.username, password=self.password)
-                self._ssh.enable()
+            _check_software_version(sw_version)
+            if not self.lazy_ssh:
+                self._get_ssh()
         except ConnectionError as ce:
             raise ConnectionException(ce.message)
 
@@ -133,30 +287,156 @@ class MOSDriver(NetworkDriver):
         if self.config_session is not None:
             # Only doing this because discard_config is broke
             self.commit_config()
-        self._ssh.disconnect()
-        self._ssh = None
+        if self._ssh is not None:
+            self._ssh.disconnect()
+            self._ssh = None
+        if self.device is not None and hasattr(self.device.connection, 'close'):
+            # Keep-alive transports hold their connection open until told otherwise
+            self.device.connection.close()
+        # is_alive of a lazy driver goes by the eAPI node, open sets it up again
+        self.device = None
+
+    def _get_ssh(self):
+        """Return the SSH connection, establishing it first if needed."""
+        # This is to get around user mismatch in API/FileCopy
+        if self._ssh is None:
+            from netmiko import ConnectHandler
+            self._ssh = ConnectHandler(device_type='cisco_ios', ip=self.hostname,
+                                       username=self.username, password=self.password)
+            self._ssh.enable()
+        return self._ssh
+
+    def _send_command(self, command):
+        with timed(self.metrics, 'ssh', command) as timer:
+            with self._ssh_lock:
+                output = self._get_ssh().send_command(command)
+            timer.bytes = len(output)
+        return output
+
+    def _device_run_commands(self, commands, encoding='json'):
+        """Run commands in a single eAPI round trip."""
+        with timed(self.metrics, 'eapi', '; '.join(commands)) as timer:
+            output = self.device.run_commands(commands, encoding=encoding)
+            if self.metrics is not None:
+                timer.bytes = response_size(output)
+        return output
+
+    def get_metrics(self, openmetrics_format=False):
+        """
+        Return what was observed since the driver was created with optional_args 'metrics'.
+
+        :return: Metrics.snapshot() as a dict of kind ('eapi', 'ssh', 'scp' and 'getter')
+                 -> list of series, or, with openmetrics_format, the same in the
+                 OpenMetrics text format with the hostname as 'device' label.
+        """
+        snapshot = self.metrics.snapshot() if self.metrics is not None else {}
+        if openmetrics_format:
+            return openmetrics({self.hostname: snapshot})
+        return snapshot
 
     def is_alive(self):
         """If alive, send keep alive"""
         if self._ssh is None:
-            return {'is_alive': False}
-        elif self._ssh.remote_conn.transport.is_active():
-            self._ssh.send_command(chr(0))
+            # Don't log in over SSH just to check, a lazy driver is alive once eAPI is set up
+            return {'is_alive': self.lazy_ssh and self.device is not None}
+        elif self._get_ssh().remote_conn.transport.is_active():
+            self._send_command(chr(0))
             return {'is_alive': True}
         else:
             return {'is_alive': False}
 
+    def _run_commands(self, commands, encoding='json', cache=True):
+        """
+        Run commands on the device, answering from the response cache where possible.
+
+        With cache False the response cache is neither read nor filled.
+        """
+        if self.response_cache is None or not cache:
+            return self._device_run_commands(commands, encoding=encoding)
+
+        output = [self.response_cache.get(command, encoding) for command in commands]
+        missing = [command for command, result in zip(commands, output) if result is None]
+        if missing:
+            fetched = dict(zip(missing, self._device_run_commands(missing, encoding=encoding)))
+            for command, result in fetched.items():
+                self.response_cache.set(command, encoding, result)
+            output = [fetched[command] if result is None else result
+                      for command, result in zip(commands, output)]
+        return output
+
+    def _invalidate_cache(self):
+        if self.response_cache is not None:
+            self.response_cache.invalidate()
+
+    def _run_batched(self, commands, cache=True):
+        """Run (command, encoding) pairs with a single run_commands call per encoding.
+
+        Duplicate pairs are only sent once. Returns a dict mapping each pair to its output.
+        """
+        batches = OrderedDict()
+        for command, encoding in commands:
+            batch = batches.setdefault(encoding, [])
+            if command not in batch:
+                batch.append(command)
+
+        output = {}
+        for encoding, batch in batches.items():
+            result = self._run_commands(batch, encoding=encoding, cache=cache)
+            output.update(zip([(command, encoding) for command in batch], result))
+        return output
+
+    def _getter_commands(self, getter):
+        """Return the commands of a getter listed in _GETTER_COMMANDS."""
+        commands = self._GETTER_COMMANDS[getter]
+        if self._bash_refused:
+            commands = tuple(c for c in commands if not c[0].startswith('bash '))
+        return commands
+
+    def _run_getter(self, getter, cache=True):
+        """Run the commands of a getter listed in _GETTER_COMMANDS, return their output."""
+        commands = self._getter_commands(getter)
+        output = self._run_batched(commands, cache=cache)
+        return [output[command] for command in commands]
+
+    @instrumented
+    def get_many(self, getters):
+        """
+        Run several getters, sharing as few eAPI calls as possible between them.
+
+        The commands of all requested getters are collected, duplicates removed and sent in
+        one batch per encoding. Only getters which take no arguments are supported.
+
+        :param getters: list of getter names without the ``get_`` prefix, e.g.
+                        ``['facts', 'interfaces', 'interfaces_counters']``.
+        :return: dict mapping each getter name to what the matching ``get_*`` method returns.
+        """
+        unsupported = [g for g in getters if g not in self._GETTER_COMMANDS]
+        if unsupported:
+            raise ValueError("Unsupported getter(s): {}".format(", ".join(unsupported)))
+
+        commands = [c for getter in getters for c in self._getter_commands(getter)]
+        try:
+            output = self._run_batched(commands)
+        except pyeapi.eapilib.CommandError:
+            # A single failing command fails its whole batch, let every getter
+            # run on its own and deal with its errors the usual way.
+            return {getter: getattr(self, 'get_{}'.format(getter))() for getter in getters}
+
+        return {
+            getter: getattr(self, '_parse_{}'.format(getter))(
+                *[output[command] for command in self._getter_commands(getter)])
+            for getter in getters
+        }
+
+    @instrumented
     def get_facts(self):
         """Implementation of NAPALM method get_facts."""
-        commands_json = ['show version', 'show interfaces status']
-        commands_text = ['show hostname']
-        result_json = self.device.run_commands(commands_json, encoding='json')
-        result_text = self.device.run_commands(commands_text, encoding='text')
-
-        version = result_json[0]
-        hostname = result_text[0]['output'].splitlines()[0].split(" ")[-1]
-        fqdn = result_text[0]['output'].splitlines()[1].split(" ")[-1]
-        interfaces = result_json[1]['interfaces'].keys()
+        return self._parse_facts(*self._run_getter('facts'))
+
+    def _parse_facts(self, version, interfaces_status, show_hostname):
+        hostname = show_hostname['output'].splitlines()[0].split(" ")[-1]
+        fqdn = show_hostname['output'].splitlines()[1].split(" ")[-1]
+        interfaces = interfaces_status['interfaces'].keys()
         interfaces = string_parsers.sorted_nicely(interfaces)
 
         u_match = re.match(self._RE_UPTIME, version['uptime']).groupdict()
@@ -182,20 +462,73 @@ class MOSDriver(NetworkDriver):
             commands = ["copy running-config flash:{}".format(self.config_session),
                         "show running-config"]
             for command in commands:
-                self._ssh.send_command(command)
+                self._send_command(command)
         if [k for k in self._get_sessions() if k != self.config_session]:
-            self.device.run_commands(["delete flash:{}".format(self.config_session)])
+            self._device_run_commands(["delete flash:{}".format(self.config_session)])
             self.config_session = None
             raise SessionLockedException('Session already in use')
 
+    def _lock_fast(self):
+        """
+        Take the session lock with a single command, atomically creating _LOCK_DIR.
+
+        The lock is also refused while a session of a driver not using fast_load, i.e. a
+        napalm_* file on flash, exists. Those drivers see _LOCK_DIR as a session in turn.
+        A lock taken more than optional_args 'lock_timeout' (3600) seconds ago is taken
+        over, along with the removal of its session file.
+        """
+        if self._fast_lock:
+            return
+        session = "napalm_{}".format(datetime.now().microsecond)
+        owner = '{}@{}:{}'.format(self.username, socket.gethostname(), os.getpid())
+        output = self._send_command(self._LOCK_COMMAND.format(
+            lock=self._LOCK_DIR, timeout=int(self.lock_timeout), session=session,
+            owner=owner))
+        self.load_round_trips += 1
+        if 'napalm_locked' in output:
+            holder = output.split('napalm_locked', 1)[1].split()
+            if len(holder) == 3:
+                raise SessionLockedException('Session already in use by {} since {}'.format(
+                    holder[1], datetime.fromtimestamp(int(holder[2]))))
+            raise SessionLockedException('Session already in use')
+        self._fast_lock = True
+        self.config_session = session
+
+    def _load_fast(self, config):
+        """
+        Load the candidate in three round trips: the lock, one SCP transfer from memory and
+        the md5 check of what was transferred.
+
+        Unlike the regular path there is no copy of the running config, no flash listing,
+        no temporary file and no df call.
+        """
+        self.load_round_trips = 0
+        self._lock_fast()
+        with FileCopy(self, None, '/mnt/flash/{}'.format(self.config_session), 'put') as c:
+            c.put_data(config.encode('utf-8'))
+        self.load_round_trips += 2
+
+    def _unlock_command(self):
+        """Return the shell command removing the session file, and the lock if held."""
+        command = "rm -f /mnt/flash/{}".format(self.config_session)
+        if self._fast_lock:
+            command = "rm -rf /mnt/flash/{} {}".format(self.config_session, self._LOCK_DIR)
+        return command
+
     def _unlock(self):
         if self.config_session is not None:
-            self._ssh.send_command("bash rm -f /mnt/flash/{}".format(self.config_session))
-            self.config_session = None
-            self._replace_config = False
+            self._send_command("bash {}".format(self._unlock_command()))
+            self._end_session()
+
+    def _end_session(self):
+        self.config_session = None
+        self._fast_lock = False
+        self._replace_config = False
+        self._last_diff = None
+        self._candidate_config = None
 
     def _get_sessions(self):
-        return [l.split()[-1] for l in self.device.run_commands(
+        return [l.split()[-1] for l in self._device_run_commands(
             ["dir flash:"], encoding='text')[0]['output'].splitlines()
                 if "napalm_" in l.split()[-1]]
 
@@ -203,14 +536,24 @@ class MOSDriver(NetworkDriver):
         if filename and config:
             raise ValueError("Cannot simultaneously set filename and config")
 
+        self._invalidate_cache()
+        self._last_diff = None
+        if self.fast_load:
+            if filename is None:
+                config = self._candidate_text(config)
+            else:
+                with open(filename, 'rb') as f:
+                    config = f.read().decode('utf-8')
+            self._load_fast(config)
+            self._candidate_config = config
+            return
+
         self._lock()
         if filename is None:
+            from tempfile import NamedTemporaryFile
             with NamedTemporaryFile() as fd:
-                if isinstance(config, list):
-                    config.insert(0, "configure")
-                    config = "\n".join(config) + "\n"
-                else:
-                    config = "configure\n" + config + "\n"
+                config = self._candidate_text(config)
+                self._candidate_config = config
                 fd.write(config.encode('utf-8'))
                 fd.flush()
 
@@ -218,10 +561,19 @@ class MOSDriver(NetworkDriver):
                               'put') as c:
                     c.put_file()
         else:
+            with open(filename, 'rb') as f:
+                self._candidate_config = f.read().decode('utf-8')
             with FileCopy(self, filename, '/mnt/flash/{}'.format(self.config_session),
                           'put') as c:
                 c.put_file()
 
+    @staticmethod
+    def _candidate_text(config):
+        """Return the text of a candidate given as a string or a list of lines."""
+        if isinstance(config, list):
+            return "\n".join(["configure"] + config) + "\n"
+        return "configure\n" + config + "\n"
+
     def load_merge_candidate(self, filename=None, config=None):
         self._load_config(filename=filename, config=config, replace=False)
         self._replace_config = False
@@ -231,37 +583,216 @@ class MOSDriver(NetworkDriver):
         self._replace_config = True
 
     def compare_config(self):
+        if self.local_diff:
+            diff = self._compare_config_locally()
         # There's no good way to do this yet
-        if self._replace_config:
-            return self._ssh.send_command("diff running-config flash:{}".format(
+        elif self._replace_config:
+            diff = self._send_command("diff running-config flash:{}".format(
                 self.config_session))
         else:
-            return self._ssh.send_command("bash cat /mnt/flash/{}".format(self.config_session))
+            diff = self._send_command("bash cat /mnt/flash/{}".format(self.config_session))
+        self._last_diff = diff
+        return diff
+
+    def _config_digests(self, *which):
+        """Return the device side digests of the 'running' and/or 'startup' configs."""
+        commands = [self._CONFIG_DIGEST_COMMAND.format(w) for w in which]
+        return self._parse_config_digests(which, self._device_run_commands(commands,
+                                                                           encoding='text'))
+
+    @staticmethod
+    def _parse_config_digests(which, output):
+        return {w: o['output'].split()[0] for w, o in zip(which, output)}
+
+    def _config_snapshot(self, which):
+        """
+        Return the text of the running or startup config.
+
+        The last text fetched is kept along with the device side digest it had, and only
+        fetched again if the digest changed since.
+        """
+        snapshot = self._config_snapshots.get(which)
+        if snapshot is not None and self._config_digests(which)[which] == snapshot[0]:
+            return snapshot[1]
+
+        output = self._device_run_commands([self._CONFIG_DIGEST_COMMAND.format(which),
+                                           'show {}-config'.format(which)], encoding='text')
+        digest, text = output[0]['output'].split()[0], output[1]['output']
+        self._config_snapshots[which] = (digest, text)
+        return text
+
+    def _compare_config_locally(self):
+        if self._candidate_config is None:
+            return ''
+        running = self._config_snapshot('running').splitlines()
+        candidate = self._candidate_config.splitlines()
+        if self._replace_config:
+            if candidate and candidate[0].strip() == 'configure':
+                candidate = candidate[1:]
+            return '\n'.join(difflib.unified_diff(
+                self._strip_header(running), self._strip_header(candidate),
+                'running-config', 'candidate', lineterm=''))
+        return self._merge_preview(running, candidate)
+
+    @staticmethod
+    def _strip_header(lines):
+        """Drop the '! command:', '! time:' and other comment lines heading a config."""
+        for i, line in enumerate(lines):
+            if line.strip() and not line.startswith('!'):
+                return lines[i:]
+        return []
+
+    @staticmethod
+    def _config_lines(lines):
+        """Yield (section, line) for the config lines, section being None at top level."""
+        section = None
+        for line in lines:
+            if not line.strip() or line.strip().startswith('!'):
+                continue
+            if line[0].isspace():
+                yield section, line.strip()
+            else:
+                section = line.strip()
+                yield None, section
+
+    def _merge_preview(self, running, candidate):
+        """
+        List the lines a merge of candidate would add ('+') or remove ('-').
+
+        Lines already in the running config are left out, as are 'no' commands for lines
+        it doesn't have. 'no X' removes the lines starting with X, e.g. 'no description'
+        the 'description ...' line. This is a preview only, commit_config doesn't rely on
+        it.
+        """
+        running_lines = list(self._config_lines(running))
+        existing = set(running_lines)
+        preview = []
+        header = None
+        for section, line in self._config_lines(candidate):
+            if section is None and line in ('configure', 'end', 'exit'):
+                continue
+            if line.startswith('no '):
+                removed = [l for s, l in running_lines if s == section and
+                           (l == line[3:] or l.startswith(line[3:] + ' '))]
+                if not removed:
+                    continue
+                change = '\n'.join('- {}'.format(l) for l in removed)
+            elif (section, line) not in existing:
+                change = '+ {}'.format(line)
+            else:
+                continue
+            if section is not None:
+                if section != header:
+                    preview.append(section)
+                    header = section
+                change = '\n'.join('  {}'.format(c) for c in change.split('\n'))
+            else:
+                # Lines added below a new top level line need no extra header
+                header = line if change.startswith('+') else None
+            preview.append(change)
+        return '\n'.join(preview)
 
     def discard_config(self):
         if self.config_session is not None:
             self._unlock()
 
     def commit_config(self):
-        if self.config_session is not None:
-            commands = ["delete flash:rollback-0", "copy running-config flash:rollback-0"]
-            if self.compare_config():
+        if self.config_session is None:
+            return
+
+        self.commit_timings = OrderedDict()
+        diff = self._last_diff
+        if self.local_diff and not self._replace_config:
+            # The local merge preview is only for display, it can miss what a line
+            # changes: the candidate is always applied
+            diff = True
+        # Only the diff of a merge compared on the device, the candidate itself, doesn't
+        # depend on the running config, which may have changed since compare_config
+        elif diff is None or self._replace_config:
+            start = time.time()
+            diff = self.compare_config()
+            self.commit_timings['compare'] = time.time() - start
+
+        if self.commit_pipeline:
+            self._commit_pipelined(diff)
+        else:
+            commands = [('delete_rollback', "delete flash:rollback-0"),
+                        ('backup', "copy running-config flash:rollback-0")]
+            if diff:
                 if self._replace_config:
-                    commands.append("copy flash:{} running-config ".format(self.config_session))
+                    commands.append(('apply', "copy flash:{} running-config ".format(
+                        self.config_session)))
                 else:
-                    commands.append("bash /usr/bin/cli /mnt/flash/{}".format(self.config_session))
-            commands.append("copy running-config startup-config")
-            for command in commands:
-                self._ssh.send_command(command)
+                    commands.append(('apply', "bash /usr/bin/cli /mnt/flash/{}".format(
+                        self.config_session)))
+            commands.append(('save', "copy running-config startup-config"))
+            for step, command in commands:
+                start = time.time()
+                self._send_command(command)
+                self.commit_timings[step] = time.time() - start
+            start = time.time()
+            self._unlock()
+            self.commit_timings['unlock'] = time.time() - start
+        self._invalidate_cache()
+
+    def _commit_pipelined(self, diff):
+        """
+        Run the whole commit as one bash command, reporting how long each step took.
+
+        A failure past the backup restores the rollback checkpoint. The session is ended
+        and the lock released whether the commit succeeds or not.
+        """
+        session = self.config_session
+        cli = "/usr/bin/cli <(echo {})".format
+        steps = [('delete_rollback', "rm -f /mnt/flash/rollback-0"),
+                 ('backup', cli("copy running-config flash:rollback-0"))]
+        if diff:
+            if self._replace_config:
+                steps.append(('apply', cli("copy flash:{} running-config".format(session))))
+            else:
+                steps.append(('apply', "/usr/bin/cli /mnt/flash/{}".format(session)))
+        steps.append(('save', cli("copy running-config startup-config")))
+        steps.append(('unlock', self._unlock_command()))
+
+        # Every step prints "napalm_step <name> <exit status> <start> <end>", the
+        # script stops at the first failing one.
+        script = ('bash step() { s=$(date +%s.%N); "${@:2}" >/dev/null 2>&1; r=$?; '
+                  'echo "napalm_step $1 $r $s $(date +%s.%N)"; return $r; }; ')
+        script += " && ".join("step {} {}".format(name, command) for name, command in steps)
+
+        start = time.time()
+        output = self._send_command(script)
+        self.commit_timings['round_trip'] = time.time() - start
+
+        status = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) == 5 and fields[0] == 'napalm_step':
+                status[fields[1]] = int(fields[2])
+                self.commit_timings[fields[1]] = float(fields[4]) - float(fields[3])
+
+        failed = [name for name, _ in steps if status.get(name) != 0]
+        if failed:
+            if failed[0] in ('apply', 'save'):
+                # The candidate may be partly applied, go back to the checkpoint
+                self.rollback()
             self._unlock()
+            raise CommandErrorException(
+                "Commit failed at step {}: {}".format(failed[0], output))
+        self._end_session()
 
     def rollback(self):
         commands = ["copy flash:rollback-0 running-config",
                     "copy running-config startup-config"]
         for command in commands:
-            self._ssh.send_command(command)
+            self._send_command(command)
+        self._invalidate_cache()
 
+    @instrumented
     def get_interfaces(self):
+        return self._parse_interfaces(*self._run_getter('interfaces'))
+
+    def _parse_interfaces(self, interfaces_status, interfaces_description):
 
         def _parse_mm_speed(speed):
             """Parse the Metamako speed string from 'sh int status' into an Mbit/s int"""
@@ -280,16 +811,11 @@ class MOSDriver(NetworkDriver):
 
             return 0
 
-        commands = []
-        commands.append('show interfaces status')
-        commands.append('show interfaces description')
-        output = self.device.run_commands(commands, encoding='json')
-
-        descriptions = {d['Port']: d['Description'] for d in output[1]}
+        descriptions = {d['Port']: d['Description'] for d in interfaces_description}
 
         interfaces = {}
 
-        for interface, values in output[0]['interfaces'].items():
+        for interface, values in interfaces_status['interfaces'].items():
             interfaces[interface] = {}
 
             # A L1 device doesn't really have a line protocol.
@@ -313,11 +839,49 @@ class MOSDriver(NetworkDriver):
 
         return interfaces
 
+    def watch_interfaces(self, interval=10, count=None):
+        """
+        Poll the interfaces every interval seconds, yielding the ports which changed.
+
+        Between polls only a tuple of the _WATCHED_FIELDS values is kept per port. Polls
+        finding changes yield (timestamp, changes), changes mapping every changed port to a
+        dict of its watched fields, or to None if the port is gone. The first poll reports
+        every port. Polls always go to the device, never to the response cache.
+
+        :param interval: seconds between the start of two polls.
+        :param count: number of polls after which the generator ends, None to poll forever.
+        """
+        state = {}
+        polls = 0
+        while count is None or polls < count:
+            start = time.time()
+            interfaces = self._parse_interfaces(*self._run_getter('interfaces', cache=False))
+            changes = self._interface_changes(state, interfaces)
+            polls += 1
+            if changes:
+                yield start, changes
+            if count is None or polls < count:
+                time.sleep(max(0.0, interval - (time.time() - start)))
+
+    def _interface_changes(self, state, interfaces):
+        """Update state, port -> tuple of watched fields, and return what changed."""
+        fields = self._WATCHED_FIELDS
+        changes = {}
+        for port, values in interfaces.items():
+            current = tuple(values[field] for field in fields)
+            if state.get(port) != current:
+                state[port] = current
+                changes[port] = dict(zip(fields, current))
+        for port in [port for port in state if port not in interfaces]:
+            del state[port]
+            changes[port] = None
+        return changes
+
+    @instrumented
     def get_lldp_neighbors(self):
-        commands = []
-        commands.append('show lldp neighbor')
-        output = self.device.run_commands(commands, encoding='json')[0]
+        return self._parse_lldp_neighbors(*self._run_getter('lldp_neighbors'))
 
+    def _parse_lldp_neighbors(self, output):
         lldp = {}
 
         for n in output:
@@ -335,33 +899,61 @@ class MOSDriver(NetworkDriver):
 
         return lldp
 
+    @instrumented
     def get_interfaces_counters(self):
-        commands = ['show interfaces counters', 'show interfaces counters errors']
-        output = self.device.run_commands(commands, encoding='json')
+        return self._parse_interfaces_counters(*self._run_getter('interfaces_counters'))
+
+    def _parse_interfaces_counters(self, counters_output, errors_output):
         interface_counters = {}
-        errors_dict = output[1]['interfaces']
-        for interface, counters in output[0]['interfaces'].items():
-            interface_counters[interface] = {}
+        errors_dict = errors_output['interfaces']
+        for interface, counters in counters_output['interfaces'].items():
+            errors = errors_dict.get(interface, {})
+            interface_counters[interface] = {
+                field: _parse_counter(counters.get(key)) for field, key in self._COUNTER_KEYS
+            }
             interface_counters[interface].update(
-                tx_errors=int(errors_dict.get(interface, {}).get('tx', -1).replace(',', '')),
-                rx_errors=int(errors_dict.get(interface, {}).get('tx', -1).replace(',', '')),
+                tx_errors=_parse_counter(errors.get('tx')),
+                rx_errors=_parse_counter(errors.get('rx')),
                 tx_discards=-1,  # Metamako discards?
                 rx_discards=-1,
-                tx_octets=int(counters.get('txoctets', -1).replace(',', '')),
-                rx_octets=int(counters.get('rxoctets', -1).replace(',', '')),
-                tx_unicast_packets=int(counters.get('txucastpkts', -1).replace(',', '')),
-                rx_unicast_packets=int(counters.get('rxucastpkts', -1).replace(',', '')),
-                tx_multicast_packets=int(counters.get('txmcastpkts', -1).replace(',', '')),
-                rx_multicast_packets=int(counters.get('rxmcastpkts', -1).replace(',', '')),
-                tx_broadcast_packets=int(counters.get('txbcastpkts', -1).replace(',', '')),
-                rx_broadcast_packets=int(counters.get('rxbcastpkts', -1).replace(',', '')),
             )
         return interface_counters
 
+    @instrumented
+    def get_interfaces_rates(self, span=1):
+        """
+        Poll get_interfaces_counters and return per second rates derived from it.
+
+        The last samples of every port are kept between calls (optional_args
+        'counter_history', 10 by default), so rates are only returned from the second call
+        on. They are computed over the last `span` polling intervals.
+
+        :return: dict port -> {'tx_bps', 'rx_bps', 'tx_pps', 'rx_pps', 'tx_errors_ps',
+                 'rx_errors_ps', 'interval'}
+        """
+        # Cached counters would be sampled again under a new timestamp
+        self._counter_sampler.add(self._parse_interfaces_counters(
+            *self._run_getter('interfaces_counters', cache=False)))
+        return self._counter_sampler.rates(span)
+
+    @instrumented
     def get_environment(self):
+        try:
+            return self._parse_environment(*self._run_getter('environment'))
+        except pyeapi.eapilib.CommandError:
+            if self._bash_refused:
+                raise
+            output = self._run_commands(['show environment all'])[0]
+            try:
+                proc = self._run_commands([_PROC_COMMAND], encoding='text')[0]
+            except pyeapi.eapilib.CommandError:
+                # bash not allowed for this user, CPU and memory are reported as unknown
+                # and the bash command isn't sent anymore
+                self._bash_refused = True
+                proc = None
+            return self._parse_environment(output, proc)
 
-        commands = ['show environment all']
-        output = self.device.run_commands(commands, encoding='json')[0]
+    def _parse_environment(self, output, proc=None):
         environment_counters = {
             'fans': {},
             'temperature': {},
@@ -391,67 +983,124 @@ class MOSDriver(NetworkDriver):
                 'capacity': float(re.match(r'^([\d.]+)', psu_dict[psu]['capacity']).group()),
                 'output': float(re.match(r'^([\d.]+)', data['outputPower']).group())
             }
-        # CPU - No CLI command available. Need to be implemented in a different way
-        environment_counters['cpu'][0] = {
-            '%usage': float(-1)
-        }
+        # CPU and memory - not in any show command, read from /proc
+        if proc is None:
+            environment_counters['cpu'][0] = {'%usage': float(-1)}
+            environment_counters['memory'] = {'available_ram': -1, 'used_ram': -1}
+        else:
+            environment_counters['cpu'], environment_counters['memory'] = self._parse_proc(
+                proc['output'])
+        return environment_counters
 
-        # Memory - No CLI command available. Need to be implemented in a different way
-        environment_counters['memory'] = {
-            'available_ram': -1,
-            'used_ram': -1
+    def _parse_proc(self, text):
+        """
+        Return the CPU usage and memory dicts of get_environment from /proc/stat and
+        /proc/meminfo.
+
+        The usage of every CPU is computed from the jiffies spent since the previous call, or
+        since boot on the first one, so a single sample is needed per call.
+        """
+        cpu = {}
+        meminfo = {}
+        for line in _iter_lines(text):
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            if fields[0].startswith('cpu') and fields[0][3:].isdigit():
+                index = int(fields[0][3:])
+                # user nice system idle iowait irq softirq steal, guest time is in user
+                jiffies = [int(field) for field in fields[1:9]]
+                total = sum(jiffies)
+                idle = sum(jiffies[3:5])
+                previous = self._cpu_times.get(index)
+                if previous is None or total < previous[0]:
+                    previous = (0, 0, float(-1))
+                elapsed = total - previous[0]
+                if elapsed > 0:
+                    usage = round(100.0 * (elapsed - (idle - previous[1])) / elapsed, 2)
+                    self._cpu_times[index] = (total, idle, usage)
+                else:
+                    usage = previous[2]
+                cpu[index] = {'%usage': usage}
+            elif fields[0].endswith(':'):
+                meminfo[fields[0][:-1]] = int(fields[1])
+
+        if not cpu:
+            cpu[0] = {'%usage': float(-1)}
+        total = meminfo.get('MemTotal', -1)
+        available = meminfo.get('MemAvailable')
+        if available is None:
+            available = sum(meminfo.get(key, 0) for key in ('MemFree', 'Buffers', 'Cached'))
+        memory = {
+            'available_ram': total,
+            'used_ram': total - available if total != -1 else -1,
         }
-        return environment_counters
+        return cpu, memory
 
+    @instrumented
     def get_lldp_neighbors_detail(self, interface=''):
-
-        lldp_neighbors_out = {}
-
         commands = ['show lldp neighbor {} verbose'.format(interface)]
-        neighbors_str = self.device.run_commands(commands, encoding='text')[0]['output']
+        return self._parse_lldp_neighbors_detail(
+            self._run_commands(commands, encoding='text')[0])
 
-        interfaces_split = re.split(r'^\*\s(\S+)$', neighbors_str, flags=re.MULTILINE)[1:]
-        interface_list = zip(*(iter(interfaces_split),) * 2)
+    def _parse_lldp_neighbors_detail(self, output):
 
-        for interface, interface_str in interface_list:
-
-            lldp_neighbors_out[interface] = []
-            for neighbor_str in interface_str.strip().split('\n\n'):
-
-                info_dict = {}
-
-                for info_line in neighbor_str.strip().splitlines():
-                    try:
-                        key, value = info_line.split(':', 1)
-                    except ValueError:
-                        # Extremely long lines wrap
-                        info_dict[key.strip()] = "{} {}".format(info_dict[key.strip()], info_line)
-                    info_dict[key.strip()] = value.strip()
+        lldp_neighbors_out = {}
+        interface = neighbors = None
+        info_dict = {}
+        key = None
+
+        # One pass over the lines: '* <interface>' starts an interface, indented
+        # 'key: value' lines describe a neighbor, a blank line ends it and any other
+        # line is the wrapped continuation of the previous value
+        for line in output['output'].splitlines():
+            if not line.strip():
+                if info_dict:
+                    neighbors.append(self._lldp_neighbor_detail(interface, info_dict))
+                    info_dict = {}
+                key = None
+                continue
+
+            match = self._RE_LLDP_INTERFACE.match(line)
+            if match:
+                if info_dict:
+                    neighbors.append(self._lldp_neighbor_detail(interface, info_dict))
+                    info_dict = {}
+                key = None
+                interface = match.group(1)
+                neighbors = lldp_neighbors_out.setdefault(interface, [])
+                continue
+            if neighbors is None:
+                continue
+
+            if line[0].isspace():
+                name, sep, value = line.partition(':')
+                if sep:
+                    key = name.strip()
+                    info_dict[key] = value.strip()
+                    continue
+            if key is not None:
+                info_dict[key] = '{} {}'.format(info_dict[key], line.strip())
+
+        if info_dict:
+            neighbors.append(self._lldp_neighbor_detail(interface, info_dict))
 
-                # System capabilities
-                try:
-                    capabilities = ast.literal_eval(info_dict.get('system capability', '{}'))
-                except Exception:
-                    capabilities = {}
-                system_capab = capabilities.get('capabilities', '').replace(',', ', ')
-                enabled_capab = capabilities.get('enabled', '').replace(',', ', ')
-
-                tlv_dict = {
-                    'parent_interface': py23_compat.text_type(interface),
-                    'remote_port': re.sub(r'\s*\([^)]*\)\s*', '', info_dict.get('port id', '')),
-                    'remote_port_description': info_dict.get('port description', ''),
-                    'remote_chassis_id': re.sub(r'\s*\([^)]*\)\s*',
-                                                '',
-                                                info_dict.get('chassis id', '')),
-                    'remote_system_name': info_dict.get('system name', ''),
-                    'remote_system_description': info_dict.get('system description', ''),
-                    'remote_system_capab': system_capab,
-                    'remote_system_enable_capab': enabled_capab
-                }
+        return lldp_neighbors_out
 
-                lldp_neighbors_out[interface].append(tlv_dict)
+    def _lldp_neighbor_detail(self, interface, info_dict):
+        capabilities = dict(self._RE_LLDP_CAPABILITY.findall(
+            info_dict.get('system capability', '')))
 
-        return lldp_neighbors_out
+        return {
+            'parent_interface': py23_compat.text_type(interface),
+            'remote_port': self._RE_LLDP_SUBTYPE.sub('', info_dict.get('port id', '')),
+            'remote_port_description': info_dict.get('port description', ''),
+            'remote_chassis_id': self._RE_LLDP_SUBTYPE.sub('', info_dict.get('chassis id', '')),
+            'remote_system_name': info_dict.get('system name', ''),
+            'remote_system_description': info_dict.get('system description', ''),
+            'remote_system_capab': capabilities.get('capabilities', '').replace(',', ', '),
+            'remote_system_enable_capab': capabilities.get('enabled', '').replace(',', ', ')
+        }
 
     def cli(self, commands):
         cli_output = {}
@@ -461,7 +1110,7 @@ class MOSDriver(NetworkDriver):
 
         for command in commands:
             try:
-                cli_output[py23_compat.text_type(command)] = self.device.run_commands(
+                cli_output[py23_compat.text_type(command)] = self._device_run_commands(
                     [command], encoding='text')[0].get('output')
                 # not quite fair to not exploit rum_commands
                 # but at least can have better control to point to wrong command in case of failure
@@ -479,44 +1128,50 @@ class MOSDriver(NetworkDriver):
 
         return cli_output
 
+    @instrumented
     def get_arp_table(self):
+        return list(self.iter_arp_table())
 
-        arp_table = []
-
-        commands = ['show arp']
-
+    def iter_arp_table(self):
+        """Like get_arp_table, but yield the entries one at a time as they are parsed."""
         try:
-            output = self.device.run_commands(commands, encoding='text')[0]['output']
+            output = self._run_getter('arp_table')
         except pyeapi.eapilib.CommandError:
-            return []
+            return
+
+        for entry in self._iter_arp_table(*output):
+            yield entry
 
-        for line in output.split('\n'):
+    def _parse_arp_table(self, output):
+        return list(self._iter_arp_table(output))
+
+    def _iter_arp_table(self, output):
+        for line in _iter_lines(output['output']):
             match = self._RE_ARP.match(line)
             if match:
-                neighbor = match.groupdict()
-                interface = py23_compat.text_type(neighbor.get('interface'))
-                mac_raw = neighbor.get('hwAddress')
-                ip = py23_compat.text_type(neighbor.get('address'))
-                age = 0.0
-                arp_table.append(
-                    {
-                        'interface': interface,
-                        'mac': napalm.base.helpers.mac(mac_raw),
-                        'ip': napalm.base.helpers.ip(ip),
-                        'age': age
-                    }
-                )
-
-        return arp_table
+                yield {
+                    'interface': py23_compat.text_type(match.group('interface')),
+                    'mac': _normalize_mac(match.group('hwAddress')),
+                    'ip': _normalize_ip(py23_compat.text_type(match.group('address'))),
+                    'age': 0.0
+                }
 
+    @instrumented
     def get_ntp_servers(self):
-        config = self.get_config(retrieve='running')['running']
+        return self._parse_ntp_servers(*self._run_getter('ntp_servers'))
+
+    def _parse_ntp_servers(self, running_config):
+        config = running_config['output']
 
         servers = self._RE_NTP_SERVERS.findall(config)
 
         return {py23_compat.text_type(server): {} for server in servers}
 
+    @instrumented
     def get_ntp_stats(self):
+        return self._parse_ntp_stats(*self._run_getter('ntp_stats'))
+
+    def _parse_ntp_stats(self, output):
         ntp_stats = []
 
         REGEX = (
@@ -527,15 +1182,12 @@ class MOSDriver(NetworkDriver):
             r'\s+([0-9\.]+)\s?$'
         )
 
-        commands = []
-        commands.append('show ntp associations')
-
         # output = self.device.run_commands(commands)
         # pyeapi.eapilib.CommandError: CLI command 2 of 2 'show ntp associations'
         # failed: unconverted command
         # JSON output not yet implemented...
 
-        ntp_assoc = self.device.run_commands(commands, encoding='text')[0].get('output', '\n\n')
+        ntp_assoc = output.get('output', '\n\n')
         ntp_assoc_lines = ntp_assoc.splitlines()[2:]
 
         for ntp_assoc in ntp_assoc_lines:
@@ -562,9 +1214,12 @@ class MOSDriver(NetworkDriver):
 
         return ntp_stats
 
+    @instrumented
     def get_snmp_information(self):
         """get_snmp_information() for MOS."""
+        return self._parse_snmp_information(*self._run_getter('snmp_information'))
 
+    def _parse_snmp_information(self, chassis_id, location, contact, community):
         # Default values
         snmp_dict = {
             'chassis_id': '',
@@ -573,18 +1228,11 @@ class MOSDriver(NetworkDriver):
             'community': {}
         }
 
-        commands = [
-            'show snmp chassis-id',
-            'show snmp location',
-            'show snmp contact',
-            'show snmp community'
-        ]
-        snmp_config = self.device.run_commands(commands, encoding='text')
-        snmp_dict['chassis_id'] = snmp_config[0]['output'].replace('Chassis: ', '').strip()
-        snmp_dict['location'] = snmp_config[1]['output'].replace('Location: ', '').strip()
-        snmp_dict['contact'] = snmp_config[2]['output'].replace('Contact: ', '').strip()
-
-        community_outputs = snmp_config[3]['output'].split('\n\n')
+        snmp_dict['chassis_id'] = chassis_id['output'].replace('Chassis: ', '').strip()
+        snmp_dict['location'] = location['output'].replace('Location: ', '').strip()
+        snmp_dict['contact'] = contact['output'].replace('Contact: ', '').strip()
+
+        community_outputs = community['output'].split('\n\n')
         for community_output in community_outputs:
 
             match = self._RE_SNMP_COMM.search(community_output)
@@ -597,69 +1245,70 @@ class MOSDriver(NetworkDriver):
 
         return snmp_dict
 
+    @instrumented
     def get_optics(self):
-        # THIS NEEDS WORK
+        return self._parse_optics(*self._run_getter('optics'))
 
-        command = ['show interfaces transceiver']
-
-        output = (
-            self.device.run_commands(
-                command, encoding='json')[0]['interfaces'])
+    def _parse_optics(self, transceivers):
+        output = transceivers['interfaces']
+        # The response cache and get_many, for a getter listed twice, hand the same output
+        # again, which isn't a new reading
+        fresh = transceivers is not self._sampled_optics
+        if fresh:
+            self._sampled_optics = transceivers
+            self._optics_sampler.retain(output)
 
         # Formatting data into return data structure
         optics_detail = {}
 
         for port, port_values in output.items():
-            port_detail = {}
-
-            port_detail['physical_channels'] = {}
-            port_detail['physical_channels']['channel'] = []
-
-            # Defaulting avg, min, max values to 0.0 since device does not
-            # return these values
-            try:
-                rxpwr = float(port_values['rxPwr'])
-            except ValueError:
-                rxpwr = 0.0
-
-            try:
-                txpwr = float(port_values['txPwr'])
-            except ValueError:
-                txpwr = 0.0
+            values = []
+            for key in ('rxPwr', 'txPwr', 'txBias'):
+                try:
+                    values.append(float(port_values[key]))
+                except ValueError:
+                    values.append(None)
+
+            # The device only gives the current reading, avg, min and max come from the
+            # readings of the previous polls. They are 0.0 unless all readings are valid.
+            stats = {}
+            if None not in values:
+                if fresh:
+                    self._optics_sampler.add(port, values)
+                stats = self._optics_sampler.stats(port)
+
+            state = {}
+            for field, value in zip(OpticsSampler.FIELDS, values):
+                avg, min_, max_ = stats.get(field, (0.0, 0.0, 0.0))
+                state[field] = {
+                    'instant': value if value is not None else 0.0,
+                    'avg': avg,
+                    'min': min_,
+                    'max': max_
+                }
 
-            try:
-                txbias = float(port_values['txBias'])
-            except ValueError:
-                txbias = 0.0
-
-            optic_states = {
-                'index': 0,
-                'state': {
-                    'input_power': {
-                        'instant': rxpwr,
-                        'avg': 0.0,
-                        'min': 0.0,
-                        'max': 0.0
-                    },
-                    'output_power': {
-                        'instant': txpwr,
-                        'avg': 0.0,
-                        'min': 0.0,
-                        'max': 0.0
-                    },
-                    'laser_bias_current': {
-                        'instant': txbias,
-                        'avg': 0.0,
-                        'min': 0.0,
-                        'max': 0.0
-                    }
+            optics_detail[port] = {
+                'physical_channels': {
+                    'channel': [{'index': 0, 'state': state}]
                 }
             }
-
-            port_detail['physical_channels']['channel'].append(optic_states)
-            optics_detail[port] = port_detail
         return optics_detail
 
+    def get_optics_drift(self):
+        """
+        Return the ports whose optics readings drifted over the window kept by get_optics.
+
+        The window holds the readings of the last optional_args 'optics_window' (10) calls
+        to get_optics which got them from the device, ports gone from the device are
+        dropped. A field drifts when its newest reading is further than its threshold
+        (optional_args 'optics_drift_thresholds', 2.0 dBm for the powers and 2.0 mA for
+        laser_bias_current by default) from the oldest one.
+
+        :return: dict port -> {field: change}, for fields of OpticsSampler.FIELDS.
+        """
+        return self._optics_sampler.drift()
+
+    @instrumented
     def get_config(self, retrieve="all"):
         """get_config implementation for MOS."""
 
@@ -677,9 +1326,71 @@ class MOSDriver(NetworkDriver):
         if not get_startup and not get_running:
             Exception("Wrong retrieve filter: {}".format(retrieve))
 
-        output = self.device.run_commands(commands, encoding="text")
+        output = self._run_commands(commands, encoding="text")
+        return self._parse_config(output[0] if get_startup else None,
+                                  output[1] if get_running else None)
+
+    def _parse_config(self, startup, running):
         return {
-            'startup': py23_compat.text_type(output[0]['output']) if get_startup else u"",
-            'running': py23_compat.text_type(output[1]['output']) if get_running else u"",
+            'startup': py23_compat.text_type(startup['output']) if startup else u"",
+            'running': py23_compat.text_type(running['output']) if running else u"",
             'candidate': '',
         }
+
+    @instrumented
+    def get_config_if_changed(self, retrieve="all", digests=None):
+        """
+        Conditional get_config, only transferring the configs which changed.
+
+        The device is first asked for the digest of each config. A config whose digest is the
+        one given in digests, or when not given the one it had the last time this driver
+        fetched it, is returned as None instead of its text. Otherwise its text is fetched.
+
+        :param retrieve: 'all', 'running' or 'startup', as for get_config.
+        :param digests: dict 'running'/'startup' -> digest, e.g. the 'digests' of a previous
+                        result.
+        :return: dict with the 'startup', 'running' and 'candidate' keys of get_config, where
+                 None means not modified, and 'digests' holding the current digests.
+        """
+        which = self._config_retrieve(retrieve)
+        current = self._config_digests(*which)
+        changed = self._changed_configs(which, current, digests)
+        output = []
+        if changed:
+            output = self._device_run_commands(self._config_fetch_commands(changed),
+                                               encoding='text')
+        return self._parse_config_if_changed(which, current, changed, output)
+
+    @staticmethod
+    def _config_retrieve(retrieve):
+        """Return the configs get_config_if_changed looks at for a retrieve filter."""
+        if retrieve == "all":
+            return ['startup', 'running']
+        elif retrieve in ('startup', 'running'):
+            return [retrieve]
+        raise ValueError("Wrong retrieve filter: {}".format(retrieve))
+
+    def _changed_configs(self, which, current, digests):
+        """Return the configs whose current digest isn't the one given or last fetched."""
+        known = {w: snapshot[0] for w, snapshot in self._config_snapshots.items()}
+        known.update(digests or {})
+        return [w for w in which if current[w] != known.get(w)]
+
+    def _config_fetch_commands(self, changed):
+        # Digests are read again along with the texts so that both always match
+        commands = []
+        for w in changed:
+            commands.extend([self._CONFIG_DIGEST_COMMAND.format(w), 'show {}-config'.format(w)])
+        return commands
+
+    def _parse_config_if_changed(self, which, current, changed, output):
+        result = {'startup': u"", 'running': u"", 'candidate': u"", 'digests': current}
+        for w in which:
+            result[w] = None
+        for i, w in enumerate(changed):
+            digest = output[2 * i]['output'].split()[0]
+            text = py23_compat.text_type(output[2 * i + 1]['output'])
+            self._config_snapshots[w] = (digest, text)
+            current[w] = digest
+            result[w] = text
+        return result
@@ -0,0 +1,442 @@
+"""
+asyncio flavour of the Napalm driver for Metamako MOS.
+
+Getters talk to /command-api with a non-blocking JSON-RPC client and share their parsing
+with MOSDriver. Configuration operations still need SSH, they are handed to a blocking
+MOSDriver running in the default executor.
+
+Requires Python 3.5 or later.
+"""
+
+import asyncio
+import base64
+import itertools
+import json
+import ssl
+import time
+
+from collections import OrderedDict
+
+from pyeapi.client import Node as EapiNode
+from pyeapi.eapilib import CommandError, ConnectionError
+
+from napalm.base.exceptions import ConnectionException, CommandErrorException
+
+from napalm_mos.mos import MOSDriver, TRANSPORTS, _PROC_COMMAND, _check_software_version
+
+
+class AsyncEapiClient(object):
+    """Non-blocking JSON-RPC client for the MOS /command-api endpoint."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, hostname, port, path='/command-api', username='', password='',
+                 transport='https', timeout=60, enablepwd='', semaphore=None):
+        self.hostname = hostname
+        self.port = port
+        self.path = path
+        self.timeout = timeout
+        self.enablepwd = enablepwd
+        self.semaphore = semaphore
+        self._ssl = None
+        if transport.startswith('https'):
+            # Same as pyeapi, MOS ships a self-signed certificate
+            self._ssl = ssl._create_unverified_context()
+        auth = '{}:{}'.format(username, password).encode('utf-8')
+        self._auth = 'Basic {}'.format(base64.b64encode(auth).decode('ascii'))
+
+    def __str__(self):
+        return 'AsyncEapiClient({}:{})'.format(self.hostname, self.port)
+
+    async def run_commands(self, commands, encoding='json', send_enable=True):
+        """Run commands on the device, behaves like pyeapi's Node.run_commands."""
+        commands = list(commands)
+        if send_enable:
+            if self.enablepwd:
+                commands.insert(0, {'cmd': 'enable', 'input': self.enablepwd})
+            else:
+                commands.insert(0, 'enable')
+
+        request = json.dumps({
+            'jsonrpc': '2.0',
+            'method': 'runCmds',
+            'params': {'version': 1, 'cmds': commands, 'format': encoding},
+            'id': str(next(self._ids)),
+        }).encode('utf-8')
+
+        try:
+            if self.semaphore is None:
+                response = await asyncio.wait_for(self._post(request), self.timeout)
+            else:
+                async with self.semaphore:
+                    response = await asyncio.wait_for(self._post(request), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectionError(str(self), 'Socket error during eAPI connection: {}'.format(
+                e or 'timed out'))
+
+        if 'error' in response:
+            error = response['error']
+            output = [r for r in error.get('data', []) if 'errors' not in r]
+            errors = [e for r in error.get('data', []) for e in r.get('errors', [])]
+            raise CommandError(error.get('code'), error.get('message', ''),
+                               command_error=errors[-1] if errors else '', output=output)
+
+        result = response['result']
+        if send_enable:
+            result.pop(0)
+        return result
+
+    async def _post(self, body):
+        reader, writer = await asyncio.open_connection(self.hostname, self.port, ssl=self._ssl)
+        try:
+            writer.write('\r\n'.join([
+                'POST {} HTTP/1.1'.format(self.path),
+                'Host: {}'.format(self.hostname),
+                'Content-Type: application/json-rpc',
+                'Content-Length: {}'.format(len(body)),
+                'Authorization: {}'.format(self._auth),
+                'Connection: close',
+                '', '']).encode('ascii') + body)
+            status, headers = await self._read_head(reader)
+            content = await self._read_body(reader, headers)
+        finally:
+            writer.close()
+
+        if status == 401:
+            raise ConnectionError(str(self), 'Unauthorized. {}'.format(content))
+        try:
+            return json.loads(content.decode('utf-8'))
+        except ValueError:
+            raise ConnectionError(str(self), 'unable to connect to eAPI')
+
+    @staticmethod
+    async def _read_head(reader):
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                return status, headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _read_body(reader, headers):
+        if 'content-length' in headers:
+            return await reader.readexactly(int(headers['content-length']))
+        if headers.get('transfer-encoding', '').lower() != 'chunked':
+            return await reader.read()
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+
+class _InterfaceWatch(object):
+    """Asynchronous iterator returned by AsyncMOSDriver.watch_interfaces."""
+
+    def __init__(self, driver, interval, count):
+        self.driver = driver
+        self.interval = interval
+        self.count = count
+        self._state = {}
+        self._polls = 0
+        self._start = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self.count is None or self._polls < self.count:
+            if self._start is not None:
+                await asyncio.sleep(max(0.0, self.interval - (time.time() - self._start)))
+            self._start = time.time()
+            interfaces = self.driver._parse_interfaces(
+                *await self.driver._run_getter('interfaces', cache=False))
+            self._polls += 1
+            changes = self.driver._interface_changes(self._state, interfaces)
+            if changes:
+                return self._start, changes
+        raise StopAsyncIteration
+
+
+class _ArpTableIter(object):
+    """Asynchronous iterator returned by AsyncMOSDriver.iter_arp_table."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._entries = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._entries is None:
+            try:
+                output = await self.driver._run_getter('arp_table')
+            except CommandError:
+                self._entries = iter(())
+            else:
+                self._entries = self.driver._iter_arp_table(*output)
+        try:
+            return next(self._entries)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncMOSDriver(MOSDriver):
+    """
+    Napalm driver for Metamako MOS using asyncio.
+
+    Every getter and open/close are coroutines. Pass an asyncio.Semaphore as
+    optional_args['semaphore'] to bound the number of requests in flight across many
+    drivers; each request is cancelled after `timeout` seconds.
+    """
+
+    def __init__(self, hostname, username, password, timeout=60, optional_args=None):
+        """Constructor."""
+        super(AsyncMOSDriver, self).__init__(hostname, username, password, timeout,
+                                             optional_args)
+        optional_args = dict(optional_args or {})
+        self.semaphore = optional_args.pop('semaphore', None)
+        self._client = None
+        # Blocking twin doing everything which needs SSH
+        optional_args['response_cache'] = False
+        self._config_driver = MOSDriver(hostname, username, password, timeout, optional_args)
+
+    def __del__(self):
+        # NetworkDriver.__del__ can't await is_alive/close, the blocking twin
+        # cleans up the SSH session on its own.
+        pass
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.close()
+
+    async def open(self):
+        """Implementation of NAPALM method open."""
+        if self.transport not in TRANSPORTS:
+            raise TypeError('invalid transport specified')
+        self._client = AsyncEapiClient(self.hostname, self.port, path=self.path,
+                                       username=self.username, password=self.password,
+                                       transport=self.transport, timeout=self.timeout,
+                                       enablepwd=self.enablepwd, semaphore=self.semaphore)
+        if self._config_driver.device is None:
+            connection = TRANSPORTS[self.transport](
+                self.hostname, port=self.port, path=self.path, username=self.username,
+                password=self.password, timeout=self.timeout)
+            self._config_driver.device = EapiNode(connection, enablepwd=self.enablepwd)
+        try:
+            sw_version = (await self._client.run_commands(
+                ['show version']))[0].get('softwareImageVersion', "0.0.0")
+        except ConnectionError as ce:
+            raise ConnectionException(ce.message)
+        _check_software_version(sw_version)
+        if not self.lazy_ssh:
+            await self._in_executor(self._config_driver._get_ssh)
+
+    async def close(self):
+        """Implementation of NAPALM method close."""
+        await self._in_executor(self._config_driver.close)
+
+    def _in_executor(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    async def is_alive(self):
+        return await self._in_executor(self._config_driver.is_alive)
+
+    async def _run_commands(self, commands, encoding='json', cache=True):
+        if self.response_cache is None or not cache:
+            return await self._client.run_commands(commands, encoding=encoding)
+
+        output = [self.response_cache.get(command, encoding) for command in commands]
+        missing = [command for command, result in zip(commands, output) if result is None]
+        if missing:
+            fetched = dict(zip(missing, await self._client.run_commands(missing,
+                                                                        encoding=encoding)))
+            for command, result in fetched.items():
+                self.response_cache.set(command, encoding, result)
+            output = [fetched[command] if result is None else result
+                      for command, result in zip(commands, output)]
+        return output
+
+    async def _run_batched(self, commands, cache=True):
+        batches = OrderedDict()
+        for command, encoding in commands:
+            batch = batches.setdefault(encoding, [])
+            if command not in batch:
+                batch.append(command)
+
+        results = await asyncio.gather(*[self._run_commands(batch, encoding=encoding,
+                                                            cache=cache)
+                                         for encoding, batch in batches.items()])
+        output = {}
+        for (encoding, batch), result in zip(batches.items(), results):
+            output.update(zip([(command, encoding) for command in batch], result))
+        return output
+
+    async def _run_getter(self, getter, cache=True):
+        commands = self._getter_commands(getter)
+        output = await self._run_batched(commands, cache=cache)
+        return [output[command] for command in commands]
+
+    async def get_many(self, getters):
+        """Asynchronous MOSDriver.get_many."""
+        unsupported = [g for g in getters if g not in self._GETTER_COMMANDS]
+        if unsupported:
+            raise ValueError("Unsupported getter(s): {}".format(", ".join(unsupported)))
+
+        commands = [c for getter in getters for c in self._getter_commands(getter)]
+        try:
+            output = await self._run_batched(commands)
+        except CommandError:
+            results = await asyncio.gather(*[getattr(self, 'get_{}'.format(getter))()
+                                             for getter in getters])
+            return dict(zip(getters, results))
+
+        return {
+            getter: getattr(self, '_parse_{}'.format(getter))(
+                *[output[command] for command in self._getter_commands(getter)])
+            for getter in getters
+        }
+
+    async def get_facts(self):
+        return self._parse_facts(*await self._run_getter('facts'))
+
+    async def get_interfaces(self):
+        return self._parse_interfaces(*await self._run_getter('interfaces'))
+
+    async def get_lldp_neighbors(self):
+        return self._parse_lldp_neighbors(*await self._run_getter('lldp_neighbors'))
+
+    async def get_interfaces_counters(self):
+        return self._parse_interfaces_counters(*await self._run_getter('interfaces_counters'))
+
+    async def get_interfaces_rates(self, span=1):
+        """Asynchronous MOSDriver.get_interfaces_rates."""
+        self._counter_sampler.add(self._parse_interfaces_counters(
+            *await self._run_getter('interfaces_counters', cache=False)))
+        return self._counter_sampler.rates(span)
+
+    def watch_interfaces(self, interval=10, count=None):
+        """
+        Asynchronous MOSDriver.watch_interfaces, to be used with ``async for``.
+        """
+        return _InterfaceWatch(self, interval, count)
+
+    async def get_environment(self):
+        try:
+            return self._parse_environment(*await self._run_getter('environment'))
+        except CommandError:
+            if self._bash_refused:
+                raise
+            output = await self._run_commands(['show environment all'])
+            try:
+                proc = (await self._run_commands([_PROC_COMMAND], encoding='text'))[0]
+            except CommandError:
+                self._bash_refused = True
+                proc = None
+            return self._parse_environment(output[0], proc)
+
+    async def get_lldp_neighbors_detail(self, interface=''):
+        commands = ['show lldp neighbor {} verbose'.format(interface)]
+        return self._parse_lldp_neighbors_detail(
+            (await self._run_commands(commands, encoding='text'))[0])
+
+    async def get_arp_table(self):
+        try:
+            output = await self._run_getter('arp_table')
+        except CommandError:
+            return []
+        return self._parse_arp_table(*output)
+
+    def iter_arp_table(self):
+        """
+        Asynchronous MOSDriver.iter_arp_table, to be used with ``async for``.
+        """
+        return _ArpTableIter(self)
+
+    async def get_ntp_servers(self):
+        return self._parse_ntp_servers(*await self._run_getter('ntp_servers'))
+
+    async def get_ntp_stats(self):
+        return self._parse_ntp_stats(*await self._run_getter('ntp_stats'))
+
+    async def get_snmp_information(self):
+        return self._parse_snmp_information(*await self._run_getter('snmp_information'))
+
+    async def get_optics(self):
+        return self._parse_optics(*await self._run_getter('optics'))
+
+    async def get_optics_drift(self):
+        """Asynchronous MOSDriver.get_optics_drift."""
+        return self._optics_sampler.drift()
+
+    async def get_config(self, retrieve="all"):
+        commands = []
+        if retrieve in ("all", "startup"):
+            commands.append(('show startup-config', 'text'))
+        if retrieve in ("all", "running"):
+            commands.append(('show running-config', 'text'))
+        output = await self._run_batched(commands)
+        return self._parse_config(output.get(('show startup-config', 'text')),
+                                  output.get(('show running-config', 'text')))
+
+    async def get_config_if_changed(self, retrieve="all", digests=None):
+        """Asynchronous MOSDriver.get_config_if_changed."""
+        which = self._config_retrieve(retrieve)
+        output = await self._client.run_commands(
+            [self._CONFIG_DIGEST_COMMAND.format(w) for w in which], encoding='text')
+        current = self._parse_config_digests(which, output)
+        changed = self._changed_configs(which, current, digests)
+        output = []
+        if changed:
+            output = await self._client.run_commands(self._config_fetch_commands(changed),
+                                                     encoding='text')
+        return self._parse_config_if_changed(which, current, changed, output)
+
+    async def cli(self, commands):
+        if not isinstance(commands, list):
+            raise TypeError('Please enter a valid list of commands!')
+
+        cli_output = {}
+        for command in commands:
+            try:
+                cli_output[command] = (await self._client.run_commands(
+                    [command], encoding='text'))[0].get('output')
+            except CommandError:
+                cli_output[command] = 'Invalid command: "{cmd}"'.format(cmd=command)
+                raise CommandErrorException(str(cli_output))
+            except Exception as e:
+                msg = 'Unable to execute command "{cmd}": {err}'.format(cmd=command, err=e)
+                cli_output[command] = msg
+                raise CommandErrorException(str(cli_output))
+        return cli_output
+
+    async def load_merge_candidate(self, filename=None, config=None):
+        self._invalidate_cache()
+        await self._in_executor(self._config_driver.load_merge_candidate, filename, config)
+
+    async def load_replace_candidate(self, filename=None, config=None):
+        self._invalidate_cache()
+        await self._in_executor(self._config_driver.load_replace_candidate, filename, config)
+
+    async def compare_config(self):
+        return await self._in_executor(self._config_driver.compare_config)
+
+    async def discard_config(self):
+        await self._in_executor(self._config_driver.discard_config)
+
+    async def commit_config(self):
+        await self._in_executor(self._config_driver.commit_config)
+        self._invalidate_cache()
+
+    async def rollback(self):
+        await self._in_executor(self._config_driver.rollback)
+        self._invalidate_cache()
@@ -0,0 +1,191 @@
+"""
+Push a config change to many devices at once, in waves.
+
+    from napalm_mos.rollout import rollout
+
+    for result in rollout(['mm1', 'mm2', 'mm3'], config='ntp server 192.0.2.1',
+                          username='admin', password='secret', wave_sizes=(1, 10)):
+        print(result.hostname, result.status, result.diff, result.errors)
+
+Devices of a wave are pushed concurrently. Once more than max_failures devices failed,
+the devices the current wave committed are rolled back and later waves are skipped.
+"""
+
+from __future__ import unicode_literals
+
+import time
+
+from collections import namedtuple
+
+from napalm_mos.fleet import DeadlineExceeded, inventory_devices, run_bounded
+from napalm_mos.mos import MOSDriver
+
+
+RolloutResult = namedtuple('RolloutResult', [
+    'hostname',  # as given in the inventory
+    'wave',      # index of the wave the device was part of
+    'status',    # 'committed', 'unchanged', 'compared', 'failed', 'rolled_back' or 'skipped'
+    'diff',      # compare_config output, '' if there was none
+    'errors',    # stage ('open', 'load', 'compare', 'commit', ...) -> error message
+    'timings',   # stage -> seconds
+    'elapsed',   # seconds spent on the device in total
+])
+
+
+def plan_waves(devices, wave_sizes):
+    """Split devices in waves of wave_sizes devices, the last size repeating."""
+    if not wave_sizes or min(wave_sizes) < 1:
+        raise ValueError("Wave sizes must be positive: {}".format(wave_sizes))
+    waves = []
+    start = 0
+    while start < len(devices):
+        size = wave_sizes[min(len(waves), len(wave_sizes) - 1)]
+        waves.append(devices[start:start + size])
+        start += size
+    return waves
+
+
+def _new_driver(device, driver_class):
+    return driver_class(device['hostname'], device.get('username'), device.get('password'),
+                        timeout=device.get('timeout', 60),
+                        optional_args=device.get('optional_args'))
+
+
+def _stage_timer(errors, timings):
+    def timed(stage, func, *args, **kwargs):
+        stage_start = time.time()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            errors[stage] = '{}: {}'.format(type(e).__name__, e)
+        finally:
+            timings[stage] = time.time() - stage_start
+    return timed
+
+
+def _checkpointed(driver):
+    """Whether a failed commit_config got past saving the rollback checkpoint."""
+    if getattr(driver, 'commit_pipeline', False):
+        # Pipelined commits restore the checkpoint themselves
+        return False
+    return 'backup' in getattr(driver, 'commit_timings', {})
+
+
+def _push_device(device, wave, driver_class, replace, commit):
+    start = time.time()
+    errors, timings = {}, {}
+    timed = _stage_timer(errors, timings)
+    diff = None
+    status = 'failed'
+
+    driver = _new_driver(device, driver_class)
+    timed('open', driver.open)
+    if 'open' not in errors:
+        load = driver.load_replace_candidate if replace else driver.load_merge_candidate
+        timed('load', load, config=device['config'])
+        if 'load' not in errors:
+            diff = timed('compare', driver.compare_config)
+
+        if errors:
+            timed('discard', driver.discard_config)
+        elif not diff or not commit:
+            timed('discard', driver.discard_config)
+            status = 'compared' if diff else 'unchanged'
+        else:
+            timed('commit', driver.commit_config)
+            if 'commit' not in errors:
+                status = 'committed'
+            else:
+                if _checkpointed(driver):
+                    timed('rollback', driver.rollback)
+                # MOSDriver.close commits a candidate still loaded
+                timed('discard', driver.discard_config)
+        timed('close', driver.close)
+
+    return RolloutResult(device['hostname'], wave, status, diff or '', errors, timings,
+                         time.time() - start)
+
+
+def _rollback_device(item, driver_class):
+    device, result = item
+    start = time.time()
+    errors, timings = dict(result.errors), dict(result.timings)
+    timed = _stage_timer(errors, timings)
+
+    driver = _new_driver(device, driver_class)
+    timed('rollback_open', driver.open)
+    if 'rollback_open' not in errors:
+        timed('rollback', driver.rollback)
+        timed('rollback_close', driver.close)
+    status = 'committed' if set(errors) - set(result.errors) else 'rolled_back'
+    return result._replace(status=status, errors=errors, timings=timings,
+                           elapsed=result.elapsed + time.time() - start)
+
+
+def rollout(inventory, config=None, replace=False, username=None, password=None,
+            optional_args=None, wave_sizes=(1, 10, 100), max_failures=0, max_workers=16,
+            deadline=None, commit=True, driver_class=MOSDriver):
+    """
+    Load, compare and commit a config on every device of the inventory, wave by wave.
+
+    Devices whose diff is empty are not committed. A device failing to commit is rolled
+    back on its own if its rollback checkpoint was saved. Once more than max_failures
+    devices failed, the devices committed by the current wave are rolled back and the
+    devices of later waves are reported as 'skipped'. Devices abandoned because of the
+    deadline count as failed, but their state is unknown and they are not rolled back.
+
+    :param inventory: hostnames, or dicts with a 'hostname' key and optionally 'config',
+                      'username', 'password', 'timeout' and 'optional_args' overriding the
+                      defaults.
+    :param config: the config to load, as given to load_merge_candidate.
+    :param replace: use load_replace_candidate instead of load_merge_candidate.
+    :param wave_sizes: number of devices of each wave, the last one repeating.
+    :param max_failures: number of failed devices tolerated over the whole rollout.
+    :param max_workers: number of devices pushed to at the same time within a wave.
+    :param deadline: seconds after which a device is reported as failed, None to wait forever.
+    :param commit: False only collects the diffs, discarding every candidate.
+    :return: generator of RolloutResult, one per device, yielded once its wave is done.
+    """
+    devices = inventory_devices(inventory, config=config, username=username,
+                                password=password, optional_args=optional_args)
+    missing = [device['hostname'] for device in devices if device['config'] is None]
+    if missing:
+        raise ValueError("No config for {}".format(", ".join(missing)))
+
+    def push(item):
+        wave, device = item
+        return _push_device(device, wave, driver_class, replace, commit)
+
+    def rollback(item):
+        return _rollback_device(item, driver_class)
+
+    failures = 0
+    waves = plan_waves(devices, wave_sizes)
+    for index, wave in enumerate(waves):
+        results = []
+        for (_, device), result, error, elapsed in run_bounded(
+                push, [(index, device) for device in wave], max_workers, deadline):
+            if error is not None:
+                stage = 'deadline' if isinstance(error, DeadlineExceeded) else 'push'
+                result = RolloutResult(device['hostname'], index, 'failed', '',
+                                       {stage: str(error)}, {}, elapsed)
+            results.append((device, result))
+        failures += sum(1 for _, result in results if result.status == 'failed')
+
+        if failures > max_failures:
+            committed = [item for item in results if item[1].status == 'committed']
+            rolled_back = {}
+            for (device, pushed), result, error, _ in run_bounded(rollback, committed,
+                                                                  max_workers, deadline):
+                if error is not None:
+                    result = pushed._replace(errors=dict(pushed.errors, rollback=str(error)))
+                rolled_back[id(device)] = result
+            for device, result in results:
+                yield rolled_back.get(id(device), result)
+            for later, skipped in enumerate(waves[index + 1:], index + 1):
+                for device in skipped:
+                    yield RolloutResult(device['hostname'], later, 'skipped', '', {}, {}, 0.0)
+            return
+
+        for _, result in results:
+            yield result
@@ -0,0 +1,200 @@
+"""Fixed-size sample histories kept by the MOS driver between polls."""
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import time
+
+from array import array
+
+
+class RingBuffer(object):
+    """
+    The last `size` samples of a fixed number of numeric fields plus a timestamp.
+
+    Values live in one flat array of the given typecode and timestamps in an array of
+    doubles, so memory does not depend on how many samples were ever appended. A typecode
+    the array module lacks ('Q' on Python 2) falls back to a list of Python ints.
+    """
+
+    def __init__(self, size, fields, typecode='d'):
+        self.size = size
+        self.fields = fields
+        self._times = array('d', [0.0]) * size
+        try:
+            self._data = array(typecode, [0]) * (size * fields)
+        except ValueError:
+            self._data = [0] * (size * fields)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, values):
+        offset = self._next * self.fields
+        self._times[self._next] = timestamp
+        for i, value in enumerate(values):
+            self._data[offset + i] = value
+        self._next = (self._next + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def sample(self, age=0):
+        """Return (timestamp, values) of a sample, age 0 being the newest one."""
+        if not 0 <= age < self._count:
+            raise IndexError('No sample of age {}'.format(age))
+        index = (self._next - 1 - age) % self.size
+        offset = index * self.fields
+        return self._times[index], self._data[offset:offset + self.fields]
+
+    def column(self, field):
+        """Return the values of a field in all samples held, oldest first."""
+        start = (self._next - self._count) % self.size
+        return [self._data[((start + i) % self.size) * self.fields + field]
+                for i in range(self._count)]
+
+
+class CounterSampler(object):
+    """
+    Keeps the last get_interfaces_counters samples of every port to derive rates from.
+
+    A counter going backwards is taken as a wrap if it was in the upper half of its range,
+    otherwise as a reset to zero. Counters are kept as unsigned 64-bit integers, doubles
+    would round them past 2 ** 53. Ports missing from a sample are forgotten.
+
+    A counter the device doesn't report, -1 in get_interfaces_counters, is kept as MISSING
+    and the rates derived from it are -1.0.
+    """
+
+    MISSING = 2 ** 64 - 1
+
+    FIELDS = (
+        'tx_octets', 'rx_octets',
+        'tx_unicast_packets', 'rx_unicast_packets',
+        'tx_multicast_packets', 'rx_multicast_packets',
+        'tx_broadcast_packets', 'rx_broadcast_packets',
+        'tx_errors', 'rx_errors',
+    )
+
+    def __init__(self, history=10, counter_bits=64):
+        self.history = history
+        self.modulus = 2 ** counter_bits
+        self._ports = {}
+
+    def add(self, counters, timestamp=None):
+        """Record the output of get_interfaces_counters."""
+        if timestamp is None:
+            timestamp = time.time()
+        for port in set(self._ports) - set(counters):
+            del self._ports[port]
+        for port, values in counters.items():
+            buf = self._ports.get(port)
+            if buf is None:
+                buf = self._ports[port] = RingBuffer(self.history, len(self.FIELDS), 'Q')
+            buf.append(timestamp, [self.MISSING if values[field] < 0 else values[field]
+                                   for field in self.FIELDS])
+
+    def _delta(self, old, new):
+        if self.MISSING in (old, new):
+            return None
+        if new >= old:
+            return new - old
+        if old > self.modulus / 2:
+            return new + self.modulus - old
+        return new
+
+    def rates(self, span=1):
+        """
+        Return per second rates of every port with at least two samples.
+
+        Rates are computed between the newest sample and the one `span` samples older, or
+        the oldest one held if there are fewer.
+        """
+        rates = {}
+        for port, buf in self._ports.items():
+            if len(buf) < 2:
+                continue
+            now, new = buf.sample()
+            then, old = buf.sample(min(span, len(buf) - 1))
+            interval = now - then
+            if interval <= 0:
+                continue
+            delta = {field: self._delta(o, n)
+                     for field, o, n in zip(self.FIELDS, old, new)}
+
+            def rate(fields, scale=1):
+                if any(delta[field] is None for field in fields):
+                    return -1.0
+                return sum(delta[field] for field in fields) * scale / interval
+
+            rates[port] = {
+                'tx_bps': rate(['tx_octets'], 8),
+                'rx_bps': rate(['rx_octets'], 8),
+                'tx_pps': rate(['tx_unicast_packets', 'tx_multicast_packets',
+                                'tx_broadcast_packets']),
+                'rx_pps': rate(['rx_unicast_packets', 'rx_multicast_packets',
+                                'rx_broadcast_packets']),
+                'tx_errors_ps': rate(['tx_errors']),
+                'rx_errors_ps': rate(['rx_errors']),
+                'interval': interval,
+            }
+        return rates
+
+
+class OpticsSampler(object):
+    """
+    Keeps the last get_optics readings of every port, for their average, minimum and
+    maximum and to spot drifting optics.
+    """
+
+    FIELDS = ('input_power', 'output_power', 'laser_bias_current')
+    # Change between the oldest and newest reading of the window flagged as drift,
+    # in dBm for the powers and mA for the bias current
+    DRIFT_THRESHOLDS = {'input_power': 2.0, 'output_power': 2.0, 'laser_bias_current': 2.0}
+
+    def __init__(self, window=10, thresholds=None):
+        self.window = window
+        self.thresholds = dict(self.DRIFT_THRESHOLDS)
+        self.thresholds.update(thresholds or {})
+        self._ports = {}
+
+    def add(self, port, values, timestamp=None):
+        """Record the readings of a port, in the order of FIELDS."""
+        if timestamp is None:
+            timestamp = time.time()
+        buf = self._ports.get(port)
+        if buf is None:
+            buf = self._ports[port] = RingBuffer(self.window, len(self.FIELDS))
+        buf.append(timestamp, values)
+
+    def retain(self, ports):
+        """Forget the readings of the ports not in ports."""
+        for port in set(self._ports) - set(ports):
+            del self._ports[port]
+
+    def stats(self, port):
+        """Return {field: (avg, min, max)} over the window of a port, {} without readings."""
+        buf = self._ports.get(port)
+        if not buf:
+            return {}
+        stats = {}
+        for i, field in enumerate(self.FIELDS):
+            column = buf.column(i)
+            stats[field] = (sum(column) / len(column), min(column), max(column))
+        return stats
+
+    def drift(self):
+        """
+        Return {port: {field: change}} for every field whose newest reading moved further
+        than its threshold from the oldest one in the window.
+        """
+        drifting = {}
+        for port, buf in self._ports.items():
+            if len(buf) < 2:
+                continue
+            _, newest = buf.sample()
+            _, oldest = buf.sample(len(buf) - 1)
+            for field, old, new in zip(self.FIELDS, oldest, newest):
+                if abs(new - old) > self.thresholds[field]:
+                    drifting.setdefault(port, {})[field] = new - old
+        return drifting
@@ -0,0 +1,281 @@
+"""
+Simulated MOS devices answering eAPI JSON-RPC requests from mocked data.
+
+Responses come from a directory laid out like test/unit/mocked_data, i.e.
+``<test>/<case>/<command>.<encoding>``, so MOSDriver can be exercised end to end over
+HTTP(S) without hardware:
+
+    python -m napalm_mos.simulator --data test/unit/mocked_data --devices 50 \\
+        --port 8000 --latency 0.05 --jitter 0.02
+
+starts 50 devices on ports 8000 to 8049, to be opened with
+optional_args={'transport': 'http', 'port': 8000, 'lazy_ssh': True}.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import re
+import socket
+import ssl
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+# eAPI error code for a command the device doesn't know
+INVALID_COMMAND = 1002
+
+
+def sanitize(command):
+    """File name of a command, as used by the test doubles."""
+    return re.sub('[^a-zA-Z0-9]', '_', command)[0:150]
+
+
+class MockedData(object):
+    """
+    Index of the responses found in a mocked data directory.
+
+    Only files of the given case are used. When a command has files in several tests, the
+    first test of `tests` wins, or the first one in alphabetical order if not given.
+    """
+
+    def __init__(self, data_dir, case='normal', tests=None):
+        self.data_dir = data_dir
+        self._files = {}
+        for test in tests or sorted(os.listdir(data_dir)):
+            case_dir = os.path.join(data_dir, test, case)
+            if not os.path.isdir(case_dir):
+                continue
+            for filename in sorted(os.listdir(case_dir)):
+                name, _, encoding = filename.rpartition('.')
+                if name and encoding in ('json', 'text'):
+                    self._files.setdefault((name, encoding), os.path.join(case_dir, filename))
+
+    def __len__(self):
+        return len(self._files)
+
+    def response(self, command, encoding):
+        """Return the result of a command, or None if there is no file for it."""
+        path = self._files.get((sanitize(command), encoding))
+        if path is None:
+            return None
+        with open(path) as f:
+            if encoding == 'json':
+                return json.load(f)
+            return {'output': f.read()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.device.connected(self.connection)
+
+    def finish(self):
+        BaseHTTPRequestHandler.finish(self)
+        self.server.device.disconnected(self.connection)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            self.send_error(400, 'Invalid JSON')
+            return
+        self.server.device.delay()
+        body = json.dumps(self.server.device.handle(request)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class DeviceSimulator(object):
+    """
+    One simulated device: an HTTP(S) server in a background thread.
+
+    :param data: a MockedData index.
+    :param latency: seconds to wait before answering every request.
+    :param jitter: up to that many seconds are randomly added to or taken from latency.
+    :param port: 0 picks a free port, see the port attribute once started.
+    :param certfile: serve HTTPS with that certificate (and keyfile) if given.
+    """
+
+    def __init__(self, data, latency=0.0, jitter=0.0, host='127.0.0.1', port=0,
+                 certfile=None, keyfile=None):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.host = host
+        self.port = port
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.requests = 0
+        self.connections = 0
+        self._sockets = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.device = self
+        if self.certfile:
+            context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_SERVER', ssl.PROTOCOL_SSLv23))
+            context.load_cert_chain(self.certfile, self.keyfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def connected(self, sock):
+        with self._lock:
+            self.connections += 1
+            self._sockets.add(sock)
+
+    def disconnected(self, sock):
+        with self._lock:
+            self._sockets.discard(sock)
+
+    def drop_connections(self):
+        """Close the open client connections, like a device timing out idle ones."""
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def delay(self):
+        seconds = self.latency + random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def handle(self, request):
+        """Return the JSON-RPC response to a runCmds request."""
+        with self._lock:
+            self.requests += 1
+        params = request.get('params', {})
+        encoding = params.get('format', 'json')
+        commands = params.get('cmds', [])
+
+        results = []
+        for index, command in enumerate(commands):
+            if isinstance(command, dict):
+                command = command['cmd']
+            if command == 'enable':
+                result = {'output': ''} if encoding == 'text' else {}
+            else:
+                result = self.data.response(command, encoding)
+            if result is None:
+                message = "CLI command {} of {} '{}' failed: invalid command".format(
+                    index + 1, len(commands), command)
+                return {
+                    'jsonrpc': '2.0',
+                    'id': request.get('id'),
+                    'error': {
+                        'code': INVALID_COMMAND,
+                        'message': message,
+                        'data': results + [{'errors': ['Invalid input']}],
+                    },
+                }
+            results.append(result)
+
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': results}
+
+
+def start_devices(data, count, port=0, **kwargs):
+    """
+    Start count devices serving the same data, on consecutive ports from port, or on free
+    ports if port is 0. Returns the started DeviceSimulator objects.
+    """
+    devices = []
+    try:
+        for i in range(count):
+            devices.append(DeviceSimulator(data, port=port + i if port else 0,
+                                           **kwargs).start())
+    except Exception:
+        for device in devices:
+            device.stop()
+        raise
+    return devices
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate MOS devices answering eAPI.')
+    parser.add_argument('--data', required=True, help='mocked data directory')
+    parser.add_argument('--case', default='normal')
+    parser.add_argument('--test', action='append', dest='tests',
+                        help='only use the data of that test, may be repeated')
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args(argv)
+
+    data = MockedData(args.data, args.case, args.tests)
+    devices = start_devices(data, args.devices, args.port, latency=args.latency,
+                            jitter=args.jitter, host=args.host, certfile=args.certfile,
+                            keyfile=args.keyfile)
+    print('{} devices serving {} responses on {}:{}-{}'.format(
+        len(devices), len(data), args.host, devices[0].port, devices[-1].port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for device in devices:
+            device.stop()
+
+
+if __name__ == '__main__':
+    main()
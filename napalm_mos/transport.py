@@ -0,0 +1,147 @@
+"""
+eAPI connections keeping their HTTP connection open between requests.
+
+pyeapi closes the connection after every request, so every eAPI call pays for a TCP and,
+over HTTPS, a TLS handshake. These connections keep it open, ask for gzip compressed
+responses, and resume the TLS session when they have to reconnect. A request failing on
+a connection the device dropped while idle is retried once on a new connection, if it
+failed before it was sent or only runs show commands.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import socket
+import ssl
+import zlib
+
+try:
+    from http.client import HTTPConnection, HTTPException
+except ImportError:
+    from httplib import HTTPConnection, HTTPException
+
+from pyeapi.eapilib import CommandError, ConnectionError
+from pyeapi.eapilib import HttpsConnection
+from pyeapi.eapilib import HttpEapiConnection, HttpsEapiConnection
+
+
+class _ResumingHttpsConnection(HttpsConnection):
+    """HTTPS connection offering the TLS session of its previous socket when reconnecting."""
+
+    tls_session = None
+
+    def connect(self):
+        if self.tls_session is None or not hasattr(ssl.SSLSocket, 'session'):
+            HttpsConnection.connect(self)
+            return
+        HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host,
+                                              session=self.tls_session)
+
+
+class KeepAliveMixin(object):
+    """Replaces EapiConnection.send to reuse the connection of the previous request."""
+
+    def send(self, data):
+        body = data.encode('utf-8')
+        reused = self.transport.sock is not None
+        try:
+            try:
+                sent = False
+                self._send_request(body)
+                sent = True
+                response = self._read_response()
+            except (socket.error, HTTPException):
+                # The device may have closed the idle connection. Unless the request may
+                # have reached it and changed something, try once more on a new one.
+                if not reused or (sent and not self._read_only(data)):
+                    raise
+                self.transport.close()
+                self._send_request(body)
+                response = self._read_response()
+        except (socket.error, HTTPException) as exc:
+            self.transport.close()
+            self.socket_error = exc
+            self.error = exc
+            raise ConnectionError(str(self),
+                                  'Socket error during eAPI connection: {}'.format(exc))
+
+        status, reason, content = response
+        if status == 401:
+            raise ConnectionError(str(self), '{}. {}'.format(reason, content))
+        try:
+            decoded = json.loads(content)
+        except ValueError as exc:
+            self.socket_error = None
+            self.error = exc
+            raise ConnectionError(str(self), 'unable to connect to eAPI')
+
+        if 'error' in decoded:
+            code, msg, err, out = self._parse_error_message(decoded)
+            raise CommandError(code, msg, command_error=err, output=out)
+        return decoded
+
+    @staticmethod
+    def _read_only(data):
+        """Whether every command of a JSON-RPC request is a show command."""
+        try:
+            commands = json.loads(data)['params']['cmds']
+        except (ValueError, KeyError, TypeError):
+            return False
+        for command in commands:
+            if isinstance(command, dict):
+                command = command.get('cmd', '')
+            # pyeapi starts every request with enable
+            if command != 'enable' and not command.startswith('show '):
+                return False
+        return True
+
+    def _send_request(self, data):
+        self.transport.putrequest('POST', '/command-api', skip_accept_encoding=True)
+        self.transport.putheader('Content-type', 'application/json-rpc')
+        self.transport.putheader('Content-length', '%d' % len(data))
+        self.transport.putheader('Accept-Encoding', 'gzip')
+        self.transport.putheader('Connection', 'keep-alive')
+        if self._auth:
+            self.transport.putheader(*self._auth)
+        self.transport.endheaders(data)
+
+    def _read_response(self):
+        """Return (status, reason, decoded body) of the response to the request sent."""
+        response = self.transport.getresponse()
+        content = response.read()
+        if response.getheader('Content-Encoding', '').lower() == 'gzip':
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        if getattr(self.transport.sock, 'session', None) is not None:
+            self.transport.tls_session = self.transport.sock.session
+        return response.status, response.reason, content.decode('utf-8')
+
+    def close(self):
+        self.transport.close()
+
+
+class HttpKeepAliveEapiConnection(KeepAliveMixin, HttpEapiConnection):
+    pass
+
+
+class HttpsKeepAliveEapiConnection(KeepAliveMixin, HttpsEapiConnection):
+
+    def __init__(self, host, port=None, path=None, username=None, password=None,
+                 context=None, timeout=60, **kwargs):
+        super(HttpsKeepAliveEapiConnection, self).__init__(
+            host, port=port, path=path, username=username, password=password,
+            context=context, timeout=timeout, **kwargs)
+        if context is None and not kwargs.get('enforce_verification'):
+            # Same as pyeapi, MOS ships a self-signed certificate
+            context = self.disable_certificate_verification()
+        transport = self.transport
+        self.transport = _ResumingHttpsConnection(transport.path, transport.host,
+                                                  transport.port, context=context,
+                                                  timeout=timeout)
+
+
+# Names the keep-alive connections are registered under in mos.TRANSPORTS
+TRANSPORTS = {
+    'http_keepalive': HttpKeepAliveEapiConnection,
+    'https_keepalive': HttpsKeepAliveEapiConnection,
+}
@@ -0,0 +1,192 @@
+"""
+Time the MOSDriver getters against synthetic outputs of any scale.
+
+    python test/benchmark/bench_getters.py [--ports N] [--neighbors N] [--arp N] [--ntp N]
+                                           [getter ...]
+
+Commands without a synthetic output are answered from the normal case of the getter's
+unit test data. For every getter the time per call, the entries returned per second and,
+on Python 3, the peak memory allocated during a call are printed.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+UNIT_DIR = os.path.join(ROOT_DIR, 'test', 'unit')
+# napalm_mos from this tree, installed or not
+sys.path[:0] = [UNIT_DIR, ROOT_DIR]
+
+from conftest import FakeMOSDevice, PatchedMOSDriver  # noqa: E402
+
+
+GETTERS = [
+    'facts', 'interfaces', 'interfaces_counters', 'lldp_neighbors', 'lldp_neighbors_detail',
+    'arp_table', 'ntp_servers', 'ntp_stats', 'environment', 'snmp_information', 'optics',
+    'config',
+]
+
+LLDP_NEIGHBOR = """\
+  src: (mac address) 00:1c:73:27:{0:02x}:de
+  received: Thu Aug  3 14:09:13 2017 (0:00:26)
+  chassis id: (mac address) 00:1c:73:27:{0:02x}:b0
+  port id: (interface name) Ethernet{1}
+  time to live: 120 secs
+  port description: uplink to leaf{1}
+  system name: leaf{1}.local
+  system description: Arista Networks EOS version 4.18.3.1F running on an Arista Networks
+DCS-7150S-64-CL
+  system capability: {{'enabled': 'mac-bridge,router', 'capabilities': 'mac-bridge,router'}}
+  management address: {{'subtype': 1, 'length': 5, 'address': '0ac1fffd'}}
+  IEEE 802.1 pvid (1): 01 b0
+  IEEE 802.3 max frame size (4): 9236
+  end of lldpdu:
+
+"""
+
+
+def lldp_neighbor_verbose(neighbors, per_interface=4):
+    """Return a 'show lldp neighbor verbose' output with that many neighbors."""
+    lines = []
+    for i in range(neighbors):
+        if i % per_interface == 0:
+            lines.append('* et{}\n'.format(i // per_interface + 1))
+        lines.append(LLDP_NEIGHBOR.format(i % 256, i))
+    return {'output': ''.join(lines)}
+
+
+def _arp_row(i, ports):
+    octets = (i >> 16 & 255, i >> 8 & 255, i & 255)
+    return '{:<24} ether   00:1c:73:{:02x}:{:02x}:{:02x}   C                     et{}'.format(
+        '10.{}.{}.{}'.format(*octets), octets[0], octets[1], octets[2], i % ports + 1)
+
+
+def synthetic_outputs(ports, neighbors, arp, ntp):
+    """Return {(command, encoding): output} for a device of the given scale."""
+    names = ['et{}'.format(i) for i in range(1, ports + 1)]
+    status = {'interfaces': {
+        name: {'name': '', 'tx': 'up <- et1', 'loopback': '', 'type': '10GBASE-SR',
+               'rx': 'up (link)' if i % 3 else 'down', 'source': 'et1', 'mode': '',
+               'speed': '10G'}
+        for i, name in enumerate(names)}}
+    counters = {'interfaces': {
+        name: {'name': '', 'txoctets': '68,966,711', 'rxoctets': '1,024',
+               'txucastpkts': '15,857', 'rxucastpkts': '12', 'txmcastpkts': '617,659',
+               'rxmcastpkts': '0', 'txbcastpkts': '161,591', 'rxbcastpkts': '0'}
+        for name in names}}
+    errors = {'interfaces': {
+        name: {'name': '', 'fcs': '0', 'align': '0', 'rx': '0', 'tx': '0', 'runts': '0',
+               'giants': '0'}
+        for name in names}}
+    arp_rows = ['Address                  HWtype  HWaddress           Flags Mask'
+                '            Iface']
+    arp_rows.extend(_arp_row(i, ports) for i in range(arp))
+    ntp_rows = ['     remote           refid      st t when poll reach   delay   offset  jitter',
+                '=' * 78]
+    ntp_rows.extend(' 192.0.2.{:<8} .GPS.            1 u   17   64    1    0.343  4808874'
+                    '   0.000'.format(i % 256) for i in range(ntp))
+    return {
+        ('show version', 'json'): {
+            'uptime': '8:49:16.860000', 'softwareImageVersion': '0.14.1',
+            'serialNumber': 'C16-B2-12345-6', 'device': 'Metamako MetaConnect 16'},
+        ('show hostname', 'text'): {'output': 'Hostname: vMOS\nFQDN:     vMOS.local\n'},
+        ('show interfaces status', 'json'): status,
+        ('show interfaces description', 'json'): [
+            {'Port': name, 'Description': 'port {}'.format(name)} for name in names],
+        ('show interfaces counters', 'json'): counters,
+        ('show interfaces counters errors', 'json'): errors,
+        ('show lldp neighbor', 'json'): [
+            {'Neighbor_Device': 'leaf{}.local'.format(i), 'TTL': '120 (0:00:15)',
+             'Port': names[i % ports], 'Neighbor_Port': 'Ethernet{}'.format(i)}
+            for i in range(neighbors)],
+        ('show lldp neighbor  verbose', 'text'): lldp_neighbor_verbose(neighbors),
+        ('show arp', 'text'): {'output': '\n'.join(arp_rows) + '\n'},
+        ('show ntp associations', 'text'): {'output': '\n'.join(ntp_rows) + '\n'},
+    }
+
+
+class SyntheticMOSDevice(FakeMOSDevice):
+    """MOS device test double answering the scalable commands with synthetic outputs."""
+
+    def __init__(self, ports=64, neighbors=64, arp=1000, ntp=4):
+        super(SyntheticMOSDevice, self).__init__()
+        self.outputs = synthetic_outputs(ports, neighbors, arp, ntp)
+
+    def find_file(self, filename):
+        path = os.path.join(UNIT_DIR, 'mocked_data', self.current_test,
+                            self.current_test_case, filename)
+        if not os.path.exists(path):
+            raise IOError("Couldn't find file with mocked data: {}".format(path))
+        return path
+
+    def run_commands(self, command_list, encoding='json', send_enable=False):
+        """Return the synthetic output, or the unit test data for other commands."""
+        return [self.outputs[(command, encoding)] if (command, encoding) in self.outputs
+                else super(SyntheticMOSDevice, self).run_commands([command], encoding)[0]
+                for command in command_list]
+
+
+def _entries(result):
+    """Number of entries in a getter result: list items, or dict keys, or list values."""
+    if isinstance(result, dict) and result and all(isinstance(v, list)
+                                                   for v in result.values()):
+        return sum(len(v) for v in result.values())
+    if isinstance(result, (dict, list)):
+        return len(result)
+    return 1
+
+
+def benchmark(driver, getter, repeat=3):
+    """Return (seconds per call, entries returned, peak bytes allocated or None)."""
+    driver.device.current_test = 'test_get_{}'.format(getter)
+    driver.device.current_test_case = 'normal'
+    func = getattr(driver, 'get_{}'.format(getter))
+    entries = _entries(func())
+
+    number = 1
+    while timeit.timeit(func, number=number) < 0.2:
+        number *= 10
+    elapsed = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, entries, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ports', type=int, default=64)
+    parser.add_argument('--neighbors', type=int, default=64)
+    parser.add_argument('--arp', type=int, default=1000)
+    parser.add_argument('--ntp', type=int, default=4)
+    parser.add_argument('getters', nargs='*', default=GETTERS)
+    args = parser.parse_args(argv)
+
+    driver = PatchedMOSDriver('localhost', 'admin', 'admin')
+    driver.device = SyntheticMOSDevice(args.ports, args.neighbors, args.arp, args.ntp)
+
+    print('{:<24} {:>10} {:>8} {:>14} {:>10}'.format(
+        'getter', 'ms/call', 'entries', 'entries/s', 'peak KiB'))
+    for getter in args.getters:
+        elapsed, entries, peak = benchmark(driver, getter)
+        print('{:<24} {:>10.3f} {:>8} {:>14.0f} {:>10}'.format(
+            getter, elapsed * 1000, entries, entries / elapsed,
+            '-' if peak is None else '{:.1f}'.format(peak / 1024)))
+
+
+if __name__ == '__main__':
+    main()
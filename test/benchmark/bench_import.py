@@ -0,0 +1,62 @@
+"""
+Time importing napalm_mos in fresh interpreters.
+
+    python test/benchmark/bench_import.py [runs]
+
+napalm.base is timed on its own too, since napalm_mos can't be imported without it, and
+the modules napalm_mos loads on top of it are listed with the heavy ones flagged.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import subprocess
+import sys
+
+# Only needed by SSH, SCP or config paths, importing napalm_mos must not load them
+DEFERRED = ('netmiko', 'paramiko', 'scp', 'distutils', 'tempfile', 'napalm.base.helpers',
+            'pkg_resources')
+
+TIMER = '''
+import time
+start = time.time()
+import {}
+print(time.time() - start)
+'''
+
+NEW_MODULES = '''
+import json, sys
+import napalm.base
+before = set(sys.modules)
+import napalm_mos
+print(json.dumps(sorted(set(sys.modules) - before)))
+'''
+
+
+def import_time(module, runs):
+    """Return the fastest of runs imports of module, in seconds."""
+    return min(float(subprocess.check_output([sys.executable, '-c', TIMER.format(module)]))
+               for _ in range(runs))
+
+
+def new_modules():
+    """Return the modules importing napalm_mos loads which napalm.base doesn't."""
+    return json.loads(subprocess.check_output([sys.executable, '-c', NEW_MODULES]).decode())
+
+
+def main(runs=5):
+    base = import_time('napalm.base', runs)
+    total = import_time('napalm_mos', runs)
+    print('{:<28} {:>8.1f} ms'.format('napalm.base', base * 1000))
+    print('{:<28} {:>8.1f} ms'.format('napalm_mos', total * 1000))
+    print('{:<28} {:>8.1f} ms'.format('napalm_mos on top of napalm', (total - base) * 1000))
+
+    modules = new_modules()
+    deferred = [m for m in modules if m.split('.')[0] in DEFERRED or m in DEFERRED]
+    print('{} modules loaded on top of napalm.base'.format(len(modules)))
+    if deferred:
+        print('Should be deferred: {}'.format(', '.join(deferred)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -1,12 +1,20 @@
 """Test fixtures."""
 from builtins import super
 
+import os
+import shutil
+import subprocess
+import sys
+
 import pytest
 from napalm.base.test import conftest as parent_conftest
 
 from napalm.base.test.double import BaseTestDouble
 
-from napalm_mos import mos
+from napalm_mos import file_copy, mos
+
+# AsyncMOSDriver needs Python 3.5+
+collect_ignore = ['test_mos_async.py'] if sys.version_info < (3, 5) else []
 
 
 @pytest.fixture(scope='class')
@@ -22,6 +30,31 @@ def set_device_parameters(request):
     parent_conftest.set_device_parameters(request)
 
 
+@pytest.fixture
+def run_commands_calls(request, monkeypatch):
+    """Record the (commands, encoding) of every run_commands call on the test's device."""
+    calls = []
+    device = request.instance.device.device
+    run_commands = device.run_commands
+
+    def recording_run_commands(commands, encoding='json', **kwargs):
+        calls.append((list(commands), encoding))
+        return run_commands(commands, encoding=encoding, **kwargs)
+
+    monkeypatch.setattr(device, 'run_commands', recording_run_commands)
+    return calls
+
+
+@pytest.fixture
+def scp(monkeypatch):
+    """Use FakeSCPClient for the transfers of FileCopy, starting with no recorded copies."""
+    monkeypatch.setattr(file_copy, 'SCPClient', FakeSCPClient)
+    monkeypatch.setattr(FakeSCPClient, 'sent', [])
+    monkeypatch.setattr(FakeSCPClient, 'files', None)
+    monkeypatch.setattr(FakeSCPClient, 'corrupt', False)
+    return FakeSCPClient
+
+
 def pytest_generate_tests(metafunc):
     """Generate test cases dynamically."""
     parent_conftest.pytest_generate_tests(metafunc, __file__)
@@ -66,3 +99,91 @@ class FakeMOSDevice(BaseTestDouble):
                 result.append({'output': self.read_txt_file(full_path)})
 
         return result
+
+
+class FakeTransport(object):
+
+    @staticmethod
+    def is_active():
+        return True
+
+
+class FakeSSH(object):
+    """Stand-in for a netmiko connection, recording commands and answering `output`."""
+
+    class remote_conn(object):
+
+        transport = FakeTransport
+
+        @staticmethod
+        def get_transport():
+            return FakeTransport()
+
+    def __init__(self, output=''):
+        self.output = output
+        self.commands = []
+
+    def enable(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def send_command(self, command):
+        self.commands.append(command)
+        return self.answer(command)
+
+    def answer(self, command):
+        return self.output
+
+
+class LocalSSH(FakeSSH):
+    """Stand-in for a netmiko connection, running 'bash ...' commands locally."""
+
+    def answer(self, command):
+        assert command.startswith('bash ')
+        process = subprocess.Popen(['bash', '-c', command[5:]], stdout=subprocess.PIPE,
+                                   universal_newlines=True)
+        return process.communicate()[0]
+
+
+class FakeSCPClient(object):
+    """
+    Stand-in for scp.SCPClient copying local files.
+
+    The sizes sent are recorded in `sent`. When `files` is a dict, what putfo is given is
+    kept there instead of written, cut by a byte with `corrupt`.
+    """
+
+    sent = []
+    files = None
+    corrupt = False
+
+    def __init__(self, transport, progress=None):
+        self.progress = progress
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _copy(self, source, dest):
+        size = os.path.getsize(source)
+        self.sent.append(size)
+        shutil.copyfile(source, dest)
+        if self.progress:
+            self.progress(dest, size, size)
+
+    put = get = _copy
+
+    def putfo(self, fileobj, dest):
+        data = fileobj.read()[:-1 if self.corrupt else None]
+        self.sent.append(len(data))
+        if self.files is None:
+            with open(dest, 'wb') as f:
+                f.write(data)
+        else:
+            self.files[dest] = data
+        if self.progress:
+            self.progress(dest, len(data), len(data))
@@ -0,0 +1,30 @@
+"""Tests for iter_arp_table."""
+
+import json
+import types
+
+import pytest
+
+from napalm_mos import mos
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestIterArpTable(object):
+    """Test the streaming ARP table."""
+
+    def test_iter_arp_table(self, request):
+        self.device.device.current_test = 'test_get_arp_table'
+        self.device.device.current_test_case = 'normal'
+        entries = self.device.iter_arp_table()
+        assert isinstance(entries, types.GeneratorType)
+
+        path = request.fspath.dirpath('mocked_data', 'test_get_arp_table', 'normal',
+                                      'expected_result.json')
+        assert list(entries) == json.loads(path.read())
+
+    def test_normalization_is_memoized(self):
+        self.device.device.current_test = 'test_get_arp_table'
+        self.device.device.current_test_case = 'normal'
+        self.device.get_arp_table()
+        assert '00:00:5e:00:01:50' in mos._normalize_mac.cache
+        assert '192.0.2.254' in mos._normalize_ip.cache
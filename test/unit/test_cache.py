@@ -0,0 +1,75 @@
+"""Tests for the response cache."""
+
+import pytest
+
+from napalm_mos.cache import LRUCache, ResponseCache, memoize
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.evictions == 1
+
+
+def test_memoize():
+    calls = []
+
+    def double(x):
+        calls.append(x)
+        return x * 2
+
+    memoized = memoize(double, maxsize=2)
+    assert [memoized(x) for x in (1, 2, 1, 3, 2)] == [2, 4, 2, 6, 4]
+    assert calls == [1, 2, 3, 2]
+
+
+def test_response_cache_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl=5, command_ttl={'show running-config': 60, 'show arp': 0},
+                          clock=clock)
+    cache.set('show version', 'json', {'a': 1})
+    cache.set('show running-config', 'text', {'output': 'config'})
+    cache.set('show arp', 'text', {'output': ''})
+
+    assert cache.get('show version', 'json') == {'a': 1}
+    assert cache.get('show version', 'text') is None
+    assert cache.get('show arp', 'text') is None
+
+    clock.now += 10
+    assert cache.get('show version', 'json') is None
+    assert cache.get('show running-config', 'text') == {'output': 'config'}
+    assert cache.stats() == {'hits': 2, 'misses': 3, 'size': 1, 'evictions': 0}
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestDriverResponseCache(object):
+    """Test the driver uses the response cache."""
+
+    def test_cached_getters(self, monkeypatch, run_commands_calls):
+        self.device.device.current_test = 'test_get_config'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, 'response_cache', ResponseCache())
+        calls = run_commands_calls
+
+        config = self.device.get_config()
+        assert self.device.get_config() == config
+        self.device.get_ntp_servers()
+        assert len(calls) == 1
+        assert self.device.response_cache.stats()['hits'] == 3
+
+        self.device._invalidate_cache()
+        self.device.get_config()
+        assert len(calls) == 2
@@ -0,0 +1,109 @@
+"""Tests for commit_config, pipelined or not."""
+
+import re
+
+import pytest
+
+from napalm.base.exceptions import CommandErrorException
+
+from conftest import FakeSSH
+
+
+class StepSSH(FakeSSH):
+    """
+    FakeSSH running the steps of a pipelined commit script, each taking 0.25s, until the one
+    named by `failing`.
+    """
+
+    failing = None
+
+    def answer(self, command):
+        if not command.startswith('bash step()'):
+            return ''
+        output = []
+        for i, name in enumerate(re.findall(r'step (\w+) ', command.split(';', 3)[-1])):
+            status = 1 if name == self.failing else 0
+            output.append('napalm_step {} {} {} {}'.format(name, status, 100 + i,
+                                                           100.25 + i))
+            if status:
+                break
+        return '\n'.join(output)
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestCommit(object):
+    """Test the commit steps, their timings and the cleanup of failed commits."""
+
+    @pytest.fixture(autouse=True)
+    def ssh(self, monkeypatch):
+        ssh = StepSSH()
+        monkeypatch.setattr(self.device, '_ssh', ssh)
+        monkeypatch.setattr(self.device, 'commit_pipeline', True)
+        self.device.config_session = 'napalm_1'
+        self.device._replace_config = False
+        self.device._last_diff = '+ hostname test'
+        yield ssh
+        self.device._end_session()
+
+    def test_pipelined(self, ssh):
+        self.device.commit_config()
+        assert len(ssh.commands) == 1
+        script = ssh.commands[0]
+        assert script.index('flash:rollback-0') < script.index('/usr/bin/cli /mnt/flash/napalm_1')
+        assert script.endswith('step unlock rm -f /mnt/flash/napalm_1')
+        assert list(self.device.commit_timings) == [
+            'round_trip', 'delete_rollback', 'backup', 'apply', 'save', 'unlock']
+        assert self.device.commit_timings['apply'] == 0.25
+        assert self.device.config_session is None
+
+    def test_pipelined_no_diff(self, ssh):
+        self.device._last_diff = ''
+        self.device.commit_config()
+        assert 'apply' not in ssh.commands[0]
+        assert 'apply' not in self.device.commit_timings
+
+    def test_pipelined_failed_apply(self, ssh):
+        ssh.failing = 'apply'
+        with pytest.raises(CommandErrorException):
+            self.device.commit_config()
+        assert list(self.device.commit_timings) == [
+            'round_trip', 'delete_rollback', 'backup', 'apply']
+        assert ssh.commands[1:] == ['copy flash:rollback-0 running-config',
+                                    'copy running-config startup-config',
+                                    'bash rm -f /mnt/flash/napalm_1']
+        assert self.device.config_session is None
+
+    def test_pipelined_failed_backup(self, ssh):
+        ssh.failing = 'backup'
+        with pytest.raises(CommandErrorException):
+            self.device.commit_config()
+        # Nothing was applied, and the checkpoint may not be there to restore
+        assert ssh.commands[1:] == ['bash rm -f /mnt/flash/napalm_1']
+        assert self.device.config_session is None
+
+    def test_merge_reuses_diff(self, ssh, monkeypatch):
+        monkeypatch.setattr(self.device, 'commit_pipeline', False)
+        self.device.commit_config()
+        assert ssh.commands == ['delete flash:rollback-0',
+                                'copy running-config flash:rollback-0',
+                                'bash /usr/bin/cli /mnt/flash/napalm_1',
+                                'copy running-config startup-config',
+                                'bash rm -f /mnt/flash/napalm_1']
+
+    def test_replace_compares_again(self, ssh, monkeypatch):
+        monkeypatch.setattr(self.device, 'commit_pipeline', False)
+        self.device._replace_config = True
+        self.device.commit_config()
+        # The running config may have changed since, the empty diff skips the apply
+        assert ssh.commands[0] == 'diff running-config flash:napalm_1'
+        assert 'compare' in self.device.commit_timings
+        assert not [command for command in ssh.commands if 'flash:napalm_1 ' in command]
+
+    def test_local_merge_preview_never_skips_apply(self, ssh, monkeypatch):
+        monkeypatch.setattr(self.device, 'commit_pipeline', False)
+        monkeypatch.setattr(self.device, 'local_diff', True)
+        # An empty preview may still change the config, e.g. through a line it misjudged
+        self.device._last_diff = ''
+        self.device.commit_config()
+        assert 'bash /usr/bin/cli /mnt/flash/napalm_1' in ssh.commands
+        assert 'compare' not in self.device.commit_timings
@@ -0,0 +1,84 @@
+"""Tests for the local compare_config."""
+
+import pytest
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestLocalCompareConfig(object):
+    """Test compare_config with optional_args['local_diff']."""
+
+    @pytest.fixture(autouse=True)
+    def candidate(self, monkeypatch):
+        self.device.device.current_test = 'test_compare_config'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, 'local_diff', True)
+        monkeypatch.setattr(self.device, '_config_snapshots', {})
+
+    def _load(self, monkeypatch, config, replace):
+        monkeypatch.setattr(self.device, '_candidate_config', config)
+        monkeypatch.setattr(self.device, '_replace_config', replace)
+
+    def test_merge_preview(self, monkeypatch):
+        self._load(monkeypatch, "\n".join([
+            "configure",
+            "hostname test",
+            "no ntp server 192.0.1.100",
+            "no ntp server 192.0.1.200",
+            "interface et1",
+            "    source et2",
+            "    description uplink",
+            "interface et9",
+            "    source et1",
+        ]), replace=False)
+        assert self.device.compare_config() == "\n".join([
+            "- ntp server 192.0.1.100",
+            "interface et1",
+            "  + description uplink",
+            "+ interface et9",
+            "  + source et1",
+        ])
+
+    def test_merge_preview_no_prefix(self, monkeypatch):
+        self._load(monkeypatch, "\n".join([
+            "configure",
+            "interface ma1",
+            "    no ip address",
+            "    no ip default",
+        ]), replace=False)
+        # 'no X' removes the lines starting with the word(s) X only
+        assert self.device.compare_config() == "\n".join([
+            "interface ma1",
+            "  - ip address 192.0.2.201 255.255.255.0",
+        ])
+
+    def test_replace_diff(self, monkeypatch):
+        running = self.device.device.run_commands(['show running-config'],
+                                                  encoding='text')[0]['output']
+        candidate = running.replace("ntp server 192.0.1.101\n", "")
+        self._load(monkeypatch, "configure\n" + candidate, replace=True)
+        diff = self.device.compare_config().splitlines()
+        assert diff[:2] == ['--- running-config', '+++ candidate']
+        assert [line for line in diff if line[0] in '+-'][2:] == ['-ntp server 192.0.1.101']
+
+    def test_replace_diff_ignores_header(self, monkeypatch):
+        running = self.device.device.run_commands(['show running-config'],
+                                                  encoding='text')[0]['output']
+        # Saved from the device at another time, or written by hand without a header
+        saved = running.replace("! time: Fri 02 Jun 2017 00:15:54", "! time: Sat 03 Jun 2017")
+        self._load(monkeypatch, saved, replace=True)
+        assert self.device.compare_config() == ''
+        self._load(monkeypatch, running.split("!\n\n", 1)[1], replace=True)
+        assert self.device.compare_config() == ''
+
+    def test_no_candidate(self, monkeypatch, run_commands_calls):
+        self._load(monkeypatch, None, replace=False)
+        assert self.device.compare_config() == ''
+        assert run_commands_calls == []
+
+    def test_snapshot_is_reused(self, monkeypatch, run_commands_calls):
+        self._load(monkeypatch, "configure\nhostname other", replace=False)
+        assert self.device.compare_config() == "+ hostname other"
+        assert self.device.compare_config() == "+ hostname other"
+        assert len(run_commands_calls) == 2
+        commands, _ = run_commands_calls[1]
+        assert len(commands) == 1 and 'md5sum' in commands[0]
@@ -0,0 +1,88 @@
+"""Tests for the CPU and memory part of get_environment."""
+
+import pyeapi
+import pytest
+
+from napalm_mos import mos
+
+STAT = """\
+cpu  {0} 0 {1} {2} 0 0 0 0 0 0
+cpu0 {0} 0 {1} {2} 0 0 0 0 0 0
+MemTotal:        1000 kB
+MemFree:          100 kB
+Buffers:          100 kB
+Cached:           200 kB
+"""
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestEnvironment(object):
+    """Test CPU usage and memory read from /proc."""
+
+    def test_cpu_usage_is_incremental(self):
+        self.device._cpu_times = {}
+        cpu, memory = self.device._parse_proc(STAT.format(300, 100, 600))
+        assert cpu == {0: {'%usage': 40.0}}
+        # MemAvailable missing, free + buffers + cached are available
+        assert memory == {'available_ram': 1000, 'used_ram': 600}
+
+        # 100 jiffies later, 90 of them idle
+        cpu, _ = self.device._parse_proc(STAT.format(305, 105, 690))
+        assert cpu == {0: {'%usage': 10.0}}
+
+        # Same sample again, e.g. from the response cache: keep the last usage
+        cpu, _ = self.device._parse_proc(STAT.format(305, 105, 690))
+        assert cpu == {0: {'%usage': 10.0}}
+
+    def test_counters_reset(self):
+        self.device._cpu_times = {0: (100000, 90000, 10.0)}
+        cpu, _ = self.device._parse_proc(STAT.format(50, 50, 400))
+        assert cpu == {0: {'%usage': 20.0}}
+
+    def test_single_call(self, run_commands_calls):
+        self.device.device.current_test = 'test_get_environment'
+        self.device.device.current_test_case = 'normal'
+        self.device.get_environment()
+        assert run_commands_calls == [
+            (['show environment all'], 'json'), ([mos._PROC_COMMAND], 'text')]
+
+    def test_bash_not_allowed(self, monkeypatch, run_commands_calls):
+        self.device.device.current_test = 'test_get_environment'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, '_bash_refused', False)
+        run_commands = self.device.device.run_commands
+
+        def no_bash(commands, encoding='json', **kwargs):
+            if mos._PROC_COMMAND in commands:
+                raise pyeapi.eapilib.CommandError(1002, 'invalid command')
+            return run_commands(commands, encoding, **kwargs)
+
+        monkeypatch.setattr(self.device.device, 'run_commands', no_bash)
+        environment = self.device.get_environment()
+        assert environment['cpu'] == {0: {'%usage': -1.0}}
+        assert environment['memory'] == {'available_ram': -1, 'used_ram': -1}
+        assert environment['fans']
+
+        # Refused once, the bash command isn't sent anymore, on its own or by get_many
+        del run_commands_calls[:]
+        assert self.device.get_environment() == environment
+        assert self.device.get_many(['environment'])['environment'] == environment
+        assert run_commands_calls == [(['show environment all'], 'json')] * 2
+
+    def test_other_error_keeps_bash(self, monkeypatch):
+        self.device.device.current_test = 'test_get_environment'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, '_bash_refused', False)
+        run_commands = self.device.device.run_commands
+        failures = []
+
+        def fail_once(commands, encoding='json', **kwargs):
+            if not failures and 'show environment all' in commands:
+                failures.append(commands)
+                raise pyeapi.eapilib.CommandError(1000, 'could not run command')
+            return run_commands(commands, encoding, **kwargs)
+
+        monkeypatch.setattr(self.device.device, 'run_commands', fail_once)
+        environment = self.device.get_environment()
+        assert environment['memory']['used_ram'] != -1
+        assert not self.device._bash_refused
@@ -0,0 +1,93 @@
+"""Tests for the columnar export."""
+
+import json
+
+import pytest
+
+from napalm_mos.export import MISSING_COUNTER, Table, load_strings, open_column
+
+
+@pytest.fixture
+def counters(request):
+    path = request.fspath.dirpath('mocked_data', 'test_get_interfaces_counters', 'normal',
+                                  'expected_result.json')
+    return json.loads(path.read())
+
+
+@pytest.fixture
+def interfaces(request):
+    path = request.fspath.dirpath('mocked_data', 'test_get_interfaces', 'normal',
+                                  'expected_result.json')
+    return json.loads(path.read())
+
+
+def test_columns(counters):
+    table = Table('interfaces_counters')
+    table.add('mm1', counters)
+    table.add('mm2', counters)
+    assert len(table) == 2 * len(counters)
+    assert table.columns['tx_octets'].itemsize == 8
+    assert table.strings('device') == ['mm1'] * len(counters) + ['mm2'] * len(counters)
+    assert table.strings('interface')[:len(counters)] == list(counters)
+    assert list(table.columns['tx_octets'])[:len(counters)] == [
+        values['tx_octets'] for values in counters.values()]
+    # Keys are interned once
+    assert len(table.pool) == 2 + len(counters)
+
+
+def test_large_and_missing_counters(tmpdir, counters):
+    values = dict(counters['et1'], tx_octets=2 ** 64 - 2, rx_octets=2 ** 63 + 1)
+    table = Table('interfaces_counters')
+    table.add('mm1', {'et1': values})
+    table.append_to(str(tmpdir))
+    assert list(open_column(str(tmpdir), 'tx_octets')) == [2 ** 64 - 2]
+    assert list(open_column(str(tmpdir), 'rx_octets')) == [2 ** 63 + 1]
+    # Metamako has no discard counters
+    assert list(open_column(str(tmpdir), 'tx_discards')) == [MISSING_COUNTER]
+
+
+def test_interfaces(interfaces):
+    table = Table('interfaces')
+    table.add('mm1', interfaces)
+    assert list(table.columns['is_up']) == [v['is_up'] for v in interfaces.values()]
+    assert table.strings('description') == [v['description'] for v in interfaces.values()]
+    assert list(table.columns['speed']) == [v['speed'] for v in interfaces.values()]
+
+
+def test_unknown_getter():
+    with pytest.raises(ValueError):
+        Table('facts')
+
+
+def test_append_to(tmpdir, counters):
+    directory = str(tmpdir.join('counters'))
+    table = Table.open(directory, 'interfaces_counters')
+    table.add('mm1', counters)
+    table.append_to(directory)
+    assert len(table) == 0
+
+    # Another process appending later reuses the codes already written
+    table = Table.open(directory, 'interfaces_counters')
+    table.add('mm2', counters)
+    table.add('mm1', counters)
+    table.append_to(directory)
+
+    strings = load_strings(directory)
+    assert strings == ['mm1'] + list(counters) + ['mm2']
+    devices = open_column(directory, 'device')
+    assert [strings[code] for code in devices] == (
+        ['mm1'] * len(counters) + ['mm2'] * len(counters) + ['mm1'] * len(counters))
+    rx_octets = open_column(directory, 'rx_octets')
+    assert sum(rx_octets) == 3 * sum(values['rx_octets'] for values in counters.values())
+
+
+def test_append_to_other_schema(tmpdir, counters, interfaces):
+    directory = str(tmpdir)
+    table = Table.open(directory, 'interfaces_counters')
+    table.add('mm1', counters)
+    table.append_to(directory)
+
+    table = Table.open(directory, 'interfaces')
+    table.add('mm1', interfaces)
+    with pytest.raises(ValueError):
+        table.append_to(directory)
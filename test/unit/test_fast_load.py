@@ -0,0 +1,124 @@
+"""Tests for loading candidates with optional_args['fast_load']."""
+
+import hashlib
+import os
+import sys
+import time
+
+import pytest
+
+from napalm.base.exceptions import SessionLockedException
+
+from napalm_mos import file_copy
+
+from conftest import FakeSCPClient, FakeSSH, LocalSSH
+
+
+class Md5SSH(FakeSSH):
+    """FakeSSH answering md5sum from what FakeSCPClient was given."""
+
+    def answer(self, command):
+        if command.startswith('bash /usr/bin/md5sum '):
+            path = command.split()[-1]
+            return '{}  {}\n'.format(hashlib.md5(FakeSCPClient.files[path]).hexdigest(), path)
+        return self.output
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestFastLoad(object):
+    """Test the fast candidate load path."""
+
+    @pytest.fixture(autouse=True)
+    def ssh(self, monkeypatch, scp):
+        ssh = Md5SSH()
+        monkeypatch.setattr(self.device, 'fast_load', True)
+        monkeypatch.setattr(self.device, '_ssh', ssh)
+        scp.files = {}
+        yield ssh
+        self.device._end_session()
+
+    def test_three_round_trips(self, ssh, monkeypatch):
+        monkeypatch.setattr(self.device.device, 'run_commands', None)
+        self.device.load_merge_candidate(config=['hostname test', 'ntp server 192.0.2.1'])
+        assert self.device.load_round_trips == 3
+        path = '/mnt/flash/{}'.format(self.device.config_session)
+        assert len(ssh.commands) == 2 and 'd=/mnt/flash/napalm_lock;' in ssh.commands[0]
+        assert ssh.commands[1] == 'bash /usr/bin/md5sum {}'.format(path)
+
+        assert FakeSCPClient.files == {path: b'configure\nhostname test\nntp server 192.0.2.1\n'}
+        assert self.device._candidate_config == 'configure\nhostname test\nntp server 192.0.2.1\n'
+
+    def test_reload_keeps_lock(self, ssh):
+        self.device.load_replace_candidate(config='hostname test')
+        session = self.device.config_session
+        self.device.load_replace_candidate(config='hostname other')
+        assert self.device.load_round_trips == 2
+        assert self.device.config_session == session
+        assert len(ssh.commands) == 3
+
+    def test_locked(self, ssh):
+        ssh.output = 'napalm_locked\n'
+        with pytest.raises(SessionLockedException):
+            self.device.load_merge_candidate(config='hostname test')
+        assert self.device.config_session is None
+        assert FakeSCPClient.files == {}
+
+    def test_discard_removes_lock(self, ssh):
+        self.device.load_merge_candidate(config='hostname test')
+        session = self.device.config_session
+        self.device.discard_config()
+        assert ssh.commands[-1] == 'bash rm -rf /mnt/flash/{} /mnt/flash/napalm_lock'.format(
+            session)
+        assert self.device.config_session is None
+
+    def test_corrupt_transfer(self, ssh):
+        FakeSCPClient.corrupt = True
+        with pytest.raises(file_copy.FileTransferError):
+            self.device.load_merge_candidate(config='hostname test')
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='runs the device commands with the local shell')
+@pytest.mark.usefixtures("set_device_parameters")
+class TestFastLock(object):
+    """Test the lock command, run with the local shell on a temporary directory."""
+
+    @pytest.fixture(autouse=True)
+    def flash(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(self.device, '_ssh', LocalSSH())
+        monkeypatch.setattr(self.device, '_LOCK_DIR', str(tmpdir.join('napalm_lock')))
+        yield tmpdir
+        self.device._end_session()
+
+    def _hold(self, flash, age):
+        flash.join('napalm_1').write('configure\n')
+        flash.join('napalm_lock', 'owner').write('napalm_1 other@host:1 {}\n'.format(
+            int(time.time() - age)), ensure=True)
+
+    def test_owner(self, flash):
+        self.device._lock_fast()
+        session, owner, taken = flash.join('napalm_lock', 'owner').read().split()
+        assert session == self.device.config_session
+        assert owner.startswith('{}@'.format(self.device.username))
+        assert abs(int(taken) - time.time()) < 5
+
+    def test_held(self, flash):
+        self._hold(flash, age=60)
+        with pytest.raises(SessionLockedException) as e:
+            self.device._lock_fast()
+        assert 'other@host:1' in str(e.value)
+        assert flash.join('napalm_1').check()
+
+    def test_stale_taken_over(self, flash, monkeypatch):
+        self._hold(flash, age=60)
+        monkeypatch.setattr(self.device, 'lock_timeout', 30)
+        self.device._lock_fast()
+        assert flash.join('napalm_lock', 'owner').read().split()[0] == (
+            self.device.config_session)
+        assert sorted(os.listdir(str(flash))) == ['napalm_lock']
+
+    def test_regular_session(self, flash):
+        flash.join('napalm_2').write('configure\n')
+        with pytest.raises(SessionLockedException):
+            self.device._lock_fast()
+        assert sorted(os.listdir(str(flash))) == ['napalm_2']
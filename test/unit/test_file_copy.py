@@ -0,0 +1,250 @@
+"""Tests for FileCopy, using the local shell in place of the device."""
+
+import os
+import sys
+import threading
+import time
+
+import netmiko
+import pytest
+
+from napalm_mos import file_copy, mos
+from napalm_mos.file_copy import FileCopy
+from napalm_mos.metrics import Metrics
+
+from conftest import FakeSCPClient, LocalSSH
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'),
+                                reason='runs the device commands with the local shell')
+
+
+class FakeDriver(object):
+
+    def __init__(self):
+        self.ssh = LocalSSH()
+        self.metrics = Metrics()
+        self._ssh_lock = threading.RLock()
+
+    def _get_ssh(self):
+        return self.ssh
+
+
+@pytest.fixture
+def driver(scp):
+    return FakeDriver()
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_put_skips_identical_file(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    _write(source, b'config')
+    FileCopy(driver, source, dest).put_file()
+    assert FakeSCPClient.sent == [6]
+    assert len(driver.ssh.commands) == 2
+
+    driver.ssh.commands = []
+    FileCopy(driver, source, dest).put_file()
+    assert FakeSCPClient.sent == [6]
+    assert len(driver.ssh.commands) == 1
+
+    metrics = driver.metrics.snapshot()
+    assert [(s['name'], s['count'], s['bytes']) for s in metrics['scp']] == [('put', 1, 6)]
+    assert sum(s['count'] for s in metrics['ssh']) == 3
+
+
+def test_delta_put(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    old = b''.join(bytes(bytearray([i])) * 16 for i in range(8))
+    _write(dest, old)
+    new = old[:16] + b'x' * 16 + old[32:112]
+    _write(source, new)
+
+    FileCopy(driver, source, dest, delta=True, block_size=16).put_file()
+    with open(dest, 'rb') as f:
+        assert f.read() == new
+    assert FakeSCPClient.sent == [16]
+    assert not os.path.exists(dest + '.napalm_delta')
+
+
+def test_chunked_put_resumes(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    data = os.urandom(100)
+    _write(source, data)
+    # An earlier, interrupted transfer left a good first chunk and a truncated second one
+    _write(dest + '.part00000', data[:32])
+    _write(dest + '.part00001', data[32:40])
+
+    progress = []
+    FileCopy(driver, source, dest).put_file_chunked(
+        chunk_size=32, progress=lambda *args: progress.append(args))
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert FakeSCPClient.sent == [32, 32, 4]
+    assert not tmpdir.listdir(lambda p: '.part' in p.basename)
+    assert progress[0][:2] == (32, 100)
+    assert progress[-1][:2] == (100, 100)
+    assert progress[-1][3] == 0
+
+
+def test_chunked_put_removes_stale_parts(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    data = os.urandom(100)
+    _write(source, data)
+    # Left by an interrupted transfer with a smaller chunk size
+    _write(dest + '.part00004', b'stale')
+    _write(dest + '.part00011', b'stale')
+
+    FileCopy(driver, source, dest).put_file_chunked(chunk_size=32)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert not tmpdir.listdir(lambda p: '.part' in p.basename)
+
+
+def test_chunked_put_space_for_parts_and_file(driver, tmpdir, monkeypatch):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    _write(source, os.urandom(100))
+    monkeypatch.setattr(FileCopy, '_remote_status', lambda self: (None, 150))
+    with pytest.raises(file_copy.FileTransferError):
+        FileCopy(driver, source, dest).put_file_chunked(chunk_size=32)
+    assert FakeSCPClient.sent == []
+
+
+def test_chunked_get_space_for_parts_and_file(driver, tmpdir, monkeypatch):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    _write(source, os.urandom(100))
+    monkeypatch.setattr(FileCopy, '_local_space_available', lambda self: 150)
+    with pytest.raises(file_copy.FileTransferError):
+        FileCopy(driver, source, dest, direction='get').get_file_chunked(chunk_size=32)
+    assert FakeSCPClient.sent == []
+
+
+def test_chunked_get_resumes(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    data = os.urandom(100)
+    _write(source, data)
+    _write(dest + '.part00002', data[64:96])
+
+    FileCopy(driver, source, dest, direction='get').get_file_chunked(chunk_size=32)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert FakeSCPClient.sent == [32, 32, 4]
+    assert not tmpdir.listdir(lambda p: '.part' in p.basename)
+    # The chunk reads are recorded under one name, whatever the chunk
+    ssh = {series['name']: series['count'] for series in driver.metrics.snapshot()['ssh']}
+    assert ssh['bash <chunk read>'] == 3
+
+
+def test_put_missing_source(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    # Both missing, their md5s must not be taken as equal
+    with pytest.raises(file_copy.FileTransferError):
+        FileCopy(driver, source, dest).put_file()
+    with pytest.raises(file_copy.FileTransferError):
+        FileCopy(driver, source, dest).put_file_chunked()
+    assert FakeSCPClient.sent == []
+
+
+def test_get_missing_remote_file(driver, tmpdir):
+    source, dest = str(tmpdir.join('source')), str(tmpdir.join('dest'))
+    with pytest.raises(file_copy.FileTransferError):
+        FileCopy(driver, source, dest, direction='get').get_file()
+    with pytest.raises(file_copy.FileTransferError):
+        FileCopy(driver, source, dest, direction='get').get_file_chunked()
+    assert not os.path.exists(dest)
+
+
+class PooledSSH(LocalSSH):
+    """Stand-in for a netmiko connection opened by the FileCopy pool."""
+
+    def __init__(self, **kwargs):
+        LocalSSH.__init__(self)
+        self.active = True
+        self.disconnected = False
+        self.busy = self.max_busy = 0
+        transport = self
+        self.remote_conn = type(str('remote_conn'), (object,),
+                                {'get_transport': staticmethod(lambda: transport)})
+
+    def is_active(self):
+        return self.active
+
+    def enable(self):
+        pass
+
+    def disconnect(self):
+        self.disconnected = True
+
+    def send_command(self, command):
+        self.busy += 1
+        self.max_busy = max(self.busy, self.max_busy)
+        time.sleep(0.01)
+        self.busy -= 1
+        return ''
+
+
+class PoolDriver(object):
+    """Driver without an SSH session of its own."""
+
+    hostname = 'mm1'
+    username = 'admin'
+    password = 'admin'
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    logins = []
+
+    def connect(**kwargs):
+        logins.append(PooledSSH(**kwargs))
+        return logins[-1]
+
+    monkeypatch.setattr(netmiko, 'ConnectHandler', connect)
+    yield logins
+    file_copy.close_connections()
+
+
+def test_pool_shares_login(logins):
+    first = FileCopy(PoolDriver(), 'source', 'dest')
+    second = FileCopy(PoolDriver(), 'source', 'dest')
+    assert len(logins) == 1
+    assert first._ssh is second._ssh and first._ssh_lock is second._ssh_lock
+
+
+def test_pool_replaces_dead_connection(logins):
+    FileCopy(PoolDriver(), 'source', 'dest')
+    logins[0].active = False
+    assert FileCopy(PoolDriver(), 'source', 'dest')._ssh is not logins[0]
+    assert len(logins) == 2
+
+    file_copy.close_connections()
+    assert logins[1].disconnected
+    FileCopy(PoolDriver(), 'source', 'dest')
+    assert len(logins) == 3
+
+
+def test_pooled_shell_is_serialized(logins):
+    copies = [FileCopy(PoolDriver(), 'source', 'dest') for _ in range(4)]
+    threads = [threading.Thread(target=c._send_command, args=('bash true',)) for c in copies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert logins[0].max_busy == 1
+
+
+def test_borrowed_shell_is_serialized():
+    driver = mos.MOSDriver('mm1', 'admin', 'admin')
+    driver._ssh = PooledSSH()
+    copies = [FileCopy(driver, 'source', 'dest') for _ in range(2)]
+    assert all(c._ssh_lock is driver._ssh_lock for c in copies)
+    senders = [c._send_command for c in copies] + [driver._send_command] * 2
+    threads = [threading.Thread(target=send, args=('bash true',)) for send in senders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert driver._ssh.max_busy == 1
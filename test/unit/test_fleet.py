@@ -0,0 +1,84 @@
+"""Tests for fleet collection."""
+
+import threading
+import time
+
+from napalm_mos.fleet import collect, run_bounded, DeadlineExceeded
+from napalm_mos.mos import MOSDriver
+
+
+class SlowDriver(object):
+    """Driver double taking as many seconds to open as its hostname says."""
+
+    _GETTER_COMMANDS = MOSDriver._GETTER_COMMANDS
+
+    def __init__(self, hostname, username, password, timeout=60, optional_args=None):
+        self.hostname = hostname
+        self.optional_args = optional_args
+
+    def open(self):
+        if self.hostname == 'unreachable':
+            raise IOError('no route to host')
+        time.sleep(float(self.hostname))
+
+    closed = []
+
+    def close(self):
+        self.closed.append(self.hostname)
+
+    def get_many(self, getters):
+        return {getter: self.optional_args for getter in getters}
+
+    def get_bgp_neighbors(self):
+        raise NotImplementedError('no BGP')
+
+
+def test_run_bounded_streams_results():
+    finished = [item for item, _, _, _ in run_bounded(time.sleep, [0.2, 0.0, 0.1],
+                                                      max_workers=3)]
+    assert finished == [0.0, 0.1, 0.2]
+
+
+def test_run_bounded_deadline():
+    results = {item: error for item, _, error, _ in run_bounded(time.sleep, [0, 5],
+                                                                deadline=0.5)}
+    assert results[0] is None
+    assert isinstance(results[5], DeadlineExceeded)
+
+
+def test_collect():
+    inventory = ['0', 'unreachable', '0.05']
+    getters = ['facts', 'interfaces', 'bgp_neighbors']
+    results = {r.hostname: r for r in collect(inventory, getters, max_workers=2,
+                                              driver_class=SlowDriver)}
+    assert sorted(results) == ['0', '0.05', 'unreachable']
+    assert results['0'].results == {'facts': {'lazy_ssh': True}, 'interfaces': {'lazy_ssh': True}}
+    assert 'NotImplementedError' in results['0'].errors['bgp_neighbors']
+    assert set(results['0.05'].timings) == {'open', 'get_many', 'bgp_neighbors', 'close'}
+    assert results['0.05'].timings['open'] >= 0.05
+    assert list(results['unreachable'].errors) == ['open']
+
+
+def test_run_bounded_abandoned_worker_exits():
+    threads = {}
+    abandoned = []
+
+    def work(seconds):
+        threads[seconds] = threads.get(seconds, []) + [threading.current_thread()]
+        time.sleep(seconds)
+
+    results = list(run_bounded(work, [1.6, 0.3, 0.4, 0.5, 0.6, 0.7], max_workers=1,
+                               deadline=0.5, on_abandon=abandoned.append))
+    assert len(results) == 6
+    assert abandoned == [1.6]
+    # The abandoned thread doesn't pick up more work once its call returned
+    slow = threads[1.6][0]
+    assert all(slow not in threads[seconds] for seconds in (0.3, 0.4, 0.5, 0.6, 0.7))
+
+
+def test_collect_closes_abandoned_driver(monkeypatch):
+    monkeypatch.setattr(SlowDriver, 'closed', [])
+    results = list(collect(['1.5'], ['facts'], deadline=0.5, driver_class=SlowDriver))
+    assert list(results[0].errors) == ['deadline']
+    time.sleep(0.1)
+    assert SlowDriver.closed == ['1.5']
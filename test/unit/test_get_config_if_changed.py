@@ -0,0 +1,58 @@
+"""Tests for get_config_if_changed."""
+
+import pytest
+
+RUNNING_DIGEST = 'd41d8cd98f00b204e9800998ecf8427e'
+STARTUP_DIGEST = '9e107d9d372bb6826bd81d3542a419d6'
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestGetConfigIfChanged(object):
+    """Test the conditional get_config."""
+
+    @pytest.fixture(autouse=True)
+    def mocked_data(self, monkeypatch):
+        self.device.device.current_test = 'test_get_config_if_changed'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, '_config_snapshots', {})
+
+    @pytest.fixture
+    def calls(self, run_commands_calls):
+        return run_commands_calls
+
+    def test_first_call_fetches(self, calls):
+        config = self.device.get_config_if_changed()
+        assert config['digests'] == {'running': RUNNING_DIGEST, 'startup': STARTUP_DIGEST}
+        assert config['running'].startswith('! command: show running-config')
+        assert config['startup'].startswith('! device: test')
+        assert config['candidate'] == ''
+        assert len(calls) == 2
+
+    def test_not_modified(self, calls):
+        self.device.get_config_if_changed()
+        del calls[:]
+        config = self.device.get_config_if_changed()
+        assert config['running'] is None and config['startup'] is None
+        assert len(calls) == 1 and all('md5sum' in command for command in calls[0][0])
+
+    def test_caller_digests(self, calls):
+        config = self.device.get_config_if_changed(
+            retrieve='running', digests={'running': RUNNING_DIGEST})
+        assert config == {'startup': '', 'running': None, 'candidate': '',
+                          'digests': {'running': RUNNING_DIGEST}}
+        assert len(calls) == 1
+
+    def test_only_changed_config_is_fetched(self, calls):
+        digests = self.device.get_config_if_changed()['digests']
+        self.device.device.current_test_case = 'changed'
+        del calls[:]
+        config = self.device.get_config_if_changed(digests=digests)
+        assert config['startup'] is None
+        assert config['running'].endswith('hostname changed\n')
+        assert config['digests']['running'] != digests['running']
+        assert calls[1] == ([self.device._CONFIG_DIGEST_COMMAND.format('running'),
+                             'show running-config'], 'text')
+
+    def test_wrong_filter(self):
+        with pytest.raises(ValueError):
+            self.device.get_config_if_changed(retrieve='candidate')
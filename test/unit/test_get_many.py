@@ -0,0 +1,38 @@
+"""Tests for get_many."""
+
+import pytest
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestGetMany(object):
+    """Test the cross-getter command batching."""
+
+    def _use_mocked_data(self, test, test_case='normal'):
+        self.device.device.current_test = test
+        self.device.device.current_test_case = test_case
+
+    @pytest.mark.parametrize('getter', [
+        'facts', 'interfaces', 'interfaces_counters', 'lldp_neighbors', 'environment',
+        'lldp_neighbors_detail', 'arp_table', 'ntp_servers', 'ntp_stats', 'snmp_information',
+        'optics', 'config',
+    ])
+    def test_get_many_matches_getter(self, getter):
+        self._use_mocked_data('test_get_{}'.format(getter))
+        result = self.device.get_many([getter])
+        assert result == {getter: getattr(self.device, 'get_{}'.format(getter))()}
+
+    def test_get_many_batches_commands(self, run_commands_calls):
+        self._use_mocked_data('test_get_many')
+        getters = ['facts', 'interfaces', 'interfaces_counters']
+        expected = {getter: getattr(self.device, 'get_{}'.format(getter))() for getter in getters}
+        calls = run_commands_calls
+        del calls[:]
+
+        assert self.device.get_many(getters) == expected
+        assert len(calls) == 2
+        json_commands = [c for c, e in calls if e == 'json'][0]
+        assert json_commands.count('show interfaces status') == 1
+
+    def test_get_many_unsupported_getter(self):
+        with pytest.raises(ValueError):
+            self.device.get_many(['facts', 'bgp_neighbors'])
@@ -0,0 +1,28 @@
+"""Test importing napalm_mos leaves the SSH/SCP stack and other heavy modules alone."""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+DEFERRED = ('netmiko', 'paramiko', 'scp', 'distutils', 'tempfile', 'napalm.base.helpers',
+            'pkg_resources')
+
+# Whatever napalm.base imports itself can't be avoided, only look at what napalm_mos adds
+NEW_MODULES = '''
+import json, sys
+import napalm.base
+before = set(sys.modules)
+import napalm_mos
+import napalm_mos.fleet
+print(json.dumps(sorted(set(sys.modules) - before)))
+'''
+
+
+def test_heavy_modules_are_deferred():
+    output = subprocess.check_output([sys.executable, '-c', NEW_MODULES], cwd=ROOT)
+    modules = json.loads(output.decode('utf-8'))
+    assert 'napalm_mos.mos' in modules
+    assert [m for m in modules if m in DEFERRED or m.split('.')[0] in DEFERRED] == []
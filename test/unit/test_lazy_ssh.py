@@ -0,0 +1,69 @@
+"""Tests for optional_args['lazy_ssh']."""
+
+import netmiko
+import pytest
+
+from napalm_mos import mos
+
+from conftest import FakeSSH
+
+
+class FakeNode(object):
+    """Stand-in for pyeapi's EapiNode."""
+
+    def __init__(self, connection, enablepwd=''):
+        self.connection = connection
+
+    def run_commands(self, commands, encoding='json'):
+        return [{'softwareImageVersion': '0.14.1'} for _ in commands]
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    logins = []
+    monkeypatch.setattr(mos, 'EapiNode', FakeNode)
+
+    def connect(**kwargs):
+        logins.append(kwargs['ip'])
+        return FakeSSH()
+
+    monkeypatch.setattr(netmiko, 'ConnectHandler', connect)
+    return logins
+
+
+def _driver(lazy_ssh):
+    return mos.MOSDriver('mm1', 'admin', 'admin', optional_args={'lazy_ssh': lazy_ssh})
+
+
+def test_open_logs_in(logins):
+    driver = _driver(lazy_ssh=False)
+    driver.open()
+    assert logins == ['mm1']
+    assert driver.is_alive() == {'is_alive': True}
+    driver.close()
+    assert driver.is_alive() == {'is_alive': False}
+
+
+def test_lazy_open(logins):
+    driver = _driver(lazy_ssh=True)
+    assert driver.is_alive() == {'is_alive': False}
+    driver.open()
+    assert logins == []
+    # Checking doesn't log in either, NetworkDriver.__del__ calls is_alive
+    assert driver.is_alive() == {'is_alive': True}
+    assert logins == []
+
+    driver.close()
+    assert driver.is_alive() == {'is_alive': False}
+    assert logins == []
+
+
+def test_lazy_login_on_first_ssh_command(logins):
+    driver = _driver(lazy_ssh=True)
+    driver.open()
+    driver._send_command('show running-config')
+    driver._send_command('show startup-config')
+    assert logins == ['mm1']
+    assert driver._ssh.commands == ['show running-config', 'show startup-config']
+    driver.close()
+    assert driver._ssh is None
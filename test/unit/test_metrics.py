@@ -0,0 +1,88 @@
+"""Tests for the driver metrics."""
+
+import inspect
+
+import pytest
+
+from napalm_mos.metrics import Metrics, command_name, instrumented, openmetrics
+
+
+def test_snapshot():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.observe('eapi', 'show version', 0.05, 100)
+    with metrics.getter('get_facts'):
+        metrics.observe('eapi', 'show version', 0.5, 100)
+        metrics.observe('ssh', 'show hostname', 2.0, 10, error=True)
+
+    snapshot = metrics.snapshot()
+    assert [(s['getter'], s['count'], s['buckets']) for s in snapshot['eapi']] == [
+        ('', 1, [(0.1, 1), (1.0, 1)]),
+        ('get_facts', 1, [(0.1, 0), (1.0, 1)]),
+    ]
+    assert snapshot['ssh'][0]['errors'] == 1
+    assert snapshot['ssh'][0]['buckets'] == [(0.1, 0), (1.0, 0)]
+    assert snapshot['getter'][0]['name'] == 'get_facts'
+
+
+def test_openmetrics():
+    metrics = Metrics(buckets=(0.1,))
+    metrics.observe('eapi', 'show "version"', 0.05, 100)
+    text = openmetrics({'mm1': metrics.snapshot()})
+    labels = 'command="show \\"version\\"",device="mm1",getter=""'
+    assert '# TYPE napalm_mos_eapi_seconds histogram' in text
+    assert 'napalm_mos_eapi_seconds_bucket{%s,le="0.1"} 1' % labels in text
+    assert 'napalm_mos_eapi_seconds_bucket{%s,le="+Inf"} 1' % labels in text
+    assert 'napalm_mos_eapi_bytes_total{%s} 100' % labels in text
+    assert text.endswith('# EOF\n')
+
+
+def test_command_names():
+    assert command_name('delete flash:napalm_123456') == 'delete flash:napalm_<session>'
+    assert command_name('bash rm -rf /mnt/flash/napalm_42 /mnt/flash/napalm_lock') == (
+        'bash rm -rf /mnt/flash/napalm_<session> /mnt/flash/napalm_lock')
+    assert command_name('bash step() { ...; }; step backup /usr/bin/cli <(echo copy '
+                        'running-config flash:rollback-0) && step unlock rm -f '
+                        '/mnt/flash/napalm_1') == 'bash <commit pipeline>'
+    assert command_name(chr(0)) == '<keepalive>'
+    assert command_name('bash j=0; for i in 3 7; do dd if=f.napalm_delta of=f bs=1048576 '
+                        'skip=$j seek=$i count=1 conv=notrunc 2>/dev/null; j=$((j + 1)); '
+                        'done; rm -f f.napalm_delta') == 'bash <delta patch>'
+    assert command_name('bash f=/mnt/flash/image.swi; n=$(( ($(stat -c %s $f) + 16 - 1) / 16 )); '
+                        'i=0; while [ $i -lt $n ]; do dd if=$f bs=16 skip=$i count=1 '
+                        '2>/dev/null | md5sum; i=$((i + 1)); done') == 'bash <block md5s>'
+    assert command_name('bash dd if=/mnt/flash/image.swi of=/tmp/image.swi.part bs=16 skip=42 '
+                        'count=1 2>/dev/null') == 'bash <chunk read>'
+    assert command_name('show version') == 'show version'
+
+
+def test_instrumented_keeps_signature():
+
+    class Driver(object):
+        metrics = None
+
+        @instrumented
+        def get_config(self, retrieve='all', full=False):
+            return retrieve, full
+
+    argspec = getattr(inspect, 'getfullargspec', getattr(inspect, 'getargspec', None))
+    spec = argspec(Driver.get_config)
+    assert (spec.args, spec.defaults) == (['self', 'retrieve', 'full'], ('all', False))
+    assert Driver().get_config(full=True) == ('all', True)
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestDriverMetrics(object):
+    """Test the driver records metrics."""
+
+    def test_getter_attribution(self, monkeypatch):
+        self.device.device.current_test = 'test_get_facts'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, 'metrics', Metrics())
+
+        self.device.get_facts()
+        snapshot = self.device.get_metrics()
+        assert [s['name'] for s in snapshot['getter']] == ['get_facts']
+        assert all(s['getter'] == 'get_facts' for s in snapshot['eapi'])
+        assert sum(s['bytes'] for s in snapshot['eapi']) > 0
+        assert 'device="{}"'.format(self.device.hostname) in self.device.get_metrics(
+            openmetrics_format=True)
@@ -0,0 +1,103 @@
+"""Tests for AsyncMOSDriver."""
+
+import asyncio
+
+import pytest
+
+from napalm_mos.cache import ResponseCache
+from napalm_mos.mos_async import AsyncMOSDriver
+
+
+class AsyncFakeClient(object):
+    """Serve the mocked data of a FakeMOSDevice through a coroutine."""
+
+    def __init__(self, device):
+        self.device = device
+
+    async def run_commands(self, commands, encoding='json'):
+        return self.device.run_commands(commands, encoding=encoding)
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestAsyncMOSDriver(object):
+    """Test AsyncMOSDriver shares the parsing of MOSDriver."""
+
+    @pytest.mark.parametrize('getter', [
+        'facts', 'interfaces', 'interfaces_counters', 'lldp_neighbors_detail', 'optics',
+    ])
+    def test_getter_matches_sync_driver(self, getter):
+        driver = self._driver('test_get_{}'.format(getter))
+        result = self._run(getattr(driver, 'get_{}'.format(getter))())
+        many = self._run(driver.get_many([getter]))
+        expected = getattr(self.device, 'get_{}'.format(getter))()
+        assert result == expected
+        assert many == {getter: expected}
+
+    def _run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def _driver(self, test):
+        self.device.device.current_test = test
+        self.device.device.current_test_case = 'normal'
+        driver = AsyncMOSDriver('localhost', 'user', 'password')
+        driver._client = AsyncFakeClient(self.device.device)
+        return driver
+
+    def test_interfaces_rates(self):
+        driver = self._driver('test_get_interfaces_counters')
+        assert self._run(driver.get_interfaces_rates()) == {}
+        rates = self._run(driver.get_interfaces_rates())
+        assert set(rates) == set(self.device.get_interfaces_counters())
+
+    def test_watch_interfaces(self):
+        driver = self._driver('test_watch_interfaces')
+
+        async def watch():
+            polls = []
+            async for _, changes in driver.watch_interfaces(0, count=2):
+                polls.append(changes)
+            return polls
+
+        polls = self._run(watch())
+        assert len(polls) == 1
+        assert set(polls[0]) == set(self.device.get_interfaces())
+
+    def test_watch_interfaces_skips_response_cache(self):
+        driver = self._driver('test_watch_interfaces')
+        driver.response_cache = ResponseCache(ttl=60)
+        self._run(driver.get_interfaces())
+        self.device.device.current_test_case = 'changed'
+
+        async def watch():
+            async for _, changes in driver.watch_interfaces(0, count=1):
+                return changes
+
+        assert self._run(watch())['et1']['description'] == 'uplink'
+
+    def test_config_if_changed(self):
+        driver = self._driver('test_get_config_if_changed')
+        first = self._run(driver.get_config_if_changed())
+        assert first['running'] and first['startup']
+        second = self._run(driver.get_config_if_changed(digests=first['digests']))
+        assert second['running'] is None and second['startup'] is None
+
+    def test_optics_drift(self):
+        driver = self._driver('test_get_optics')
+        self._run(driver.get_optics())
+        assert self._run(driver.get_optics_drift()) == {}
+
+    def test_iter_arp_table(self):
+        driver = self._driver('test_get_arp_table')
+
+        async def entries():
+            found = []
+            async for entry in driver.iter_arp_table():
+                found.append(entry)
+            return found
+
+        found = self._run(entries())
+        assert found and found == self.device.get_arp_table()
@@ -0,0 +1,140 @@
+"""Tests for the staged config rollout."""
+
+import pytest
+
+from napalm_mos.mos import MOSDriver
+from napalm_mos.rollout import plan_waves, rollout
+
+
+class RolloutDriver(object):
+    """Driver double behaving as its hostname says: 'same', 'bad-load' or 'bad-commit'."""
+
+    calls = []
+
+    def __init__(self, hostname, username, password, timeout=60, optional_args=None):
+        self.hostname = hostname
+        self.commit_timings = {}
+
+    def _call(self, name):
+        self.calls.append((self.hostname, name))
+
+    def open(self):
+        self._call('open')
+
+    def close(self):
+        self._call('close')
+
+    def load_merge_candidate(self, filename=None, config=None):
+        self._call('load')
+        if self.hostname.startswith('bad-load'):
+            raise IOError('flash full')
+        self.config = config
+
+    def compare_config(self):
+        return '' if self.hostname.startswith('same') else '+ {}'.format(self.config)
+
+    def discard_config(self):
+        self._call('discard')
+
+    def commit_config(self):
+        self.commit_timings = {'backup': 0.1}
+        if self.hostname.startswith('bad-commit'):
+            raise IOError('apply failed')
+        self._call('commit')
+
+    def rollback(self):
+        self._call('rollback')
+
+
+@pytest.fixture(autouse=True)
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(RolloutDriver, 'calls', calls)
+    return calls
+
+
+def _rollout(inventory, **kwargs):
+    return {r.hostname: r for r in rollout(inventory, config='hostname x',
+                                           driver_class=RolloutDriver, **kwargs)}
+
+
+def test_plan_waves():
+    assert plan_waves(list(range(8)), (1, 2, 3)) == [[0], [1, 2], [3, 4, 5], [6, 7]]
+    with pytest.raises(ValueError):
+        plan_waves([0], (0,))
+
+
+def test_rollout(calls):
+    results = _rollout(['mm1', 'same1', 'mm2'], wave_sizes=(1, 2))
+    assert results['mm1'].status == 'committed'
+    assert results['mm1'].diff == '+ hostname x'
+    assert results['same1'].status == 'unchanged'
+    assert [r.wave for r in results.values()] == [0, 1, 1]
+    assert set(results['mm1'].timings) == {'open', 'load', 'compare', 'commit', 'close'}
+    assert ('same1', 'discard') in calls and ('same1', 'commit') not in calls
+
+
+def test_diffs_only(calls):
+    results = _rollout(['mm1', 'same1'], commit=False)
+    assert results['mm1'].status == 'compared'
+    assert results['same1'].status == 'unchanged'
+    assert not [call for call in calls if call[1] == 'commit']
+
+
+def test_failure_rolls_back_wave(calls):
+    results = _rollout(['mm1', 'mm2', 'bad-load', 'mm3', 'mm4'], wave_sizes=(1, 3))
+    assert results['mm1'].status == 'committed'
+    assert results['bad-load'].status == 'failed'
+    assert 'load' in results['bad-load'].errors
+    assert results['mm2'].status == 'rolled_back'
+    assert results['mm3'].status == 'rolled_back'
+    assert results['mm4'].status == 'skipped'
+    assert ('mm1', 'rollback') not in calls
+    assert ('mm4', 'open') not in calls
+
+
+def test_failure_threshold(calls):
+    results = _rollout(['bad-commit', 'mm1', 'mm2'], wave_sizes=(1,), max_failures=1)
+    assert results['bad-commit'].status == 'failed'
+    # The failed device is rolled back on its own, the others carry on
+    assert ('bad-commit', 'rollback') in calls
+    assert results['mm1'].status == results['mm2'].status == 'committed'
+
+
+def test_per_device_config():
+    results = _rollout([{'hostname': 'mm1', 'config': 'hostname y'}, 'mm2'])
+    assert results['mm1'].diff == '+ hostname y'
+    assert results['mm2'].diff == '+ hostname x'
+
+    with pytest.raises(ValueError):
+        list(rollout(['mm1'], driver_class=RolloutDriver))
+
+
+class ApplyFailingDriver(MOSDriver):
+    """MOSDriver recording its SSH commands, the apply step of its commits failing."""
+
+    sent = []
+
+    def open(self):
+        pass
+
+    def load_merge_candidate(self, filename=None, config=None):
+        self.config_session = 'napalm_1'
+        self._candidate_config = config
+
+    def _send_command(self, command):
+        self.sent.append(command)
+        if command == 'bash /usr/bin/cli /mnt/flash/napalm_1':
+            raise IOError('apply failed')
+        return 'hostname x'
+
+
+def test_failed_commit_not_retried_on_close(monkeypatch):
+    monkeypatch.setattr(ApplyFailingDriver, 'sent', [])
+    result, = rollout(['mm1'], config='hostname x', driver_class=ApplyFailingDriver)
+    assert result.status == 'failed'
+    assert set(result.errors) == {'commit'}
+    assert ApplyFailingDriver.sent.count('bash /usr/bin/cli /mnt/flash/napalm_1') == 1
+    assert ApplyFailingDriver.sent[-3:] == ['copy flash:rollback-0 running-config',
+                                            'copy running-config startup-config',
+                                            'bash rm -f /mnt/flash/napalm_1']
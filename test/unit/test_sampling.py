@@ -0,0 +1,168 @@
+"""Tests for the sample histories."""
+
+import pytest
+
+from napalm_mos.cache import ResponseCache
+from napalm_mos.sampling import CounterSampler, OpticsSampler, RingBuffer
+
+
+def test_ring_buffer():
+    buf = RingBuffer(3, 2)
+    for i in range(5):
+        buf.append(i, [i * 10, -i])
+    assert len(buf) == 3
+    timestamp, values = buf.sample()
+    assert (timestamp, list(values)) == (4, [40, -4])
+    timestamp, values = buf.sample(2)
+    assert (timestamp, list(values)) == (2, [20, -2])
+    assert buf.column(0) == [20, 30, 40]
+    with pytest.raises(IndexError):
+        buf.sample(3)
+
+
+def _counters(octets, packets):
+    counters = {field: packets for field in CounterSampler.FIELDS}
+    counters.update(tx_octets=octets, rx_octets=octets)
+    return {'et1': counters}
+
+
+def test_counter_sampler_rates():
+    sampler = CounterSampler(history=4)
+    sampler.add(_counters(1000, 10), timestamp=100)
+    assert sampler.rates() == {}
+
+    sampler.add(_counters(3000, 30), timestamp=110)
+    rates = sampler.rates()['et1']
+    assert rates['tx_bps'] == 1600
+    assert rates['rx_pps'] == 6
+    assert rates['interval'] == 10
+
+
+def test_counter_sampler_wrap_and_reset():
+    sampler = CounterSampler(history=4, counter_bits=32)
+    sampler.add(_counters(2 ** 32 - 100, 0), timestamp=0)
+    sampler.add(_counters(300, 0), timestamp=1)
+    assert sampler.rates()['et1']['tx_bps'] == 400 * 8
+
+    sampler.add(_counters(50, 0), timestamp=2)
+    assert sampler.rates()['et1']['tx_bps'] == 50 * 8
+    assert sampler.rates(span=2)['et1']['interval'] == 2
+
+
+def test_counter_sampler_large_counters():
+    sampler = CounterSampler(history=4)
+    sampler.add(_counters(2 ** 64 - 1002, 0), timestamp=0)
+    sampler.add(_counters(2 ** 64 - 2, 0), timestamp=1)
+    assert sampler.rates()['et1']['tx_bps'] == 1000 * 8
+
+    # Wrapped through 2 ** 64
+    sampler.add(_counters(998, 0), timestamp=2)
+    assert sampler.rates()['et1']['tx_bps'] == 1000 * 8
+
+
+def test_counter_sampler_forgets_missing_ports():
+    sampler = CounterSampler(history=4)
+    sampler.add(_counters(1000, 10), timestamp=0)
+    sampler.add({}, timestamp=1)
+    sampler.add(_counters(3000, 30), timestamp=2)
+    assert sampler.rates() == {}
+
+
+def test_counter_sampler_missing_counters():
+    sampler = CounterSampler(history=4)
+    for timestamp, octets in ((0, 1000), (1, 2000)):
+        counters = _counters(octets, 10)
+        counters['et1'].update(tx_errors=-1, rx_errors=-1)
+        sampler.add(counters, timestamp=timestamp)
+    rates = sampler.rates()['et1']
+    assert rates['tx_bps'] == 1000 * 8
+    assert rates['tx_errors_ps'] == rates['rx_errors_ps'] == -1.0
+
+
+def test_optics_sampler_window_and_drift():
+    sampler = OpticsSampler(window=3, thresholds={'laser_bias_current': 1.0})
+    for rx in (-2.0, -3.0, -4.0, -8.0):
+        sampler.add('et1', (rx, -1.0, 6.0))
+    sampler.add('et2', (-2.0, -1.0, 6.0))
+    sampler.add('et2', (-2.0, -1.0, 7.5))
+
+    assert sampler.stats('et1')['input_power'] == (-5.0, -8.0, -3.0)
+    assert sampler.stats('et3') == {}
+    assert sampler.drift() == {'et1': {'input_power': -5.0},
+                               'et2': {'laser_bias_current': 1.5}}
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestInterfacesRates(object):
+
+    def test_get_interfaces_rates(self):
+        self.device.device.current_test = 'test_get_interfaces_counters'
+        self.device.device.current_test_case = 'normal'
+        assert self.device.get_interfaces_rates() == {}
+        rates = self.device.get_interfaces_rates()
+        assert set(rates) == set(self.device.get_interfaces_counters())
+        assert rates['et1']['rx_bps'] == 0
+
+    def test_port_without_errors(self, monkeypatch):
+        self.device.device.current_test = 'test_get_interfaces_counters'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, '_counter_sampler', CounterSampler())
+        run_getter = self.device._run_getter
+
+        def no_et1_errors(getter, cache=True):
+            counters, errors = run_getter(getter, cache)
+            errors = {'interfaces': dict(errors['interfaces'])}
+            del errors['interfaces']['et1']
+            return counters, errors
+
+        monkeypatch.setattr(self.device, '_run_getter', no_et1_errors)
+        self.device.get_interfaces_rates()
+        rates = self.device.get_interfaces_rates()['et1']
+        assert rates['tx_errors_ps'] == rates['rx_errors_ps'] == -1.0
+        assert rates['rx_bps'] == 0
+
+    def test_skips_response_cache(self, monkeypatch, run_commands_calls):
+        self.device.device.current_test = 'test_get_interfaces_counters'
+        self.device.device.current_test_case = 'normal'
+        monkeypatch.setattr(self.device, '_counter_sampler', CounterSampler())
+        monkeypatch.setattr(self.device, 'response_cache', ResponseCache(ttl=60))
+        self.device.get_interfaces_counters()
+        del run_commands_calls[:]
+        self.device.get_interfaces_rates()
+        self.device.get_interfaces_rates()
+        assert len(run_commands_calls) == 2
+        assert len(self.device._counter_sampler._ports['et1']) == 2
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestOpticsStats(object):
+
+    @pytest.fixture(autouse=True)
+    def sampler(self, monkeypatch):
+        self.device.device.current_test = 'test_get_optics'
+        self.device.device.current_test_case = 'present'
+        monkeypatch.setattr(self.device, '_optics_sampler', OpticsSampler())
+        monkeypatch.setattr(self.device, '_sampled_optics', None)
+
+    def test_get_optics_stats(self):
+        self.device.get_optics()
+        self.device._optics_sampler.add('et1', (-6.1, -1.95, 6.5))
+        state = self.device.get_optics()['et1']['physical_channels']['channel'][0]['state']
+        assert state['input_power'] == {'instant': -2.1, 'avg': pytest.approx(-10.3 / 3),
+                                        'min': -6.1, 'max': -2.1}
+        assert self.device.get_optics_drift() == {}
+
+    def test_same_output_sampled_once(self, monkeypatch):
+        self.device.get_many(['optics', 'optics'])
+        assert len(self.device._optics_sampler._ports['et1']) == 1
+
+        monkeypatch.setattr(self.device, 'response_cache', ResponseCache())
+        self.device.get_optics()
+        self.device.get_optics()
+        assert len(self.device._optics_sampler._ports['et1']) == 2
+
+    def test_missing_ports_forgotten(self):
+        self.device._optics_sampler.add('et9', (-2.0, -1.0, 6.0))
+        self.device.get_optics()
+        assert self.device._optics_sampler.stats('et9') == {}
+        assert self.device._optics_sampler.stats('et1')
@@ -0,0 +1,102 @@
+"""End to end tests of MOSDriver against simulated devices."""
+
+import json
+import os
+import ssl
+import subprocess
+import time
+
+import pytest
+
+from napalm_mos.fleet import collect
+from napalm_mos.mos import MOSDriver
+from napalm_mos.simulator import DeviceSimulator, MockedData, start_devices
+
+MOCKED_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mocked_data')
+
+
+def _expected(test):
+    with open(os.path.join(MOCKED_DATA, test, 'normal', 'expected_result.json')) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def data():
+    return MockedData(MOCKED_DATA, tests=['test_get_facts'])
+
+
+def _driver(device, **optional_args):
+    optional_args.update(transport='http', port=device.port, lazy_ssh=True)
+    return MOSDriver(device.host, 'admin', 'admin', optional_args=optional_args)
+
+
+def test_getters_over_http(data):
+    with DeviceSimulator(data) as device:
+        driver = _driver(device)
+        driver.open()
+        assert driver.get_facts() == _expected('test_get_facts')
+        # Commands without data fail like unknown commands on a device
+        assert driver.get_arp_table() == []
+        assert driver.is_alive() == {'is_alive': True}
+        driver.close()
+        # open, one json and one text batch for get_facts, get_arp_table
+        assert device.requests == 4
+
+
+def test_fleet_over_http(data):
+    devices = start_devices(data, 4, latency=0.2, jitter=0.05)
+    try:
+        inventory = [{'hostname': d.host, 'optional_args': {'transport': 'http',
+                                                            'port': d.port}}
+                     for d in devices]
+        start = time.time()
+        results = list(collect(inventory, ['facts'], username='admin', password='admin',
+                               max_workers=4))
+        # Devices are polled concurrently: one open and one get_many round trip each
+        assert time.time() - start < 4 * 2 * 0.25
+        assert [r.errors for r in results] == [{}] * 4
+        assert all(r.results['facts'] == _expected('test_get_facts') for r in results)
+    finally:
+        for device in devices:
+            device.stop()
+
+
+def test_keepalive_transport(data):
+    with DeviceSimulator(data) as device:
+        driver = _driver(device)
+        driver.transport = 'http_keepalive'
+        driver.open()
+        driver.get_facts()
+        assert device.connections == 1
+
+        device.drop_connections()
+        assert driver.get_facts() == _expected('test_get_facts')
+        assert (device.requests, device.connections) == (5, 2)
+        driver.close()
+
+
+@pytest.fixture(scope='module')
+def certificate(tmpdir_factory):
+    tmpdir = tmpdir_factory.mktemp('tls')
+    cert, key = str(tmpdir.join('cert.pem')), str(tmpdir.join('key.pem'))
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                                   '-subj', '/CN=localhost', '-days', '1', '-keyout', key,
+                                   '-out', cert], stdout=devnull, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('openssl is needed to make a certificate')
+    return cert, key
+
+
+@pytest.mark.skipif(not hasattr(ssl.SSLSocket, 'session'), reason='needs TLS sessions')
+def test_keepalive_transport_resumes_tls_session(data, certificate):
+    with DeviceSimulator(data, certfile=certificate[0], keyfile=certificate[1]) as device:
+        driver = _driver(device)
+        driver.transport = 'https_keepalive'
+        driver.open()
+        device.drop_connections()
+        driver.get_facts()
+        assert device.connections == 2
+        assert driver.device.connection.transport.sock.session_reused
+        driver.close()
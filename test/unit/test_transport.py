@@ -0,0 +1,87 @@
+"""Tests for the keep-alive eAPI connections."""
+
+import json
+import socket
+
+import pytest
+
+from pyeapi.eapilib import ConnectionError
+
+from napalm_mos.transport import HttpKeepAliveEapiConnection
+
+
+class FakeResponse(object):
+
+    status = 200
+    reason = 'OK'
+
+    def read(self):
+        return b'{"jsonrpc": "2.0", "id": "1", "result": [{}, {}]}'
+
+    @staticmethod
+    def getheader(name, default=None):
+        return default
+
+
+class FakeHTTPConnection(object):
+    """
+    Stand-in for the HTTP connection, holding an idle connection the device dropped.
+
+    The first request fails while it is sent or, with `fail_on='response'`, once sent.
+    """
+
+    def __init__(self, fail_on):
+        self.fail_on = fail_on
+        self.sock = object()
+        self.requests = 0
+
+    def putrequest(self, method, url, skip_accept_encoding=False):
+        self.requests += 1
+
+    def putheader(self, *args):
+        pass
+
+    def endheaders(self, data):
+        if self.fail_on == 'send' and self.sock is not None:
+            raise socket.error('Broken pipe')
+
+    def getresponse(self):
+        if self.fail_on == 'response' and self.sock is not None:
+            raise socket.error('Connection reset by peer')
+        self.sock = object()
+        return FakeResponse()
+
+    def close(self):
+        self.sock = None
+
+
+def _request(*commands):
+    return json.dumps({'jsonrpc': '2.0', 'method': 'runCmds', 'id': '1',
+                       'params': {'version': 1, 'cmds': ['enable'] + list(commands)}})
+
+
+def _connection(fail_on):
+    connection = HttpKeepAliveEapiConnection('mm1')
+    connection.transport = FakeHTTPConnection(fail_on)
+    return connection
+
+
+@pytest.mark.parametrize('fail_on', ['send', 'response'])
+def test_show_commands_are_retried(fail_on):
+    connection = _connection(fail_on)
+    assert connection.send(_request('show version'))['result'] == [{}, {}]
+    assert connection.transport.requests == 2
+
+
+def test_unsent_request_is_retried():
+    connection = _connection('send')
+    connection.send(_request('bash rm -f /mnt/flash/napalm_1'))
+    assert connection.transport.requests == 2
+
+
+def test_sent_request_is_not_retried():
+    connection = _connection('response')
+    # It may have run on the device already
+    with pytest.raises(ConnectionError):
+        connection.send(_request({'cmd': 'copy flash:rollback-0 running-config'}))
+    assert connection.transport.requests == 1
@@ -0,0 +1,52 @@
+"""Tests for watch_interfaces."""
+
+import types
+
+import pytest
+
+from napalm_mos.cache import ResponseCache
+
+
+@pytest.mark.usefixtures("set_device_parameters")
+class TestWatchInterfaces(object):
+    """Test the interface change stream."""
+
+    @pytest.fixture(autouse=True)
+    def mocked_data(self):
+        self.device.device.current_test = 'test_watch_interfaces'
+        self.device.device.current_test_case = 'normal'
+
+    def test_first_poll_reports_every_port(self):
+        watch = self.device.watch_interfaces(interval=0, count=1)
+        assert isinstance(watch, types.GeneratorType)
+        polls = list(watch)
+        assert len(polls) == 1
+        timestamp, changes = polls[0]
+        interfaces = self.device.get_interfaces()
+        assert set(changes) == set(interfaces)
+        assert changes['et2'] == {'is_up': True, 'is_enabled': True, 'speed': 10000,
+                                  'description': ''}
+
+    def test_no_change_no_yield(self):
+        assert len(list(self.device.watch_interfaces(interval=0, count=3))) == 1
+
+    def test_changes(self):
+        watch = self.device.watch_interfaces(interval=0, count=2)
+        first, _ = next(watch)
+        self.device.device.current_test_case = 'changed'
+        timestamp, changes = next(watch)
+        assert timestamp >= first
+        assert changes == {
+            'et1': {'is_up': True, 'is_enabled': True, 'speed': 10000,
+                    'description': 'uplink'},
+            'et2': {'is_up': False, 'is_enabled': True, 'speed': 10000, 'description': ''},
+            'et7': None,
+        }
+        assert list(watch) == []
+
+    def test_skips_response_cache(self, monkeypatch):
+        monkeypatch.setattr(self.device, 'response_cache', ResponseCache(ttl=60))
+        self.device.get_interfaces()
+        self.device.device.current_test_case = 'changed'
+        _, changes = next(self.device.watch_interfaces(interval=0, count=1))
+        assert changes['et1']['description'] == 'uplink'